@@ -5,10 +5,14 @@
 import os
 import json
 import logging
-import httpx
-import asyncio
 from dotenv import load_dotenv
-from typing import Dict, Tuple
+import time
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+
+from utils.runtime_metrics import register_metrics
+from ai.llm_cache import llm_cache
+from ai import llm_gateway
+from ai.providers import llm_router
 
 logger = logging.getLogger(__name__)
 load_dotenv()
@@ -16,18 +20,29 @@ load_dotenv()
 GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
 if not GEMINI_API_KEY:
     logger.error("Ключ GEMINI_API_KEY не найден.")
-GEMINI_API_URL = f"https://generativelanguage.googleapis.com/v1beta/models/gemini-1.5-flash-latest:generateContent?key={GEMINI_API_KEY}"
+GEMINI_MODEL = "gemini-1.5-flash-latest"
+GEMINI_API_URL = f"https://generativelanguage.googleapis.com/v1beta/models/{GEMINI_MODEL}:generateContent?key={GEMINI_API_KEY}"
 
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
 OPENAI_API_URL = "https://api.openai.com/v1/chat/completions"
 OPENAI_MODEL = os.getenv("OPENAI_GPT_MODEL", "gpt-4o-mini")
 
+# two_step — classify_intent и extract_entities по очереди; combined — один
+# запрос с JSON-ответом; ab — combined для DISPATCH_AB_PERCENT% пользователей
+DISPATCH_MODE = os.getenv("DISPATCH_MODE", "two_step").lower()
+DISPATCH_AB_PERCENT = int(os.getenv("DISPATCH_AB_PERCENT", "50"))
+
 # --- Загрузка конфигурации намерений ---
 BASE_DIR = os.path.dirname(os.path.dirname(__file__))
 INTENTS_FILE = os.path.join(BASE_DIR, "config", "intents.json")
 try:
     with open(INTENTS_FILE, "r", encoding="utf-8") as f:
-        INTENT_DESCRIPTIONS: Dict[str, str] = json.load(f)
+        # Помимо описания у намерения могут быть правила локального
+        # классификатора (ai/local_classifier.py) — в промпт идёт только описание
+        INTENT_DESCRIPTIONS: Dict[str, str] = {
+            name: spec.get("description", "") if isinstance(spec, dict) else spec
+            for name, spec in json.load(f).items()
+        }
 except Exception as e:  # pragma: no cover - fallback only on error
     logger.error(f"Не удалось загрузить {INTENTS_FILE}: {e}")
     INTENT_DESCRIPTIONS = {
@@ -88,29 +103,53 @@ EXTRACT_ENTITIES_PROMPT = """
 **Твой ответ (в формате `ключ:значение`):**
 """
 
+def parse_key_values(text: str) -> Dict[str, str]:
+    """Разбирает ответ экстрактора: все пары `ключ:значение`, по одной на строку."""
+    entities: Dict[str, str] = {}
+    for line in text.strip().strip("`").splitlines():
+        line = line.strip().lstrip("-* ").strip()
+        if ":" not in line:
+            continue
+        key, value = line.split(":", 1)
+        key = key.strip().strip("`*")
+        if key and key not in entities:
+            entities[key] = value.strip().strip("`")
+    return entities or {"payload": text.strip()}
+
+
+def _provider_calls(gemini_call, openai_call, prompt: str) -> Dict[str, Callable[[], Awaitable[Any]]]:
+    """Вызовы настроенных провайдеров для ai.providers.llm_router."""
+    calls: Dict[str, Callable[[], Awaitable[Any]]] = {}
+    if GEMINI_API_KEY:
+        calls["gemini"] = lambda: gemini_call(prompt)
+    if OPENAI_API_KEY:
+        calls["openai"] = lambda: openai_call(prompt)
+    return calls
+
+
+@llm_cache.cached("classify", "gemini", GEMINI_MODEL)
 async def _classify_gemini(prompt: str) -> str | None:
     try:
-        async with httpx.AsyncClient(timeout=10.0) as client:
-            headers = {"Content-Type": "application/json"}
-            payload = {"contents": [{"parts": [{"text": prompt}]}], "generationConfig": {"temperature": 0.0, "maxOutputTokens": 32}}
-            response = await client.post(GEMINI_API_URL, json=payload, headers=headers)
-            response.raise_for_status()
-            data = response.json()
-            return data.get("candidates", [{}])[0].get("content", {}).get("parts", [{}])[0].get("text", "").strip() or None
+        headers = {"Content-Type": "application/json"}
+        payload = {"contents": [{"parts": [{"text": prompt}]}], "generationConfig": {"temperature": 0.0, "maxOutputTokens": 32}}
+        response = await llm_gateway.post("gemini", GEMINI_API_URL, json=payload, headers=headers, timeout=10.0)
+        response.raise_for_status()
+        data = response.json()
+        return data.get("candidates", [{}])[0].get("content", {}).get("parts", [{}])[0].get("text", "").strip() or None
     except Exception as e:
         logger.warning(f"Gemini classify failed: {e}")
         return None
 
 
+@llm_cache.cached("classify", "openai", OPENAI_MODEL)
 async def _classify_openai(prompt: str) -> str | None:
     try:
-        async with httpx.AsyncClient(timeout=10.0) as client:
-            headers = {"Authorization": f"Bearer {OPENAI_API_KEY}", "Content-Type": "application/json"}
-            payload = {"model": OPENAI_MODEL, "messages": [{"role": "user", "content": prompt}], "temperature": 0.0, "max_tokens": 32}
-            resp = await client.post(OPENAI_API_URL, json=payload, headers=headers)
-            resp.raise_for_status()
-            data = resp.json()
-            return data.get("choices", [{}])[0].get("message", {}).get("content", "").strip() or None
+        headers = {"Authorization": f"Bearer {OPENAI_API_KEY}", "Content-Type": "application/json"}
+        payload = {"model": OPENAI_MODEL, "messages": [{"role": "user", "content": prompt}], "temperature": 0.0, "max_tokens": 32}
+        resp = await llm_gateway.post("openai", OPENAI_API_URL, json=payload, headers=headers, timeout=10.0)
+        resp.raise_for_status()
+        data = resp.json()
+        return data.get("choices", [{}])[0].get("message", {}).get("content", "").strip() or None
     except Exception as e:
         logger.error(f"OpenAI classify failed: {e}")
         return None
@@ -123,57 +162,39 @@ async def classify_intent(user_input: str) -> str:
         INTENT_LIST_TEXT=INTENT_LIST_TEXT,
     )
 
-    tasks = []
-    if GEMINI_API_KEY:
-        tasks.append(asyncio.create_task(_classify_gemini(prompt)))
-    if OPENAI_API_KEY:
-        tasks.append(asyncio.create_task(_classify_openai(prompt)))
-
-    if not tasks:
+    calls = _provider_calls(_classify_gemini, _classify_openai, prompt)
+    if not calls:
         return "UNSUPPORTED_INTENT"
 
-    done, pending = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
-    for p in pending:
-        p.cancel()
-    for d in done:
-        result = d.result()
-        if result:
-            return result
-
-    return "UNSUPPORTED_INTENT"
+    result = await llm_router.first_success("classify", calls)
+    return result or "UNSUPPORTED_INTENT"
 
 
+@llm_cache.cached("extract", "gemini", GEMINI_MODEL)
 async def _extract_gemini(prompt: str) -> Dict[str, str] | None:
     try:
-        async with httpx.AsyncClient(timeout=15.0) as client:
-            headers = {"Content-Type": "application/json"}
-            payload = {"contents": [{"parts": [{"text": prompt}]}], "generationConfig": {"temperature": 0.0, "maxOutputTokens": 128}}
-            response = await client.post(GEMINI_API_URL, json=payload, headers=headers)
-            response.raise_for_status()
-            data = response.json()
-            text = data.get("candidates", [{}])[0].get("content", {}).get("parts", [{}])[0].get("text", "payload:").strip()
-            if ":" in text:
-                key, value = text.split(":", 1)
-                return {key.strip(): value.strip()}
-            return {"payload": text}
+        headers = {"Content-Type": "application/json"}
+        payload = {"contents": [{"parts": [{"text": prompt}]}], "generationConfig": {"temperature": 0.0, "maxOutputTokens": 128}}
+        response = await llm_gateway.post("gemini", GEMINI_API_URL, json=payload, headers=headers, timeout=15.0)
+        response.raise_for_status()
+        data = response.json()
+        text = data.get("candidates", [{}])[0].get("content", {}).get("parts", [{}])[0].get("text", "payload:").strip()
+        return parse_key_values(text)
     except Exception as e:
         logger.warning(f"Gemini extract failed: {e}")
         return None
 
 
+@llm_cache.cached("extract", "openai", OPENAI_MODEL)
 async def _extract_openai(prompt: str) -> Dict[str, str] | None:
     try:
-        async with httpx.AsyncClient(timeout=15.0) as client:
-            headers = {"Authorization": f"Bearer {OPENAI_API_KEY}", "Content-Type": "application/json"}
-            payload = {"model": OPENAI_MODEL, "messages": [{"role": "user", "content": prompt}], "temperature": 0.0, "max_tokens": 128}
-            resp = await client.post(OPENAI_API_URL, json=payload, headers=headers)
-            resp.raise_for_status()
-            data = resp.json()
-            text = data.get("choices", [{}])[0].get("message", {}).get("content", "payload:").strip()
-            if ":" in text:
-                key, value = text.split(":", 1)
-                return {key.strip(): value.strip()}
-            return {"payload": text}
+        headers = {"Authorization": f"Bearer {OPENAI_API_KEY}", "Content-Type": "application/json"}
+        payload = {"model": OPENAI_MODEL, "messages": [{"role": "user", "content": prompt}], "temperature": 0.0, "max_tokens": 128}
+        resp = await llm_gateway.post("openai", OPENAI_API_URL, json=payload, headers=headers, timeout=15.0)
+        resp.raise_for_status()
+        data = resp.json()
+        text = data.get("choices", [{}])[0].get("message", {}).get("content", "payload:").strip()
+        return parse_key_values(text)
     except Exception as e:
         logger.error(f"OpenAI extract failed: {e}")
         return None
@@ -183,21 +204,195 @@ async def extract_entities(intent: str, user_input: str) -> Dict[str, str]:
     """Шаг 2: Извлекает данные для конкретного намерения."""
     prompt = EXTRACT_ENTITIES_PROMPT.format(intent=intent, user_input=user_input)
 
-    tasks = []
-    if GEMINI_API_KEY:
-        tasks.append(asyncio.create_task(_extract_gemini(prompt)))
-    if OPENAI_API_KEY:
-        tasks.append(asyncio.create_task(_extract_openai(prompt)))
-
-    if not tasks:
+    calls = _provider_calls(_extract_gemini, _extract_openai, prompt)
+    if not calls:
         return {"payload": "AI_SERVICE_UNCONFIGURED"}
 
-    done, pending = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
-    for p in pending:
-        p.cancel()
-    for d in done:
-        result = d.result()
-        if result:
-            return result
+    result = await llm_router.first_success("extract", calls)
+    if result:
+        return result
 
     return {"payload": "AI_API_HTTP_ERROR"}
+
+
+# --- ПРОМПТ 3: Намерение и все данные одним запросом ---
+CLASSIFY_AND_EXTRACT_PROMPT = """
+Ты — системный мозг крипто-бота. Определи намерение пользователя и извлеки из запроса все нужные данные.
+
+Ответь СТРОГО одним JSON-объектом без пояснений и без markdown:
+{{"intent": "<НАМЕРЕНИЕ>", "entities": {{"<ключ>": "<значение>"}}, "confidence": <число от 0 до 1>}}
+
+**Список Допустимых Намерений:**
+{INTENT_LIST_TEXT}
+
+**Ключи данных для намерений (главный ключ — первым):**
+- CRYPTO_INFO: `symbols` — символы через запятую (например, "BTC,ETH").
+- TOKEN_ANALYSIS, EDU_LESSON: `topic`.
+- SETUP_ALERT: `alert_data` в формате `СИМВОЛ:ЦЕНА:НАПРАВЛЕНИЕ`, направление по умолчанию `above`.
+- TRACK_COIN, UNTRACK_COIN, WHERE_TO_BUY, CRYPTO_NEWS, PRICE_PREDICTION: `symbol`.
+- NFT_ANALYTICS: `slug` коллекции.
+- SHOP_BUY: `product_id`. COURSE_INFO: `course_id`.
+- Остальные намерения или нет данных: {{"payload": ""}}.
+Значения — строки. Для чисел убирай пробелы и символы валют.
+
+**Запрос пользователя:** "{user_input}"
+"""
+
+
+class DispatchResult:
+    """Intent plus entities returned by the combined structured call."""
+
+    __slots__ = ("intent", "entities", "confidence")
+
+    def __init__(self, intent: str, entities: Dict[str, str], confidence: float) -> None:
+        self.intent = intent
+        self.entities = entities
+        self.confidence = confidence
+
+
+def parse_structured_response(text: Optional[str]) -> Optional[DispatchResult]:
+    """Проверяет JSON-ответ по схеме; ``None``, если он не подходит."""
+    if not text:
+        return None
+    text = text.strip()
+    if text.startswith("```"):
+        text = text.strip("`")
+        text = text[4:] if text.lower().startswith("json") else text
+    start, end = text.find("{"), text.rfind("}")
+    if start < 0 or end < start:
+        return None
+    try:
+        data = json.loads(text[start:end + 1])
+    except ValueError:
+        return None
+    if not isinstance(data, dict):
+        return None
+    intent = data.get("intent")
+    if not isinstance(intent, str) or intent.strip().upper() not in INTENT_DESCRIPTIONS:
+        return None
+    raw_entities = data.get("entities") or {}
+    if not isinstance(raw_entities, dict):
+        return None
+    entities: Dict[str, str] = {}
+    for key, value in raw_entities.items():
+        if isinstance(value, (list, tuple)):
+            value = ",".join(str(v) for v in value)
+        elif isinstance(value, (dict, bool)) or value is None:
+            continue
+        entities[str(key)] = str(value).strip()
+    confidence = data.get("confidence", 1.0)
+    try:
+        confidence = min(max(float(confidence), 0.0), 1.0)
+    except (TypeError, ValueError):
+        return None
+    return DispatchResult(intent.strip().upper(), entities or {"payload": ""}, confidence)
+
+
+@llm_cache.cached("combined", "gemini", GEMINI_MODEL)
+async def _combined_gemini(prompt: str) -> str | None:
+    try:
+        headers = {"Content-Type": "application/json"}
+        payload = {
+            "contents": [{"parts": [{"text": prompt}]}],
+            "generationConfig": {"temperature": 0.0, "maxOutputTokens": 256, "responseMimeType": "application/json"},
+        }
+        response = await llm_gateway.post("gemini", GEMINI_API_URL, json=payload, headers=headers, timeout=15.0)
+        response.raise_for_status()
+        data = response.json()
+        return data.get("candidates", [{}])[0].get("content", {}).get("parts", [{}])[0].get("text", "").strip() or None
+    except Exception as e:
+        logger.warning(f"Gemini classify_and_extract failed: {e}")
+        return None
+
+
+@llm_cache.cached("combined", "openai", OPENAI_MODEL)
+async def _combined_openai(prompt: str) -> str | None:
+    try:
+        headers = {"Authorization": f"Bearer {OPENAI_API_KEY}", "Content-Type": "application/json"}
+        payload = {
+            "model": OPENAI_MODEL,
+            "messages": [{"role": "user", "content": prompt}],
+            "temperature": 0.0,
+            "max_tokens": 256,
+            "response_format": {"type": "json_object"},
+        }
+        resp = await llm_gateway.post("openai", OPENAI_API_URL, json=payload, headers=headers, timeout=15.0)
+        resp.raise_for_status()
+        data = resp.json()
+        return data.get("choices", [{}])[0].get("message", {}).get("content", "").strip() or None
+    except Exception as e:
+        logger.error(f"OpenAI classify_and_extract failed: {e}")
+        return None
+
+
+_dispatch_stats: Dict[str, Any] = {
+    "two_step": {"calls": 0, "total_ms": 0.0},
+    "combined": {"calls": 0, "total_ms": 0.0, "parse_failures": 0, "fallbacks": 0},
+}
+
+
+def record_dispatch(mode: str, elapsed_ms: float) -> None:
+    """Учитывает время классификации с извлечением данных для сравнения режимов."""
+    stats = _dispatch_stats[mode]
+    stats["calls"] += 1
+    stats["total_ms"] += elapsed_ms
+
+
+def dispatch_stats() -> dict:
+    snapshot = {"mode": DISPATCH_MODE, "ab_percent": DISPATCH_AB_PERCENT}
+    for mode, stats in _dispatch_stats.items():
+        calls = stats["calls"]
+        snapshot[mode] = {
+            **{k: v for k, v in stats.items() if k != "total_ms"},
+            "avg_ms": round(stats["total_ms"] / calls, 1) if calls else 0.0,
+        }
+    return snapshot
+
+
+register_metrics("dispatcher", dispatch_stats)
+
+
+def use_combined(user_id: int) -> bool:
+    """Нужен ли пользователю единый запрос (с учётом A/B-разбиения)."""
+    if DISPATCH_MODE == "combined":
+        return True
+    if DISPATCH_MODE == "ab":
+        return user_id % 100 < DISPATCH_AB_PERCENT
+    return False
+
+
+def _parse_or_count(text: Optional[str]) -> Optional[DispatchResult]:
+    result = parse_structured_response(text)
+    if result is None:
+        _dispatch_stats["combined"]["parse_failures"] += 1
+    return result
+
+
+async def _request_structured(prompt: str) -> Optional[DispatchResult]:
+    """Первый ответ, прошедший проверку схемы; неподходящий ответ — повод спросить другого провайдера."""
+    calls = _provider_calls(_combined_gemini, _combined_openai, prompt)
+    if not calls:
+        return None
+    return await llm_router.first_success("combined", calls, accept=_parse_or_count)
+
+
+async def classify_and_extract(user_input: str) -> Tuple[str, Dict[str, str]]:
+    """Намерение и данные одним запросом к LLM.
+
+    Если ни один ответ не прошёл проверку схемы, выполняется прежний
+    двухшаговый путь classify_intent + extract_entities.
+    """
+    started = time.perf_counter()
+    prompt = CLASSIFY_AND_EXTRACT_PROMPT.format(user_input=user_input, INTENT_LIST_TEXT=INTENT_LIST_TEXT)
+    result = await _request_structured(prompt)
+    if result is not None:
+        logger.info(f"Намерение {result.intent} ({result.confidence:.2f}) и данные {result.entities} — одним запросом")
+        record_dispatch("combined", (time.perf_counter() - started) * 1000)
+        return result.intent, result.entities
+
+    logger.warning("Единый запрос не дал корректного JSON, переход на двухшаговую классификацию")
+    intent = await classify_intent(user_input)
+    entities = await extract_entities(intent, user_input)
+    _dispatch_stats["combined"]["fallbacks"] += 1
+    record_dispatch("combined", (time.perf_counter() - started) * 1000)
+    return intent, entities
@@ -4,14 +4,21 @@
 import os
 import logging
 import json
-import httpx
 from dotenv import load_dotenv
 
+from ai.llm_cache import llm_cache
+from ai import llm_gateway
+from ai.providers import llm_router
+
 logger = logging.getLogger(__name__)
 load_dotenv()
 
 GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
-GEMINI_API_URL = f"https://generativelanguage.googleapis.com/v1beta/models/gemini-1.5-flash-latest:generateContent?key={GEMINI_API_KEY}"
+GEMINI_MODEL = "gemini-1.5-flash-latest"
+GEMINI_API_URL = f"https://generativelanguage.googleapis.com/v1beta/models/{GEMINI_MODEL}:generateContent?key={GEMINI_API_KEY}"
+OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
+OPENAI_API_URL = "https://api.openai.com/v1/chat/completions"
+OPENAI_MODEL = os.getenv("OPENAI_GPT_MODEL", "gpt-4o-mini")
 
 # --- ПРОМПТ РАЗДЕЛЕН НА ЧАСТИ ДЛЯ БЕЗОПАСНОЙ СБОРКИ ---
 FORMATTER_PROMPT_PART_1 = """
@@ -39,11 +46,41 @@ FORMATTER_PROMPT_PART_2 = """
 Твой отформатированный ответ:
 """
 
+@llm_cache.cached("format", "gemini", GEMINI_MODEL)
+async def _format_gemini(prompt: str) -> str | None:
+    headers = {'Content-Type': 'application/json'}
+    payload = {
+        "contents": [{"parts": [{"text": prompt}]}],
+        "generationConfig": {"temperature": 0.0, "maxOutputTokens": 1024}
+    }
+    try:
+        response = await llm_gateway.post("gemini", GEMINI_API_URL, json=payload, headers=headers, timeout=20.0)
+        response.raise_for_status()
+        api_data = response.json()
+        return api_data["candidates"][0]["content"]["parts"][0]["text"].strip() or None
+    except Exception as e:
+        logger.error(f"Ошибка в ИИ-Форматтере: {e}")
+        return None
+
+@llm_cache.cached("format", "openai", OPENAI_MODEL)
+async def _format_openai(prompt: str) -> str | None:
+    headers = {"Authorization": f"Bearer {OPENAI_API_KEY}", "Content-Type": "application/json"}
+    payload = {"model": OPENAI_MODEL, "messages": [{"role": "user", "content": prompt}], "temperature": 0.0, "max_tokens": 1024}
+    try:
+        resp = await llm_gateway.post("openai", OPENAI_API_URL, json=payload, headers=headers, timeout=20.0)
+        resp.raise_for_status()
+        data = resp.json()
+        return data["choices"][0]["message"]["content"].strip() or None
+    except Exception as e:
+        logger.error(f"Ошибка в ИИ-Форматтере (OpenAI): {e}")
+        return None
+
 async def format_data_with_ai(data: dict) -> str:
     """
-    Отправляет данные в формате JSON в модель Gemini для форматирования.
+    Отправляет данные в формате JSON в модель (Gemini или OpenAI) для форматирования.
+    Одинаковые данные форматируются один раз в пределах TTL кэша (ai/llm_cache.py).
     """
-    if not GEMINI_API_KEY:
+    if not GEMINI_API_KEY and not OPENAI_API_KEY:
         return f"```json\n{json.dumps(data, indent=2, ensure_ascii=False)}\n```"
 
     json_string = json.dumps(data, indent=2, ensure_ascii=False)
@@ -51,20 +88,12 @@ async def format_data_with_ai(data: dict) -> str:
     # --- ИСПРАВЛЕНИЕ: Безопасное создание промпта через конкатенацию ---
     prompt = FORMATTER_PROMPT_PART_1 + json_string + FORMATTER_PROMPT_PART_2
 
-    headers = {'Content-Type': 'application/json'}
-    payload = {
-        "contents": [{"parts": [{"text": prompt}]}],
-        "generationConfig": {"temperature": 0.0, "maxOutputTokens": 1024}
-    }
-    try:
-        async with httpx.AsyncClient(timeout=20.0) as client:
-            response = await client.post(GEMINI_API_URL, json=payload, headers=headers)
-            response.raise_for_status()
-            api_data = response.json()
-            formatted_text = api_data["candidates"][0]["content"]["parts"][0]["text"].strip()
-            if not formatted_text:
-                return f"```json\n{json.dumps(data, indent=2, ensure_ascii=False)}\n```"
-            return formatted_text
-    except Exception as e:
-        logger.error(f"Ошибка в ИИ-Форматтере: {e}")
-        return f"```json\n{json.dumps(data, indent=2, ensure_ascii=False)}\n```"
\ No newline at end of file
+    calls = {}
+    if GEMINI_API_KEY:
+        calls["gemini"] = lambda: _format_gemini(prompt)
+    if OPENAI_API_KEY:
+        calls["openai"] = lambda: _format_openai(prompt)
+    formatted_text = await llm_router.first_success("format", calls)
+    if not formatted_text:
+        return f"```json\n{json.dumps(data, indent=2, ensure_ascii=False)}\n```"
+    return formatted_text
\ No newline at end of file
@@ -3,8 +3,7 @@
 
 import os
 import logging
-import httpx
-import asyncio
+import time
 from typing import List, Dict
 from datetime import datetime
 from dotenv import load_dotenv
@@ -12,6 +11,11 @@ from sqlalchemy.ext.asyncio import AsyncSession
 from telegram import Update, constants
 from telegram.ext import CallbackContext
 
+from ai import llm_gateway
+from ai.providers import llm_router
+from ai.similarity_cache import similarity_cache
+from ai.streaming import CHAT_STREAMING, StreamingReply, gemini_delta, openai_delta, stream_reply
+from ai.summarizer import dialog_summarizer
 from database import operations as db_ops
 from settings.messages import get_text
 
@@ -20,6 +24,7 @@ load_dotenv()
 
 GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
 GEMINI_API_URL = f"https://generativelanguage.googleapis.com/v1beta/models/gemini-1.5-flash-latest:generateContent?key={GEMINI_API_KEY}"
+GEMINI_STREAM_URL = f"https://generativelanguage.googleapis.com/v1beta/models/gemini-1.5-flash-latest:streamGenerateContent?alt=sse&key={GEMINI_API_KEY}"
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
 OPENAI_API_URL = "https://api.openai.com/v1/chat/completions"
 OPENAI_MODEL = os.getenv("OPENAI_GPT_MODEL", "gpt-4o-mini")
@@ -59,28 +64,70 @@ async def handle_general_ai_conversation(update: Update, context: CallbackContex
     lang = context.user_data.get('lang', 'ru')
 
     try:
-        history_records = await db_ops.get_chat_history(session=db_session, user_id=user_id, limit=10)
-        history_for_prompt = [{"role": record.role, "text": record.message_text} for record in history_records]
+        cacheable = similarity_cache.enabled and similarity_cache.cacheable(user_input)
+        cached = similarity_cache.get(user_input, lang) if cacheable else None
+        if cached is not None:
+            # Почти такой же вопрос уже задавали — ответ без обращения к LLM
+            await update.effective_message.reply_text(cached, parse_mode=constants.ParseMode.MARKDOWN)
+            await db_ops.add_chat_message(session=db_session, user_id=user_id, role='model', text=cached)
+            dialog = await db_ops.get_active_dialog(db_session, user_id)
+            dialog_summarizer.schedule(dialog.id if dialog else None)
+            return
+
+        history_records = await db_ops.get_recent_history(db_session, user_id, limit=10)
+        dialog = await db_ops.get_active_dialog(db_session, user_id)
+        if dialog_summarizer.enabled:
+            # Резюме диалога и несколько последних реплик вместо 10 сообщений целиком
+            chat_history = dialog_summarizer.prompt_history(dialog, history_records)
+        else:
+            history_for_prompt = [{"role": record.role, "text": record.message_text} for record in history_records]
+            chat_history = format_history_for_prompt(history_for_prompt)
         
         current_date_str = datetime.now().strftime("%d %B %Y года")
         
         prompt = GENERAL_PROMPT_TEMPLATE.format(
             current_date=current_date_str,
-            chat_history=format_history_for_prompt(history_for_prompt), 
+            chat_history=chat_history,
             user_input=user_input
         )
 
+        gemini_headers = {"Content-Type": "application/json"}
+        gemini_payload = {"contents": [{"parts": [{"text": prompt}]}], "generationConfig": {"temperature": 0.7, "maxOutputTokens": 512}}
+        openai_headers = {"Authorization": f"Bearer {OPENAI_API_KEY}", "Content-Type": "application/json"}
+        openai_payload = {"model": OPENAI_MODEL, "messages": [{"role": "user", "content": prompt}], "temperature": 0.7}
+
+        ai_response = None
+        streamed = None
+        started = time.perf_counter()
+        if CHAT_STREAMING:
+            # Первый фрагмент ответа показывается сразу, остальное дописывается правками
+            streams = {}
+            if GEMINI_API_KEY:
+                streams["gemini"] = (
+                    lambda: llm_gateway.stream("gemini", GEMINI_STREAM_URL, json=gemini_payload, headers=gemini_headers, timeout=30.0),
+                    gemini_delta,
+                )
+            if OPENAI_API_KEY:
+                streams["openai"] = (
+                    lambda: llm_gateway.stream("openai", OPENAI_API_URL, json={**openai_payload, "stream": True}, headers=openai_headers, timeout=30.0),
+                    openai_delta,
+                )
+            if streams:
+                streamed = StreamingReply(update.effective_message, context.bot)
+                ai_response = await stream_reply("chat_stream", streams, streamed)
+                if streamed.sent is not None:
+                    ai_response = await streamed.finish() or ai_response
+                    if cacheable and streamed.complete:
+                        similarity_cache.put(user_input, ai_response, lang, (time.perf_counter() - started) * 1000)
+
         async def _gemini_call() -> str | None:
             if not GEMINI_API_KEY:
                 return None
-            headers = {"Content-Type": "application/json"}
-            api_payload = {"contents": [{"parts": [{"text": prompt}]}], "generationConfig": {"temperature": 0.7, "maxOutputTokens": 512}}
             try:
-                async with httpx.AsyncClient(timeout=30.0) as client:
-                    response = await client.post(GEMINI_API_URL, json=api_payload, headers=headers)
-                    response.raise_for_status()
-                    api_data = response.json()
-                    return api_data["candidates"][0]["content"]["parts"][0]["text"].strip()
+                response = await llm_gateway.post("gemini", GEMINI_API_URL, json=gemini_payload, headers=gemini_headers, timeout=30.0)
+                response.raise_for_status()
+                api_data = response.json()
+                return api_data["candidates"][0]["content"]["parts"][0]["text"].strip() or None
             except Exception as e:
                 logger.warning(f"Gemini chat failed: {e}")
                 return None
@@ -88,40 +135,37 @@ async def handle_general_ai_conversation(update: Update, context: CallbackContex
         async def _openai_call() -> str | None:
             if not OPENAI_API_KEY:
                 return None
-            headers = {"Authorization": f"Bearer {OPENAI_API_KEY}", "Content-Type": "application/json"}
-            payload_oa = {"model": OPENAI_MODEL, "messages": [{"role": "user", "content": prompt}], "temperature": 0.7}
             try:
-                async with httpx.AsyncClient(timeout=30.0) as client:
-                    resp = await client.post(OPENAI_API_URL, json=payload_oa, headers=headers)
-                    resp.raise_for_status()
-                    data = resp.json()
-                    return data["choices"][0]["message"]["content"].strip()
+                resp = await llm_gateway.post("openai", OPENAI_API_URL, json=openai_payload, headers=openai_headers, timeout=30.0)
+                resp.raise_for_status()
+                data = resp.json()
+                return data["choices"][0]["message"]["content"].strip() or None
             except Exception as e:
                 logger.error(f"OpenAI chat failed: {e}")
                 return None
 
-        tasks = []
-        if GEMINI_API_KEY:
-            tasks.append(asyncio.create_task(_gemini_call()))
-        if OPENAI_API_KEY:
-            tasks.append(asyncio.create_task(_openai_call()))
-
-        ai_response = ""
-        if tasks:
-            done, pending = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
-            for p in pending:
-                p.cancel()
-            for d in done:
-                res = d.result()
-                if res:
-                    ai_response = res
-                    break
+        if streamed is None or streamed.sent is None:
+            # Поток не начался (выключен или провайдеры не ответили) — обычный запрос
+            calls = {}
+            if GEMINI_API_KEY:
+                calls["gemini"] = _gemini_call
+            if OPENAI_API_KEY:
+                calls["openai"] = _openai_call
+            ai_response = await llm_router.first_success("chat", calls) if calls else ""
+            if cacheable and ai_response:
+                similarity_cache.put(user_input, ai_response, lang, (time.perf_counter() - started) * 1000)
 
-        if not ai_response:
-            ai_response = get_text(lang, 'ai_generic_empty')
+            if not ai_response:
+                ai_response = get_text(lang, 'ai_generic_empty')
+
+            await update.effective_message.reply_text(ai_response, parse_mode=constants.ParseMode.MARKDOWN)
 
-        await update.effective_message.reply_text(ai_response, parse_mode=constants.ParseMode.MARKDOWN)
+        # Ответ сохраняется один раз, уже целиком
         await db_ops.add_chat_message(session=db_session, user_id=user_id, role='model', text=ai_response)
+        if dialog is None:
+            # Диалог создаётся при первой записи в историю
+            dialog = await db_ops.get_active_dialog(db_session, user_id)
+        dialog_summarizer.schedule(dialog.id if dialog else None)
 
     except Exception as e:
         logger.error(
@@ -0,0 +1,141 @@
+# ai/llm_cache.py
+# Кэш ответов LLM для вызовов с temperature=0.0.
+#
+# Одинаковый промпт при нулевой температуре даёт одинаковый ответ, поэтому
+# популярные запросы (классификация, извлечение данных, форматирование
+# одинаковых цен) не нужно пересчитывать. Ключ — провайдер, модель и
+# sha256 нормализованного промпта (пробелы схлопываются). Два уровня: LRU в
+# памяти процесса и Redis, общий для воркеров. TTL задаётся для каждого места
+# вызова отдельно; неудачные ответы (None) не кэшируются. Ответ из кэша
+# помечается в served_from_cache, чтобы ProviderRouter не считал его
+# задержкой провайдера.
+
+import functools
+import hashlib
+import json
+import logging
+import os
+import time
+from collections import OrderedDict
+from contextvars import ContextVar
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+
+from utils.cache import get_cache, set_cache
+from utils.runtime_metrics import register_metrics
+
+logger = logging.getLogger(__name__)
+
+LLM_CACHE = os.getenv("LLM_CACHE", "on").lower() not in ("off", "0", "false")
+LLM_CACHE_SIZE = int(os.getenv("LLM_CACHE_SIZE", "5000"))
+KEY_PREFIX = "llm:"
+
+# TTL ответа по месту вызова, секунды
+CALL_SITE_TTLS: Dict[str, int] = {
+    "classify": int(os.getenv("LLM_CACHE_TTL_CLASSIFY", "86400")),
+    "extract": int(os.getenv("LLM_CACHE_TTL_EXTRACT", "86400")),
+    "combined": int(os.getenv("LLM_CACHE_TTL_COMBINED", "86400")),
+    "format": int(os.getenv("LLM_CACHE_TTL_FORMAT", "300")),
+}
+DEFAULT_TTL = 600
+
+# True, если последний вызов обёртки в текущей задаче ответил из кэша
+served_from_cache: ContextVar[bool] = ContextVar("llm_served_from_cache", default=False)
+
+
+def normalize_prompt(prompt: str) -> str:
+    return " ".join(prompt.split())
+
+
+def prompt_key(provider: str, model: str, prompt: str) -> str:
+    return hashlib.sha256(f"{provider}\n{model}\n{normalize_prompt(prompt)}".encode("utf-8")).hexdigest()
+
+
+class LLMCache:
+    """Two-tier (process LRU + Redis) cache of deterministic LLM responses."""
+
+    def __init__(self, max_size: int = LLM_CACHE_SIZE, enabled: bool = LLM_CACHE, name: str = "llm_cache") -> None:
+        self.max_size = max_size
+        self.enabled = enabled
+        self._local: "OrderedDict[str, Tuple[float, Any]]" = OrderedDict()
+        self._stats: Dict[str, Dict[str, int]] = {}
+        register_metrics(name, self.stats)
+
+    def _count(self, site: str, event: str) -> None:
+        site_stats = self._stats.setdefault(site, {"local_hits": 0, "redis_hits": 0, "misses": 0, "stores": 0})
+        site_stats[event] += 1
+
+    def ttl(self, site: str) -> int:
+        return CALL_SITE_TTLS.get(site, DEFAULT_TTL)
+
+    async def get(self, site: str, provider: str, model: str, prompt: str) -> Optional[Any]:
+        key = f"{KEY_PREFIX}{site}:{prompt_key(provider, model, prompt)}"
+        entry = self._local.get(key)
+        if entry is not None:
+            expires_at, value = entry
+            if expires_at > time.monotonic():
+                self._local.move_to_end(key)
+                self._count(site, "local_hits")
+                return value
+            del self._local[key]
+
+        raw = await get_cache(key)
+        if raw is not None:
+            try:
+                value = json.loads(raw)
+            except ValueError:
+                value = None
+            if value is not None:
+                self._remember(key, value, self.ttl(site))
+                self._count(site, "redis_hits")
+                return value
+        self._count(site, "misses")
+        return None
+
+    async def set(self, site: str, provider: str, model: str, prompt: str, value: Any) -> None:
+        if value is None:
+            return
+        key = f"{KEY_PREFIX}{site}:{prompt_key(provider, model, prompt)}"
+        ttl = self.ttl(site)
+        self._remember(key, value, ttl)
+        self._count(site, "stores")
+        await set_cache(key, json.dumps(value, ensure_ascii=False), ttl=ttl)
+
+    def _remember(self, key: str, value: Any, ttl: int) -> None:
+        self._local[key] = (time.monotonic() + ttl, value)
+        self._local.move_to_end(key)
+        while len(self._local) > self.max_size:
+            self._local.popitem(last=False)
+
+    def cached(self, site: str, provider: str, model: str):
+        """Декоратор для ``async def call(prompt) -> value | None``."""
+
+        def decorator(func: Callable[..., Awaitable[Any]]):
+            @functools.wraps(func)
+            async def wrapper(prompt: str, *args, **kwargs):
+                if not self.enabled:
+                    return await func(prompt, *args, **kwargs)
+                value = await self.get(site, provider, model, prompt)
+                if value is not None:
+                    served_from_cache.set(True)
+                    return value
+                value = await func(prompt, *args, **kwargs)
+                await self.set(site, provider, model, prompt, value)
+                return value
+
+            return wrapper
+
+        return decorator
+
+    def clear(self) -> None:
+        self._local.clear()
+
+    def stats(self) -> dict:
+        sites = {}
+        for site, counts in self._stats.items():
+            lookups = counts["local_hits"] + counts["redis_hits"] + counts["misses"]
+            hits = counts["local_hits"] + counts["redis_hits"]
+            sites[site] = {**counts, "hit_rate": round(hits / lookups, 3) if lookups else 0.0}
+        return {"enabled": self.enabled, "size": len(self._local), "max_size": self.max_size, "sites": sites}
+
+
+llm_cache = LLMCache()
@@ -0,0 +1,64 @@
+# ai/llm_gateway.py
+# Общий HTTP-шлюз к LLM-провайдерам.
+#
+# Все модули ai/ и analysis/ отправляют запросы к Gemini и OpenAI через
+# долгоживущие клиенты из utils/http_clients.py — по одному на провайдера.
+# Соединения переиспользуются между вызовами (keep-alive), размер пула и
+# таймаут подключения задаются переменными окружения, таймаут ответа —
+# отдельно для каждого места вызова.
+
+import os
+from typing import AsyncContextManager, Dict, Optional
+
+import httpx
+
+from utils.http_clients import PooledClient, http_clients
+
+LLM_HTTP2 = os.getenv("LLM_HTTP2", "off").lower() in ("on", "1", "true")
+LLM_MAX_CONNECTIONS = int(os.getenv("LLM_MAX_CONNECTIONS", "20"))
+LLM_MAX_KEEPALIVE = int(os.getenv("LLM_MAX_KEEPALIVE", "10"))
+LLM_KEEPALIVE_EXPIRY = float(os.getenv("LLM_KEEPALIVE_EXPIRY", "60"))
+LLM_CONNECT_TIMEOUT = float(os.getenv("LLM_CONNECT_TIMEOUT", "5"))
+
+PROVIDERS = ("gemini", "openai")
+
+
+def _register(provider: str) -> PooledClient:
+    return http_clients.register(
+        f"llm:{provider}",
+        timeout=30.0,
+        connect_timeout=LLM_CONNECT_TIMEOUT,
+        max_connections=LLM_MAX_CONNECTIONS,
+        max_keepalive=LLM_MAX_KEEPALIVE,
+        keepalive_expiry=LLM_KEEPALIVE_EXPIRY,
+        http2=LLM_HTTP2,
+    )
+
+
+_clients: Dict[str, PooledClient] = {provider: _register(provider) for provider in PROVIDERS}
+
+
+async def post(
+    provider: str,
+    url: str,
+    json: dict,
+    timeout: float,
+    headers: Optional[Dict[str, str]] = None,
+) -> "httpx.Response":
+    """POST к провайдеру через его общий клиент; статус не проверяется."""
+    return await _clients[provider].post(
+        url, json=json, headers=headers, timeout=httpx.Timeout(timeout, connect=LLM_CONNECT_TIMEOUT)
+    )
+
+
+def stream(
+    provider: str,
+    url: str,
+    json: dict,
+    timeout: float,
+    headers: Optional[Dict[str, str]] = None,
+) -> AsyncContextManager["httpx.Response"]:
+    """Потоковый POST: ``async with stream(...) as response`` и чтение по строкам."""
+    return _clients[provider].stream(
+        "POST", url, json=json, headers=headers, timeout=httpx.Timeout(timeout, connect=LLM_CONNECT_TIMEOUT)
+    )
@@ -0,0 +1,278 @@
+# ai/local_classifier.py
+# Локальный классификатор намерений, который работает до обращения к LLM.
+#
+# Правила берутся из config/intents.json: у намерения могут быть ключевые
+# слова и фразы (keywords), регулярные выражения на весь текст (patterns) и
+# тип данных (entity), которые нужны обработчику. Монеты распознаются по
+# словарю config/symbols.json (тикеры, названия, русские варианты).
+#
+# Уверенность — доля слов запроса, объяснённых правилами (ключевое слово,
+# монета, служебное слово), со штрафом, если подходят несколько намерений.
+# Совпадение шаблона на весь текст даёт PATTERN_CONFIDENCE. Ниже порога
+# LOCAL_INTENT_THRESHOLD запрос уходит в classify_intent как раньше.
+#
+# Намерения, которые меняют данные пользователя (TRACK_COIN, UNTRACK_COIN),
+# помечены "known_symbols": монета для них берётся только из словаря, иначе
+# «track it» или «remove ads» добавили бы в портфель тикеры IT и ADS.
+# Незнакомое слово в таком запросе оставляется LLM.
+
+import json
+import logging
+import os
+import re
+import time
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from utils.runtime_metrics import register_metrics
+from utils.validators import is_valid_symbol
+
+logger = logging.getLogger(__name__)
+
+BASE_DIR = os.path.dirname(os.path.dirname(__file__))
+INTENTS_FILE = os.path.join(BASE_DIR, "config", "intents.json")
+SYMBOLS_FILE = os.path.join(BASE_DIR, "config", "symbols.json")
+
+LOCAL_INTENT_CLASSIFIER = os.getenv("LOCAL_INTENT_CLASSIFIER", "on").lower() not in ("off", "0", "false")
+LOCAL_INTENT_THRESHOLD = float(os.getenv("LOCAL_INTENT_THRESHOLD", "0.8"))
+
+PATTERN_CONFIDENCE = 0.95
+# Доля уверенности второго по силе намерения, вычитаемая из первого
+AMBIGUITY_PENALTY = 0.5
+
+TOKEN_RE = re.compile(r"[a-zа-я0-9]+(?:-[a-zа-я0-9]+)*")
+
+# Слова, которые не меняют смысл короткого запроса
+FILLER_WORDS = frozenset(
+    """
+    и а на по про о об для у в во с со за к мне мой моя мои покажи скажи дай какая какой какие
+    сейчас сегодня текущая текущий пожалуйста плиз ну как
+    the a an of for on to me my show tell what is are current now today please pls and in
+    """.split()
+)
+
+
+def normalize(text: str) -> List[str]:
+    """Слова запроса в нижнем регистре, ``ё`` приводится к ``е``."""
+    return TOKEN_RE.findall(text.casefold().replace("ё", "е"))
+
+
+class LocalIntent:
+    """Intent and entities recognised without the LLM."""
+
+    __slots__ = ("intent", "entities", "confidence")
+
+    def __init__(self, intent: str, entities: Dict[str, str], confidence: float) -> None:
+        self.intent = intent
+        self.entities = entities
+        self.confidence = confidence
+
+    def __repr__(self) -> str:
+        return f"LocalIntent({self.intent!r}, {self.entities!r}, {self.confidence:.2f})"
+
+
+class _Rule:
+    __slots__ = ("intent", "patterns", "entity", "known_symbols")
+
+    def __init__(
+        self, intent: str, patterns: Iterable[str], entity: Optional[str], known_symbols: bool = False
+    ) -> None:
+        self.intent = intent
+        self.patterns = [re.compile(p) for p in patterns]
+        self.entity = entity
+        self.known_symbols = known_symbols
+
+
+class LocalIntentClassifier:
+    """Keyword, regex and symbol-lexicon classifier with a confidence score."""
+
+    def __init__(
+        self,
+        intents: Optional[dict] = None,
+        symbols: Optional[Dict[str, List[str]]] = None,
+        threshold: float = LOCAL_INTENT_THRESHOLD,
+        name: str = "local_classifier",
+    ) -> None:
+        self.threshold = threshold
+        self._rules: Dict[str, _Rule] = {}
+        # Кортеж слов -> [("kw", намерение) | ("sym", тикер)]
+        self._lexicon: Dict[Tuple[str, ...], List[Tuple[str, str]]] = {}
+        self._aliases: Dict[str, str] = {}
+        self._max_phrase = 1
+
+        self.calls = 0
+        self.hits = 0
+        self.fallbacks = 0
+        self.misses = 0
+        self.hits_by_intent: Dict[str, int] = {}
+        self.total_us = 0.0
+
+        self.load(
+            intents if intents is not None else _load_json(INTENTS_FILE),
+            symbols if symbols is not None else _load_json(SYMBOLS_FILE),
+        )
+        register_metrics(name, self.stats)
+
+    def load(self, intents: dict, symbols: Dict[str, List[str]]) -> None:
+        self._rules.clear()
+        self._lexicon.clear()
+        self._aliases.clear()
+        for intent, spec in intents.items():
+            if not isinstance(spec, dict):
+                continue
+            keywords = spec.get("keywords", [])
+            patterns = spec.get("patterns", [])
+            if not keywords and not patterns:
+                continue
+            intent = intent.upper()
+            self._rules[intent] = _Rule(intent, patterns, spec.get("entity"), bool(spec.get("known_symbols")))
+            for keyword in keywords:
+                self._add_phrase(keyword, ("kw", intent))
+        for symbol, aliases in symbols.items():
+            symbol = symbol.upper()
+            for alias in [symbol, *aliases]:
+                self._add_phrase(alias, ("sym", symbol))
+                words = normalize(alias)
+                if len(words) == 1:
+                    self._aliases[words[0]] = symbol
+        logger.info(f"Локальный классификатор: правил {len(self._rules)}, монет {len(symbols)}")
+
+    def _add_phrase(self, phrase: str, entry: Tuple[str, str]) -> None:
+        words = tuple(normalize(phrase))
+        if not words:
+            return
+        entries = self._lexicon.setdefault(words, [])
+        if entry not in entries:
+            entries.append(entry)
+        self._max_phrase = max(self._max_phrase, len(words))
+
+    def resolve_symbol(self, word: str, known_only: bool = False) -> Optional[str]:
+        """Тикер по слову из словаря или сам тикер, если он похож на латинский символ.
+
+        С ``known_only`` принимаются только монеты из словаря.
+        """
+        word = word.casefold().replace("ё", "е").lstrip("$")
+        symbol = self._aliases.get(word)
+        if symbol:
+            return symbol
+        if not known_only and word.isascii() and is_valid_symbol(word):
+            return word.upper()
+        return None
+
+    def _scan(self, words: List[str]):
+        """Проходит по словам, выбирая самое длинное совпадение со словарём."""
+        keyword_hits: Dict[str, int] = {}
+        symbols: List[str] = []
+        explained = 0
+        i = 0
+        while i < len(words):
+            for size in range(min(self._max_phrase, len(words) - i), 0, -1):
+                entries = self._lexicon.get(tuple(words[i:i + size]))
+                if entries:
+                    break
+            else:
+                if words[i] in FILLER_WORDS:
+                    explained += 1
+                i += 1
+                continue
+            for kind, value in entries:
+                if kind == "kw":
+                    keyword_hits[value] = keyword_hits.get(value, 0) + 1
+                elif value not in symbols:
+                    symbols.append(value)
+            explained += size
+            i += size
+        return keyword_hits, symbols, explained
+
+    def _entities(self, rule: _Rule, symbols: List[str], text: str) -> Optional[Dict[str, str]]:
+        if rule.entity == "symbols":
+            return {"symbols": ",".join(symbols)} if symbols else None
+        if rule.entity == "symbol":
+            # Несколько монет для обработчика одной монеты — решает LLM
+            return {"symbol": symbols[0]} if len(symbols) == 1 else None
+        if rule.entity == "text":
+            return {"payload": text}
+        return {"payload": ""}
+
+    def predict(self, text: str) -> Optional[LocalIntent]:
+        """Лучшее намерение с уверенностью, даже если она ниже порога."""
+        words = normalize(text)
+        if not words:
+            return None
+        keyword_hits, symbols, explained = self._scan(words)
+        coverage = explained / len(words)
+        joined = " ".join(words)
+
+        candidates: List[LocalIntent] = []
+        by_pattern = set()
+        for rule in self._rules.values():
+            found = symbols
+            confidence = 0.0
+            for pattern in rule.patterns:
+                match = pattern.fullmatch(joined)
+                if match is None:
+                    continue
+                named = match.groupdict().get("symbol")
+                if named is not None:
+                    symbol = self.resolve_symbol(named, known_only=rule.known_symbols)
+                    found = [symbol] if symbol else []
+                confidence = PATTERN_CONFIDENCE
+                break
+            if not confidence and rule.intent in keyword_hits:
+                confidence = coverage
+            if not confidence:
+                continue
+            entities = self._entities(rule, found, text.strip())
+            if entities is None:
+                continue
+            candidates.append(LocalIntent(rule.intent, entities, confidence))
+            if confidence == PATTERN_CONFIDENCE:
+                by_pattern.add(rule.intent)
+
+        if not candidates:
+            return None
+        candidates.sort(key=lambda c: c.confidence, reverse=True)
+        best = candidates[0]
+        # Единственное совпадение шаблона на весь текст сильнее ключевых слов
+        if len(candidates) > 1 and not (best.intent in by_pattern and len(by_pattern) == 1):
+            best.confidence = max(0.0, best.confidence - AMBIGUITY_PENALTY * candidates[1].confidence)
+        return best
+
+    def classify(self, text: str) -> Optional[LocalIntent]:
+        """Результат, если уверенность не ниже порога, иначе ``None`` (нужен LLM)."""
+        started = time.perf_counter()
+        self.calls += 1
+        result = self.predict(text)
+        self.total_us += (time.perf_counter() - started) * 1_000_000
+        if result is None:
+            self.misses += 1
+            return None
+        if result.confidence < self.threshold:
+            self.fallbacks += 1
+            return None
+        self.hits += 1
+        self.hits_by_intent[result.intent] = self.hits_by_intent.get(result.intent, 0) + 1
+        return result
+
+    def stats(self) -> dict:
+        return {
+            "calls": self.calls,
+            "hits": self.hits,
+            "fallbacks": self.fallbacks,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / self.calls, 3) if self.calls else 0.0,
+            "avg_us": round(self.total_us / self.calls, 1) if self.calls else 0.0,
+            "threshold": self.threshold,
+            "hits_by_intent": dict(self.hits_by_intent),
+        }
+
+
+def _load_json(path: str) -> dict:
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except Exception as e:
+        logger.error(f"Не удалось загрузить {path}: {e}")
+        return {}
+
+
+local_classifier = LocalIntentClassifier()
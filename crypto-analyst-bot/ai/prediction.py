@@ -1,7 +1,6 @@
 # ai/prediction.py
 """Simple price prediction utilities."""
 
-import json
 import logging
 from datetime import datetime
 from typing import List, Tuple, Optional
@@ -10,7 +9,7 @@ from telegram import Update, constants
 from telegram.ext import CallbackContext
 from sqlalchemy.ext.asyncio import AsyncSession
 
-from utils.cache import get_cache, set_cache
+from utils.cache import get_or_fetch
 from utils.api_clients import coingecko_client
 from crypto.handler import COIN_ID_MAP, get_coin_ids_from_symbols
 from settings.messages import get_text
@@ -27,18 +26,17 @@ async def _fetch_history(symbol: str, days: int = 30) -> List[Tuple[datetime, fl
     if not coin_id:
         return []
     cache_key = f"hist:{coin_id}:{days}"
-    cached = await get_cache(cache_key)
-    if cached:
-        try:
-            data = json.loads(cached)
-            return [(datetime.fromtimestamp(ts / 1000), price) for ts, price in data]
-        except Exception:
-            pass
-    data = await coingecko_client.get_market_chart(coin_id, days=days)
-    if not data or "prices" not in data:
+
+    async def fetch() -> Optional[list]:
+        data = await coingecko_client.get_market_chart(coin_id, days=days)
+        if not data or "prices" not in data:
+            return None
+        return data["prices"]
+
+    prices = await get_or_fetch(cache_key, fetch, ttl=HISTORY_TTL)
+    if not prices:
         return []
-    await set_cache(cache_key, json.dumps(data["prices"]), ttl=HISTORY_TTL)
-    return [(datetime.fromtimestamp(ts / 1000), price) for ts, price in data["prices"]]
+    return [(datetime.fromtimestamp(ts / 1000), price) for ts, price in prices]
 
 def _linear_regression(points: List[Tuple[float, float]]) -> Tuple[float, float]:
     n = len(points)
@@ -65,21 +63,20 @@ async def get_price_prediction(symbol: str) -> Optional[Tuple[float, float]]:
     """Returns short and long term price prediction for symbol."""
     symbol = symbol.upper()
     cache_key = f"pred:{symbol}"
-    cached = await get_cache(cache_key)
-    if cached:
-        try:
-            val = json.loads(cached)
-            return val.get("short"), val.get("long")
-        except Exception:
-            pass
-    short_hist = await _fetch_history(symbol, days=30)
-    long_hist = await _fetch_history(symbol, days=90)
-    if len(short_hist) < 2 or len(long_hist) < 2:
+
+    async def fetch() -> Optional[dict]:
+        short_hist = await _fetch_history(symbol, days=30)
+        long_hist = await _fetch_history(symbol, days=90)
+        if len(short_hist) < 2 or len(long_hist) < 2:
+            return None
+        short_price = _predict([p for _, p in short_hist], 1)
+        long_price = _predict([p for _, p in long_hist], 7)
+        return {"short": short_price, "long": long_price}
+
+    val = await get_or_fetch(cache_key, fetch, ttl=PREDICTION_TTL)
+    if not val:
         return None
-    short_price = _predict([p for _, p in short_hist], 1)
-    long_price = _predict([p for _, p in long_hist], 7)
-    await set_cache(cache_key, json.dumps({"short": short_price, "long": long_price}), ttl=PREDICTION_TTL)
-    return short_price, long_price
+    return val.get("short"), val.get("long")
 
 async def handle_predict_command(update: Update, context: CallbackContext, payload: str, db_session: AsyncSession):
     """Telegram command handler for /predict."""
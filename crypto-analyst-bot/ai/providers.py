@@ -0,0 +1,249 @@
+# ai/providers.py
+# Выбор LLM-провайдера для каждого обращения.
+#
+# Раньше модули запускали Gemini и OpenAI одновременно и брали первый
+# завершившийся ответ: если он был пустым, остальные уже были отменены, а
+# оплачивались оба запроса. Теперь запрос уходит самому быстрому исправному
+# провайдеру (EWMA задержки по месту вызова с поправкой на долю ошибок).
+# Второй провайдер получает страховочный запрос, только если первый не
+# ответил за p95 своей задержки, или сразу, если первый вернул ошибку.
+# Побеждает первый успешный результат. Повторяющиеся ошибки размыкают
+# автоматический выключатель провайдера (utils/circuit_breaker.py).
+# Ответы из llm_cache провайдера не вызывали, поэтому не входят ни в
+# задержку, ни в статистику ошибок.
+
+import asyncio
+import logging
+import os
+import time
+from collections import deque
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+
+from ai.llm_cache import served_from_cache
+from utils.circuit_breaker import CircuitBreaker
+from utils.runtime_metrics import register_metrics
+
+logger = logging.getLogger(__name__)
+
+LLM_HEDGE = os.getenv("LLM_HEDGE", "on").lower() not in ("off", "0", "false")
+LLM_HEDGE_DEFAULT_MS = float(os.getenv("LLM_HEDGE_DEFAULT_MS", "1500"))
+LLM_HEDGE_MIN_MS = float(os.getenv("LLM_HEDGE_MIN_MS", "200"))
+LLM_HEDGE_QUANTILE = float(os.getenv("LLM_HEDGE_QUANTILE", "0.95"))
+LLM_EWMA_ALPHA = float(os.getenv("LLM_EWMA_ALPHA", "0.2"))
+LLM_BREAKER_FAILURES = int(os.getenv("LLM_BREAKER_FAILURES", "5"))
+LLM_BREAKER_RESET = float(os.getenv("LLM_BREAKER_RESET", "30"))
+
+# Длинные ответы: пока нет замеров, страховка не должна удваивать их стоимость
+SITE_HEDGE_DEFAULT_MS = {"chat": 5000.0, "analysis": 20000.0}
+
+LATENCY_WINDOW = 200
+# До стольких замеров задержка страховки — LLM_HEDGE_DEFAULT_MS
+MIN_SAMPLES = 10
+# Во сколько раз доля ошибок 100% ухудшает оценку провайдера
+ERROR_PENALTY = 4.0
+
+Call = Callable[[], Awaitable[Any]]
+
+
+class SiteLatency:
+    """Latency of one provider at one call site: EWMA plus a sample window."""
+
+    __slots__ = ("ewma_ms", "samples", "successes", "failures", "invalid", "cancelled", "cached")
+
+    def __init__(self) -> None:
+        self.ewma_ms: Optional[float] = None
+        self.samples: deque = deque(maxlen=LATENCY_WINDOW)
+        self.successes = 0
+        self.failures = 0
+        self.invalid = 0
+        self.cancelled = 0
+        self.cached = 0
+
+    def observe(self, ms: float, alpha: float) -> None:
+        self.samples.append(ms)
+        self.ewma_ms = ms if self.ewma_ms is None else alpha * ms + (1 - alpha) * self.ewma_ms
+
+    def quantile(self, q: float) -> Optional[float]:
+        if len(self.samples) < MIN_SAMPLES:
+            return None
+        ordered = sorted(self.samples)
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+    def stats(self) -> dict:
+        p95 = self.quantile(0.95)
+        return {
+            "ewma_ms": round(self.ewma_ms, 1) if self.ewma_ms is not None else None,
+            "p95_ms": round(p95, 1) if p95 is not None else None,
+            "successes": self.successes,
+            "failures": self.failures,
+            "invalid": self.invalid,
+            "cancelled": self.cancelled,
+            "cached": self.cached,
+        }
+
+
+class ProviderHealth:
+    """Error rate and circuit breaker of one provider across call sites."""
+
+    def __init__(self, name: str, alpha: float) -> None:
+        self.name = name
+        self.alpha = alpha
+        self.error_rate = 0.0
+        self.breaker = CircuitBreaker(LLM_BREAKER_FAILURES, LLM_BREAKER_RESET)
+        self.sites: Dict[str, SiteLatency] = {}
+
+    def site(self, site: str) -> SiteLatency:
+        latency = self.sites.get(site)
+        if latency is None:
+            latency = self.sites[site] = SiteLatency()
+        return latency
+
+    def success(self, site: str, ms: float) -> None:
+        latency = self.site(site)
+        latency.successes += 1
+        latency.observe(ms, self.alpha)
+        self.error_rate = (1 - self.alpha) * self.error_rate
+        self.breaker.record_success()
+
+    def failure(self, site: str) -> None:
+        self.site(site).failures += 1
+        self.error_rate = self.alpha + (1 - self.alpha) * self.error_rate
+        self.breaker.record_failure()
+        if self.breaker.state == "open":
+            logger.warning(f"LLM-провайдер {self.name} временно отключён после ошибок подряд: {self.breaker.failures}")
+
+    def score(self, site: str) -> float:
+        ewma = self.site(site).ewma_ms
+        # Провайдер без замеров пробуется первым, чтобы замеры появились у всех
+        return (ewma or 0.0) * (1 + ERROR_PENALTY * self.error_rate)
+
+
+class ProviderRouter:
+    """Routes a call to the fastest healthy provider with p95-delayed hedging."""
+
+    def __init__(self, hedge: bool = LLM_HEDGE, alpha: float = LLM_EWMA_ALPHA, name: str = "llm_providers") -> None:
+        self.hedge = hedge
+        self.alpha = alpha
+        self._providers: Dict[str, ProviderHealth] = {}
+        self.calls = 0
+        self.hedged = 0
+        self.failovers = 0
+        self.exhausted = 0
+        register_metrics(name, self.stats)
+
+    def provider(self, name: str) -> ProviderHealth:
+        health = self._providers.get(name)
+        if health is None:
+            health = self._providers[name] = ProviderHealth(name, self.alpha)
+        return health
+
+    def hedge_delay(self, site: str, name: str) -> float:
+        """Сколько ждать основного провайдера до страховочного запроса, секунды."""
+        p = self.provider(name).site(site).quantile(LLM_HEDGE_QUANTILE)
+        if p is None:
+            p = SITE_HEDGE_DEFAULT_MS.get(site, LLM_HEDGE_DEFAULT_MS)
+        return max(LLM_HEDGE_MIN_MS, p) / 1000
+
+    async def _attempt(self, site: str, name: str, call: Call, accept) -> Tuple[bool, Any]:
+        health = self.provider(name)
+        started = time.perf_counter()
+        # Задача попытки своя, поэтому флаг не виден другим вызовам
+        served_from_cache.set(False)
+        try:
+            value = await call()
+        except asyncio.CancelledError:
+            health.site(site).cancelled += 1
+            health.breaker.release()
+            raise
+        except Exception as e:
+            logger.warning(f"{name} ({site}) завершился ошибкой: {e}")
+            value = None
+        if value is None:
+            health.failure(site)
+            return False, None
+        if served_from_cache.get():
+            health.site(site).cached += 1
+            health.breaker.release()
+        else:
+            health.success(site, (time.perf_counter() - started) * 1000)
+        if accept is not None:
+            value = accept(value)
+            if value is None:
+                # Провайдер ответил, но ответ не подошёл — пробуем следующего
+                health.site(site).invalid += 1
+                return False, None
+        return True, value
+
+    async def first_success(
+        self,
+        site: str,
+        calls: Dict[str, Call],
+        accept: Optional[Callable[[Any], Any]] = None,
+    ) -> Optional[Any]:
+        """Результат первого успешного провайдера или ``None``.
+
+        ``calls`` — функции без аргументов по имени провайдера, в порядке
+        предпочтения; ``None`` или исключение считаются ошибкой. ``accept``
+        может отбраковать или преобразовать ответ.
+        """
+        self.calls += 1
+        queue = sorted(calls, key=lambda n: self.provider(n).score(site))
+        pending: Dict[asyncio.Task, str] = {}
+        primary: Optional[str] = None
+
+        def launch_next() -> bool:
+            nonlocal primary
+            while queue:
+                name = queue.pop(0)
+                if not self.provider(name).breaker.allow():
+                    continue
+                task = asyncio.create_task(self._attempt(site, name, calls[name], accept))
+                pending[task] = name
+                primary = name
+                return True
+            return False
+
+        launch_next()
+        try:
+            while pending:
+                timeout = self.hedge_delay(site, primary) if self.hedge and queue else None
+                done, _ = await asyncio.wait(pending, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    if launch_next():
+                        self.hedged += 1
+                    continue
+                failed = False
+                for task in done:
+                    pending.pop(task)
+                    ok, value = task.result()
+                    if ok:
+                        return value
+                    failed = True
+                if failed and launch_next():
+                    self.failovers += 1
+        finally:
+            for task in pending:
+                task.cancel()
+            if pending:
+                await asyncio.gather(*pending, return_exceptions=True)
+        self.exhausted += 1
+        return None
+
+    def stats(self) -> dict:
+        return {
+            "calls": self.calls,
+            "hedged": self.hedged,
+            "failovers": self.failovers,
+            "exhausted": self.exhausted,
+            "providers": {
+                name: {
+                    **health.breaker.stats(),
+                    "error_rate": round(health.error_rate, 3),
+                    "sites": {site: latency.stats() for site, latency in health.sites.items()},
+                }
+                for name, health in self._providers.items()
+            },
+        }
+
+
+llm_router = ProviderRouter()
@@ -21,11 +21,11 @@ async def generate_recommendations(session: AsyncSession, user_id: int) -> list[
     course_purchases = await db_ops.list_user_course_purchases(session, user_id)
     purchased_course_ids = {p.course_id for p in course_purchases}
 
-    subscription = await db_ops.get_subscription(session, user_id)
-    if subscription and subscription.is_active and subscription.next_payment:
-        days_left = (subscription.next_payment - datetime.now(timezone.utc)).days
+    profile = await db_ops.get_user_profile(session, user_id)
+    if profile and profile.subscription_active and profile.next_payment:
+        days_left = (profile.next_payment - datetime.now(timezone.utc)).days
         if days_left <= 5:
-            recs.append(("renew", subscription.next_payment.strftime("%Y-%m-%d")))
+            recs.append(("renew", profile.next_payment.strftime("%Y-%m-%d")))
     elif usage.get("message_count", 0) >= 20:
         recs.append(("subscribe", None))
 
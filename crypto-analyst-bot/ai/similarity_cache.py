@@ -0,0 +1,286 @@
+# ai/similarity_cache.py
+# Кэш ответов общего чата на почти одинаковые вопросы.
+#
+# Вопросы вроде «что такое стейкинг» и «Что такое стейкинг?» отличаются
+# только регистром, пунктуацией или парой слов, но каждый раньше шёл в LLM
+# с temperature=0.7. Текст нормализуется и разбивается на символьные
+# n-граммы; по ним считается MinHash-сигнатура, а LSH-индекс (полосы
+# сигнатуры) даёт кандидатов без перебора всего кэша. Ответ кандидата
+# отдаётся, если коэффициент Жаккара n-грамм не ниже
+# CHAT_SIMILARITY_THRESHOLD и вопросы не расходятся в значимых словах:
+# числах («layer 1» и «layer 2»), тикерах («pos» и «pow») и отрицаниях
+# («мне грустно» и «мне не грустно»). У коротких вопросов такие пары
+# набирают высокое сходство n-грамм, хотя ответы на них разные. Вопросы,
+# ссылающиеся на историю диалога («а он?», «помнишь…»), не кэшируются и не
+# ищутся. Записи живут CHAT_SIMILARITY_TTL секунд, число записей
+# ограничено (LRU).
+
+import hashlib
+import logging
+import os
+import random
+import re
+import time
+from collections import OrderedDict
+from typing import Callable, Dict, FrozenSet, List, Optional, Set, Tuple
+
+from utils.runtime_metrics import register_metrics
+
+logger = logging.getLogger(__name__)
+
+CHAT_SIMILARITY_CACHE = os.getenv("CHAT_SIMILARITY_CACHE", "on").lower() not in ("off", "0", "false")
+CHAT_SIMILARITY_THRESHOLD = float(os.getenv("CHAT_SIMILARITY_THRESHOLD", "0.8"))
+CHAT_SIMILARITY_TTL = int(os.getenv("CHAT_SIMILARITY_TTL", "3600"))
+CHAT_SIMILARITY_SIZE = int(os.getenv("CHAT_SIMILARITY_SIZE", "2000"))
+CHAT_SIMILARITY_NGRAM = int(os.getenv("CHAT_SIMILARITY_NGRAM", "3"))
+# Длинные сообщения почти не повторяются и часто личные — их не кэшируем
+CHAT_SIMILARITY_MAX_CHARS = int(os.getenv("CHAT_SIMILARITY_MAX_CHARS", "200"))
+
+# 16 полос по 4 строки: пара с Жаккаром 0.8 становится кандидатом с
+# вероятностью ~0.999, с Жаккаром 0.3 — ~0.12
+LSH_BANDS = 16
+LSH_ROWS = 4
+_PRIME = (1 << 61) - 1
+
+# Слова, по которым видно, что вопрос опирается на предыдущие сообщения;
+# «а …», «и …» в начале — уточнение к прошлому ответу
+CONTEXT_MARKERS = re.compile(
+    r"^(а|и|но|and|but|so)\b|\b("
+    r"это|этот|эта|эти|этого|этой|этим|тот|та|те|того|той|"
+    r"он|она|оно|они|его|ее|их|ему|ей|им|него|нее|них|ним|ними|нем|ней|нему|"
+    r"там|тут|выше|ранее|раньше|прошл\w*|предыдущ\w*|помнишь|напомни|"
+    r"еще|тоже|также|опять|снова|продолжи|подробнее|"
+    r"it|its|this|that|these|those|he|she|they|them|his|her|their|"
+    r"above|earlier|previous|again|remember"
+    r")\b"
+)
+
+_NON_WORD = re.compile(r"[^\w\s]")
+
+NEGATIONS = frozenset("не нет ни без not no never without".split())
+# Короткие латинские слова, которые не тикеры
+COMMON_WORDS = frozenset(
+    """
+    a an the is are was be do does did how what why who when where which
+    to of in on at for by and or vs with from can should will my your
+    """.split()
+)
+_TICKER = re.compile(r"[a-z]{2,6}")
+
+
+def normalize_question(text: str) -> str:
+    """Нижний регистр, ё→е, без пунктуации и лишних пробелов."""
+    text = text.lower().replace("ё", "е")
+    return " ".join(_NON_WORD.sub(" ", text).split())
+
+
+def references_context(normalized: str) -> bool:
+    return CONTEXT_MARKERS.search(normalized) is not None
+
+
+def is_key_word(word: str) -> bool:
+    """Слово, от которого зависит ответ: число, тикер или отрицание."""
+    if word in NEGATIONS or any(ch.isdigit() for ch in word):
+        return True
+    return _TICKER.fullmatch(word) is not None and word not in COMMON_WORDS
+
+
+def key_words_differ(a: FrozenSet[str], b: FrozenSet[str]) -> bool:
+    return any(is_key_word(word) for word in a ^ b)
+
+
+def shingles(normalized: str, n: int = CHAT_SIMILARITY_NGRAM) -> FrozenSet[str]:
+    if len(normalized) <= n:
+        return frozenset([normalized])
+    return frozenset(normalized[i:i + n] for i in range(len(normalized) - n + 1))
+
+
+def jaccard(a: FrozenSet[str], b: FrozenSet[str]) -> float:
+    if not a or not b:
+        return 0.0
+    return len(a & b) / len(a | b)
+
+
+def _shingle_hash(shingle: str) -> int:
+    # hash() строк зависит от PYTHONHASHSEED, поэтому стабильный blake2b
+    return int.from_bytes(hashlib.blake2b(shingle.encode("utf-8"), digest_size=8).digest(), "big")
+
+
+class MinHasher:
+    """MinHash signatures from universal hashes ``(a*x + b) mod p``."""
+
+    def __init__(self, permutations: int = LSH_BANDS * LSH_ROWS, seed: int = 1) -> None:
+        rng = random.Random(seed)
+        self.params = [(rng.randrange(1, _PRIME), rng.randrange(0, _PRIME)) for _ in range(permutations)]
+
+    def signature(self, items: FrozenSet[str]) -> Tuple[int, ...]:
+        hashes = [_shingle_hash(item) for item in items]
+        return tuple(min((a * h + b) % _PRIME for h in hashes) for a, b in self.params)
+
+
+class _Entry:
+    __slots__ = ("lang", "words", "shingles", "signature", "answer", "expires_at", "latency_ms")
+
+    def __init__(self, lang, words, shingles, signature, answer, expires_at, latency_ms):
+        self.lang = lang
+        self.words = words
+        self.shingles = shingles
+        self.signature = signature
+        self.answer = answer
+        self.expires_at = expires_at
+        self.latency_ms = latency_ms
+
+
+class SimilarityCache:
+    """Process-local MinHash/LSH cache of answers to context-free questions."""
+
+    def __init__(
+        self,
+        threshold: float = CHAT_SIMILARITY_THRESHOLD,
+        ttl: float = CHAT_SIMILARITY_TTL,
+        max_size: int = CHAT_SIMILARITY_SIZE,
+        enabled: bool = CHAT_SIMILARITY_CACHE,
+        clock: Callable[[], float] = time.monotonic,
+        name: str = "chat_similarity_cache",
+    ) -> None:
+        self.threshold = threshold
+        self.ttl = ttl
+        self.max_size = max_size
+        self.enabled = enabled
+        self._clock = clock
+        self._hasher = MinHasher()
+        self._entries: "OrderedDict[int, _Entry]" = OrderedDict()
+        self._buckets: Dict[Tuple[int, Tuple[int, ...]], Set[int]] = {}
+        self._next_id = 0
+
+        self.lookups = 0
+        self.hits = 0
+        self.skipped = 0
+        self.word_mismatches = 0
+        self.stores = 0
+        self.evictions = 0
+        self.expired = 0
+        self.saved_ms = 0.0
+        register_metrics(name, self.stats)
+
+    def cacheable(self, question: str) -> bool:
+        """Вопрос без ссылок на историю диалога и не слишком длинный."""
+        normalized = normalize_question(question)
+        ok = bool(normalized) and len(normalized) <= CHAT_SIMILARITY_MAX_CHARS and not references_context(normalized)
+        if not ok:
+            self.skipped += 1
+        return ok
+
+    def get(self, question: str, lang: str = "ru") -> Optional[str]:
+        if not self.enabled:
+            return None
+        self.lookups += 1
+        normalized = normalize_question(question)
+        words = frozenset(normalized.split())
+        items = shingles(normalized)
+        signature = self._hasher.signature(items)
+        now = self._clock()
+        best_id, best_score = None, 0.0
+        mismatched = False
+        for entry_id in self._candidates(signature):
+            entry = self._entries.get(entry_id)
+            if entry is None or entry.lang != lang:
+                continue
+            if entry.expires_at <= now:
+                self._remove(entry_id)
+                self.expired += 1
+                continue
+            score = jaccard(items, entry.shingles)
+            if score <= best_score:
+                continue
+            if score >= self.threshold and key_words_differ(words, entry.words):
+                mismatched = True
+                continue
+            best_id, best_score = entry_id, score
+        if best_id is None or best_score < self.threshold:
+            if mismatched:
+                self.word_mismatches += 1
+            return None
+        entry = self._entries[best_id]
+        self._entries.move_to_end(best_id)
+        self.hits += 1
+        self.saved_ms += entry.latency_ms
+        logger.debug(f"Ответ на похожий вопрос из кэша (сходство {best_score:.2f})")
+        return entry.answer
+
+    def put(self, question: str, answer: str, lang: str = "ru", latency_ms: float = 0.0) -> None:
+        """Запоминает ответ; ``latency_ms`` — сколько занял запрос к провайдеру."""
+        if not self.enabled or not answer:
+            return
+        normalized = normalize_question(question)
+        words = frozenset(normalized.split())
+        items = shingles(normalized)
+        signature = self._hasher.signature(items)
+        # Почти такой же вопрос уже есть — обновляем его, а не дублируем
+        for entry_id in self._candidates(signature):
+            entry = self._entries.get(entry_id)
+            if (
+                entry is not None
+                and entry.lang == lang
+                and jaccard(items, entry.shingles) >= self.threshold
+                and not key_words_differ(words, entry.words)
+            ):
+                self._remove(entry_id)
+        entry_id = self._next_id
+        self._next_id += 1
+        self._entries[entry_id] = _Entry(
+            lang, words, items, signature, answer, self._clock() + self.ttl, latency_ms
+        )
+        for band in self._bands(signature):
+            self._buckets.setdefault(band, set()).add(entry_id)
+        self.stores += 1
+        while len(self._entries) > self.max_size:
+            oldest = next(iter(self._entries))
+            self._remove(oldest)
+            self.evictions += 1
+
+    def _candidates(self, signature: Tuple[int, ...]) -> List[int]:
+        found: Set[int] = set()
+        for band in self._bands(signature):
+            found |= self._buckets.get(band, set())
+        return list(found)
+
+    @staticmethod
+    def _bands(signature: Tuple[int, ...]):
+        for i in range(LSH_BANDS):
+            yield i, signature[i * LSH_ROWS:(i + 1) * LSH_ROWS]
+
+    def _remove(self, entry_id: int) -> None:
+        entry = self._entries.pop(entry_id, None)
+        if entry is None:
+            return
+        for band in self._bands(entry.signature):
+            bucket = self._buckets.get(band)
+            if bucket is not None:
+                bucket.discard(entry_id)
+                if not bucket:
+                    del self._buckets[band]
+
+    def clear(self) -> None:
+        self._entries.clear()
+        self._buckets.clear()
+
+    def stats(self) -> dict:
+        return {
+            "enabled": self.enabled,
+            "threshold": self.threshold,
+            "size": len(self._entries),
+            "lookups": self.lookups,
+            "hits": self.hits,
+            "hit_rate": round(self.hits / self.lookups, 3) if self.lookups else 0.0,
+            "skipped_context": self.skipped,
+            "word_mismatches": self.word_mismatches,
+            "stores": self.stores,
+            "evictions": self.evictions,
+            "expired": self.expired,
+            "saved_provider_ms": round(self.saved_ms, 1),
+            "avg_saved_ms": round(self.saved_ms / self.hits, 1) if self.hits else 0.0,
+        }
+
+
+similarity_cache = SimilarityCache()
@@ -0,0 +1,205 @@
+# ai/streaming.py
+# Потоковые ответы LLM в Telegram.
+#
+# Ответ провайдера читается по мере генерации (SSE у Gemini и OpenAI).
+# Первый фрагмент отправляется сообщением сразу, дальше сообщение
+# дополняется через edit_message_text не чаще раза в
+# CHAT_STREAM_EDIT_INTERVAL секунд и только если добавилось хотя бы
+# CHAT_STREAM_MIN_CHARS символов, чтобы не упираться в лимиты Telegram на
+# редактирование. Промежуточный текст показывается без разметки (Markdown
+# может быть незакрыт), итоговый — с Markdown.
+
+import asyncio
+import json
+import logging
+import os
+import time
+from typing import Any, AsyncContextManager, AsyncIterator, Callable, Dict, Optional, Tuple
+
+from telegram import constants
+
+from ai.providers import llm_router
+from utils.runtime_metrics import register_metrics
+
+logger = logging.getLogger(__name__)
+
+CHAT_STREAMING = os.getenv("CHAT_STREAMING", "on").lower() not in ("off", "0", "false")
+CHAT_STREAM_EDIT_INTERVAL = float(os.getenv("CHAT_STREAM_EDIT_INTERVAL", "1.0"))
+CHAT_STREAM_MIN_CHARS = int(os.getenv("CHAT_STREAM_MIN_CHARS", "30"))
+
+TELEGRAM_TEXT_LIMIT = 4096
+CURSOR = " ▌"
+
+# Открывает потоковый запрос и достаёт текст из одного SSE-события
+StreamSpec = Tuple[Callable[[], AsyncContextManager[Any]], Callable[[dict], str]]
+
+_stream_stats: Dict[str, float] = {
+    "streams": 0,
+    "completed": 0,
+    "interrupted": 0,
+    "failovers": 0,
+    "not_started": 0,
+    "edits": 0,
+    "edit_errors": 0,
+    "first_chunk_ms_total": 0.0,
+}
+
+
+def stream_stats() -> dict:
+    started = _stream_stats["streams"] - _stream_stats["not_started"]
+    stats = {key: value for key, value in _stream_stats.items() if key != "first_chunk_ms_total"}
+    stats["avg_first_chunk_ms"] = round(_stream_stats["first_chunk_ms_total"] / started, 1) if started else 0.0
+    return stats
+
+
+register_metrics("chat_streaming", stream_stats)
+
+
+async def sse_events(response) -> AsyncIterator[dict]:
+    """JSON-события из потока ``data: ...`` (Server-Sent Events)."""
+    async for line in response.aiter_lines():
+        if not line.startswith("data:"):
+            continue
+        data = line[5:].strip()
+        if not data or data == "[DONE]":
+            continue
+        try:
+            yield json.loads(data)
+        except ValueError:
+            logger.debug(f"Пропущено неразобранное SSE-событие: {data[:100]}")
+
+
+def gemini_delta(event: dict) -> str:
+    parts = (event.get("candidates") or [{}])[0].get("content", {}).get("parts") or []
+    return "".join(part.get("text", "") for part in parts)
+
+
+def openai_delta(event: dict) -> str:
+    choices = event.get("choices") or [{}]
+    return (choices[0].get("delta") or {}).get("content") or ""
+
+
+class StreamingReply:
+    """Telegram reply that grows as chunks arrive, with throttled edits."""
+
+    def __init__(
+        self,
+        message,
+        bot,
+        interval: float = CHAT_STREAM_EDIT_INTERVAL,
+        min_chars: int = CHAT_STREAM_MIN_CHARS,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        self.message = message
+        self.bot = bot
+        self.interval = interval
+        self.min_chars = min_chars
+        self._clock = clock
+        self.text = ""
+        self.sent = None
+        # Ответ получен полностью, без обрыва потока
+        self.complete = False
+        self._shown = ""
+        self._last_edit = 0.0
+
+    async def push(self, chunk: str) -> None:
+        self.text += chunk
+        if self.sent is None:
+            if self.text.strip():
+                self._shown = self._visible(self.text.strip())
+                self.sent = await self.message.reply_text(self._shown + CURSOR)
+                self._last_edit = self._clock()
+            return
+        now = self._clock()
+        if now - self._last_edit < self.interval or len(self.text) - len(self._shown) < self.min_chars:
+            return
+        await self._edit(self._visible(self.text.rstrip()), CURSOR)
+
+    async def finish(self) -> str:
+        """Итоговый текст с Markdown; при ошибке разметки — без неё."""
+        final = self.text.strip()
+        if self.sent is None or not final:
+            return final
+        try:
+            await self.bot.edit_message_text(
+                chat_id=self.sent.chat_id,
+                message_id=self.sent.message_id,
+                text=self._visible(final),
+                parse_mode=constants.ParseMode.MARKDOWN,
+            )
+            _stream_stats["edits"] += 1
+        except Exception as e:
+            logger.debug(f"Итоговый текст не принят с Markdown: {e}")
+            await self._edit(self._visible(final), "")
+        return final
+
+    async def _edit(self, text: str, suffix: str) -> None:
+        self._last_edit = self._clock()
+        try:
+            await self.bot.edit_message_text(chat_id=self.sent.chat_id, message_id=self.sent.message_id, text=text + suffix)
+            self._shown = text
+            _stream_stats["edits"] += 1
+        except Exception as e:
+            _stream_stats["edit_errors"] += 1
+            # RetryAfter: откладываем следующую правку на указанное время
+            self._last_edit += float(getattr(e, "retry_after", 0) or 0)
+            logger.debug(f"Не удалось обновить потоковое сообщение: {e}")
+
+    @staticmethod
+    def _visible(text: str) -> str:
+        limit = TELEGRAM_TEXT_LIMIT - len(CURSOR)
+        return text if len(text) <= limit else text[:limit - 1] + "…"
+
+
+async def stream_reply(site: str, streams: Dict[str, StreamSpec], reply: StreamingReply) -> Optional[str]:
+    """Потоковый ответ самого быстрого исправного провайдера.
+
+    Пока пользователю ничего не показано, ошибка провайдера переключает на
+    следующего. После первого показанного фрагмента провайдер не меняется:
+    при обрыве остаётся полученная часть. ``None`` — ответа нет, можно
+    запросить его обычным способом.
+    """
+    _stream_stats["streams"] += 1
+    order = sorted(streams, key=lambda name: llm_router.provider(name).score(site))
+    for attempt, name in enumerate(order):
+        health = llm_router.provider(name)
+        if not health.breaker.allow():
+            continue
+        if attempt:
+            _stream_stats["failovers"] += 1
+        open_stream, delta = streams[name]
+        started = time.perf_counter()
+        first_chunk = False
+        try:
+            async with open_stream() as response:
+                response.raise_for_status()
+                async for event in sse_events(response):
+                    chunk = delta(event)
+                    if not chunk:
+                        continue
+                    if not first_chunk:
+                        first_chunk = True
+                        ms = (time.perf_counter() - started) * 1000
+                        _stream_stats["first_chunk_ms_total"] += ms
+                        # Для потоков важна задержка до первого фрагмента
+                        health.success(site, ms)
+                    await reply.push(chunk)
+        except asyncio.CancelledError:
+            health.breaker.release()
+            raise
+        except Exception as e:
+            logger.warning(f"Потоковый ответ {name} ({site}) прерван: {e}")
+            health.failure(site)
+            if reply.sent is not None:
+                _stream_stats["interrupted"] += 1
+                return reply.text.strip() or None
+            reply.text = ""
+            continue
+        if reply.text.strip():
+            _stream_stats["completed"] += 1
+            reply.complete = True
+            return reply.text.strip()
+        if not first_chunk:
+            health.failure(site)
+    _stream_stats["not_started"] += 1
+    return None
@@ -0,0 +1,226 @@
+# ai/summarizer.py
+# Скользящее резюме диалога для промпта общего чата.
+#
+# В промпт раньше попадали 10 последних сообщений целиком, включая длинные
+# ответы бота (отчёты анализа, списки новостей). Теперь у диалога есть
+# резюме (dialogs.summary): когда сообщения после summary_until превышают
+# DIALOG_SUMMARY_BUDGET токенов, все, кроме последних
+# DIALOG_SUMMARY_RECENT_TURNS, дописываются в резюме отдельным запросом к LLM.
+# Обновление идёт в фоне после ответа пользователю. В промпт попадают резюме
+# и ещё не пересказанные реплики, каждая не длиннее DIALOG_SUMMARY_TURN_CHARS.
+
+import asyncio
+import logging
+import os
+import time
+from typing import Dict, Iterable, List, Optional, Set
+
+from dotenv import load_dotenv
+
+from ai import llm_gateway
+from ai.providers import llm_router
+from database import operations as db_ops
+from utils.runtime_metrics import register_metrics
+
+logger = logging.getLogger(__name__)
+load_dotenv()
+
+GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
+GEMINI_API_URL = f"https://generativelanguage.googleapis.com/v1beta/models/gemini-1.5-flash-latest:generateContent?key={GEMINI_API_KEY}"
+OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
+OPENAI_API_URL = "https://api.openai.com/v1/chat/completions"
+OPENAI_MODEL = os.getenv("OPENAI_GPT_MODEL", "gpt-4o-mini")
+
+DIALOG_SUMMARY = os.getenv("DIALOG_SUMMARY", "on").lower() not in ("off", "0", "false")
+DIALOG_SUMMARY_BUDGET = int(os.getenv("DIALOG_SUMMARY_BUDGET", "800"))
+DIALOG_SUMMARY_RECENT_TURNS = int(os.getenv("DIALOG_SUMMARY_RECENT_TURNS", "4"))
+DIALOG_SUMMARY_TURN_CHARS = int(os.getenv("DIALOG_SUMMARY_TURN_CHARS", "400"))
+DIALOG_SUMMARY_MAX_CHARS = int(os.getenv("DIALOG_SUMMARY_MAX_CHARS", "1500"))
+
+# Символов на токен для грубой оценки без токенизатора
+CHARS_PER_TOKEN = 4
+# Длинные ответы бота в запросе на резюме тоже укорачиваются
+SUMMARY_INPUT_TURN_CHARS = 1500
+
+SUMMARY_PROMPT = """
+Ты ведёшь краткое резюме диалога пользователя с крипто-ботом.
+Обнови резюме, добавив в него новые сообщения. Сохрани важное: монеты,
+суммы, цели и предпочтения пользователя, договорённости и вопросы без ответа.
+Не пересказывай отчёты и списки новостей дословно — только выводы.
+Пиши по-русски, не длиннее {max_chars} символов, без вступлений.
+
+ТЕКУЩЕЕ РЕЗЮМЕ:
+{summary}
+
+НОВЫЕ СООБЩЕНИЯ:
+{turns}
+
+ОБНОВЛЁННОЕ РЕЗЮМЕ:
+"""
+
+
+def estimate_tokens(text: str) -> int:
+    return len(text) // CHARS_PER_TOKEN + 1
+
+
+def shorten(text: str, limit: int) -> str:
+    text = " ".join(text.split())
+    return text if len(text) <= limit else text[: limit - 1].rstrip() + "…"
+
+
+def format_turns(turns: Iterable, limit: Optional[int] = DIALOG_SUMMARY_TURN_CHARS) -> str:
+    """Реплики в формате промпта; ``limit=None`` — без укорачивания."""
+    return "\n".join(
+        f"{'Ты' if turn.role == 'model' else 'Пользователь'}: "
+        f"{turn.message_text if limit is None else shorten(turn.message_text, limit)}"
+        for turn in turns
+    )
+
+
+class DialogSummarizer:
+    """Builds compact prompt history and folds old turns into a dialog summary."""
+
+    def __init__(self, session_factory=None, enabled: bool = DIALOG_SUMMARY, name: str = "dialog_summary") -> None:
+        self._session_factory = session_factory
+        self.enabled = enabled
+        self._running: Set[int] = set()
+        self._tasks: Set[asyncio.Task] = set()
+
+        self.prompts = 0
+        self.prompt_tokens = 0
+        self.raw_tokens = 0
+        self.updates = 0
+        self.failures = 0
+        self.update_ms = 0.0
+        register_metrics(name, self.stats)
+
+    def _factory(self):
+        if self._session_factory is None:
+            from database.engine import AsyncSessionFactory
+
+            self._session_factory = AsyncSessionFactory
+        return self._session_factory
+
+    def prompt_history(self, dialog, turns: List) -> str:
+        """История для промпта: резюме диалога и укороченные реплики после него."""
+        if not turns and not getattr(dialog, "summary", None):
+            return "Нет предыдущих сообщений."
+        # Столько заняла бы история без резюме и укорачивания реплик
+        raw_tokens = estimate_tokens(format_turns(turns, limit=None))
+        summary = getattr(dialog, "summary", None)
+        until = getattr(dialog, "summary_until", None)
+        if summary and until is not None:
+            # Сообщения до summary_until уже пересказаны в резюме
+            turns = [t for t in turns if t.timestamp is None or _after(t.timestamp, until)]
+        recent = format_turns(turns)
+        text = f"Краткое содержание предыдущей беседы: {summary}\n{recent}".rstrip() if summary else recent
+        self.prompts += 1
+        self.raw_tokens += raw_tokens
+        self.prompt_tokens += estimate_tokens(text)
+        return text or "Нет предыдущих сообщений."
+
+    def schedule(self, dialog_id: Optional[int]) -> None:
+        """Проверяет бюджет и обновляет резюме в фоне, не задерживая ответ."""
+        if not self.enabled or dialog_id is None or dialog_id in self._running:
+            return
+        self._running.add(dialog_id)
+        task = asyncio.create_task(self._run(dialog_id), name=f"dialog-summary-{dialog_id}")
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _run(self, dialog_id: int) -> None:
+        try:
+            async with self._factory()() as session:
+                await self.update(session, dialog_id)
+        except Exception as e:
+            self.failures += 1
+            logger.warning(f"Не удалось обновить резюме диалога {dialog_id}: {e}")
+        finally:
+            self._running.discard(dialog_id)
+
+    async def update(self, session, dialog_id: int) -> bool:
+        """Дописывает старые сообщения в резюме, если они превысили бюджет."""
+        dialog = await db_ops.get_dialog(session, dialog_id)
+        if dialog is None:
+            return False
+        rows = await db_ops.get_dialog_messages(session, dialog_id, after=dialog.summary_until)
+        if sum(estimate_tokens(row.message_text) for row in rows) <= DIALOG_SUMMARY_BUDGET:
+            return False
+        fold = rows[:-DIALOG_SUMMARY_RECENT_TURNS] if DIALOG_SUMMARY_RECENT_TURNS > 0 else rows
+        if not fold:
+            return False
+        started = time.perf_counter()
+        summary = await summarize(dialog.summary, fold)
+        if not summary:
+            self.failures += 1
+            return False
+        await db_ops.update_dialog(
+            session,
+            dialog_id,
+            summary=shorten(summary, DIALOG_SUMMARY_MAX_CHARS),
+            summary_until=fold[-1].timestamp,
+        )
+        self.updates += 1
+        self.update_ms += (time.perf_counter() - started) * 1000
+        logger.info(f"Резюме диалога {dialog_id} обновлено: +{len(fold)} сообщений")
+        return True
+
+    async def stop(self) -> None:
+        for task in list(self._tasks):
+            task.cancel()
+        if self._tasks:
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+
+    def stats(self) -> dict:
+        return {
+            "enabled": self.enabled,
+            "prompts": self.prompts,
+            "avg_prompt_history_tokens": round(self.prompt_tokens / self.prompts, 1) if self.prompts else 0.0,
+            "avg_raw_history_tokens": round(self.raw_tokens / self.prompts, 1) if self.prompts else 0.0,
+            "updates": self.updates,
+            "failures": self.failures,
+            "avg_update_ms": round(self.update_ms / self.updates, 1) if self.updates else 0.0,
+            "running": len(self._running),
+        }
+
+
+def _after(ts, until) -> bool:
+    # Сообщения из буфера и из БД могут отличаться наличием часового пояса
+    if (ts.tzinfo is None) != (until.tzinfo is None):
+        ts = ts.replace(tzinfo=None)
+        until = until.replace(tzinfo=None)
+    return ts > until
+
+
+async def summarize(summary: Optional[str], turns: List) -> Optional[str]:
+    prompt = SUMMARY_PROMPT.format(
+        max_chars=DIALOG_SUMMARY_MAX_CHARS,
+        summary=summary or "нет",
+        turns=format_turns(turns, SUMMARY_INPUT_TURN_CHARS),
+    )
+
+    async def _gemini_call() -> str | None:
+        headers = {"Content-Type": "application/json"}
+        payload = {"contents": [{"parts": [{"text": prompt}]}], "generationConfig": {"temperature": 0.2, "maxOutputTokens": 512}}
+        response = await llm_gateway.post("gemini", GEMINI_API_URL, json=payload, headers=headers, timeout=30.0)
+        response.raise_for_status()
+        data = response.json()
+        return data["candidates"][0]["content"]["parts"][0]["text"].strip() or None
+
+    async def _openai_call() -> str | None:
+        headers = {"Authorization": f"Bearer {OPENAI_API_KEY}", "Content-Type": "application/json"}
+        payload = {"model": OPENAI_MODEL, "messages": [{"role": "user", "content": prompt}], "temperature": 0.2, "max_tokens": 512}
+        resp = await llm_gateway.post("openai", OPENAI_API_URL, json=payload, headers=headers, timeout=30.0)
+        resp.raise_for_status()
+        data = resp.json()
+        return data["choices"][0]["message"]["content"].strip() or None
+
+    calls: Dict = {}
+    if GEMINI_API_KEY:
+        calls["gemini"] = _gemini_call
+    if OPENAI_API_KEY:
+        calls["openai"] = _openai_call
+    return await llm_router.first_success("summary", calls) if calls else None
+
+
+dialog_summarizer = DialogSummarizer()
@@ -4,7 +4,6 @@
 import logging
 import json
 import os
-import httpx
 import asyncio
 import time
 import tempfile
@@ -16,6 +15,8 @@ from telegram import Update, constants
 from telegram.ext import CallbackContext
 from sqlalchemy.ext.asyncio import AsyncSession
 
+from ai import llm_gateway
+from ai.providers import llm_router
 from database import operations as db_ops
 from settings.messages import get_text
 from utils.api_clients import coingecko_client
@@ -72,7 +73,7 @@ async def _generate_summary(prompt: str, symbol: str, db_session: AsyncSession |
         prompt += "\nАктуальные новости:\n```json\n" + json.dumps(news, ensure_ascii=False, indent=2) + "\n```"
         if db_session:
             await db_ops.add_news_articles(db_session, symbol, news)
-    if OPENAI_API_KEY:
+    async def _openai_call() -> str | None:
         headers = {
             "Authorization": f"Bearer {OPENAI_API_KEY}",
             "Content-Type": "application/json",
@@ -82,22 +83,32 @@ async def _generate_summary(prompt: str, symbol: str, db_session: AsyncSession |
             "messages": [{"role": "user", "content": prompt}],
             "temperature": 0.5,
         }
-        async with httpx.AsyncClient(timeout=40.0) as client:
-            resp = await client.post(OPENAI_API_URL, json=payload, headers=headers)
-            resp.raise_for_status()
-            data = resp.json()
-            return data["choices"][0]["message"]["content"].strip()
-    else:
+        resp = await llm_gateway.post("openai", OPENAI_API_URL, json=payload, headers=headers, timeout=40.0)
+        resp.raise_for_status()
+        data = resp.json()
+        return data["choices"][0]["message"]["content"].strip() or None
+
+    async def _gemini_call() -> str | None:
         headers = {"Content-Type": "application/json"}
         api_payload = {
             "contents": [{"parts": [{"text": prompt}]}],
             "generationConfig": {"temperature": 0.5, "maxOutputTokens": 2048},
         }
-        async with httpx.AsyncClient(timeout=40.0) as client:
-            response = await client.post(GEMINI_API_URL, json=api_payload, headers=headers)
-            response.raise_for_status()
-            data = response.json()
-            return data["candidates"][0]["content"]["parts"][0]["text"].strip()
+        response = await llm_gateway.post("gemini", GEMINI_API_URL, json=api_payload, headers=headers, timeout=40.0)
+        response.raise_for_status()
+        data = response.json()
+        return data["candidates"][0]["content"]["parts"][0]["text"].strip() or None
+
+    # OpenAI остаётся предпочтительным, пока о задержках ничего не известно
+    calls = {}
+    if OPENAI_API_KEY:
+        calls["openai"] = _openai_call
+    if GEMINI_API_KEY:
+        calls["gemini"] = _gemini_call
+    text = await llm_router.first_success("analysis", calls)
+    if not text:
+        raise RuntimeError("Ни один LLM-провайдер не вернул анализ")
+    return text
 
 async def _fetch_price_history(symbol: str) -> list[tuple[str, float]]:
     coin_id = await coingecko_client.search_coin(symbol)
@@ -197,10 +208,11 @@ async def handle_token_analysis(update: Update, context: CallbackContext, payloa
     )
 
     if extended:
-        subscription = await db_ops.get_subscription(db_session, user_id)
-        premium = subscription and subscription.is_active and subscription.level == 'premium'
+        profile = await db_ops.get_user_profile(db_session, user_id)
+        premium = profile and profile.is_premium
         if not premium:
-            balance = await db_ops.get_star_balance(db_session, user_id)
+            # Окончательная проверка баланса — в deduct_stars при списании
+            balance = profile.stars_balance if profile else 0
             if balance < EXTENDED_ANALYSIS_PRICE:
                 await update.effective_message.reply_text(
                     get_text(lang, 'analysis_premium_insufficient', price=EXTENDED_ANALYSIS_PRICE)
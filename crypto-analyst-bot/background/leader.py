@@ -0,0 +1,268 @@
+# background/leader.py
+# Выбор лидера среди воркеров uvicorn.
+#
+# При запуске с --workers N каждый процесс выполняет startup_event. Задачи
+# планировщика, регистрация вебхука и long polling должны работать ровно в
+# одном процессе, иначе алерты и дайджесты уходят N раз, а CoinGecko получает
+# N-кратную нагрузку. Лидер определяется через advisory lock Postgres
+# (блокировка живёт, пока открыто соединение) или через аренду в Redis
+# (SET NX PX с продлением). Остальные воркеры периодически пытаются взять
+# блокировку, поэтому при падении лидера его роль автоматически переходит к
+# другому процессу.
+
+import asyncio
+import logging
+import os
+import uuid
+from typing import Awaitable, Callable, Optional
+
+from utils.runtime_metrics import register_metrics
+
+logger = logging.getLogger(__name__)
+
+LEADER_BACKEND = os.getenv("LEADER_BACKEND", "postgres").lower()
+LEADER_LOCK_KEY = int(os.getenv("LEADER_LOCK_KEY", "720311"))
+LEADER_LEASE_TTL = float(os.getenv("LEADER_LEASE_TTL", "15"))
+LEADER_RENEW_INTERVAL = float(os.getenv("LEADER_RENEW_INTERVAL", "5"))
+LEADER_RETRY_INTERVAL = float(os.getenv("LEADER_RETRY_INTERVAL", "5"))
+
+Callback = Callable[[], Awaitable[None]]
+
+
+class NoopLeaderBackend:
+    """Без координации: процесс всегда лидер (один воркер)."""
+
+    name = "none"
+
+    async def acquire(self) -> bool:
+        return True
+
+    async def renew(self) -> bool:
+        return True
+
+    async def release(self) -> None:
+        pass
+
+
+class PostgresLeaderBackend:
+    """Сессионный ``pg_try_advisory_lock`` на выделенном соединении."""
+
+    name = "postgres"
+
+    def __init__(self, lock_key: int = LEADER_LOCK_KEY, engine=None) -> None:
+        self.lock_key = lock_key
+        self._engine = engine
+        self._conn = None
+
+    async def acquire(self) -> bool:
+        from sqlalchemy import text
+
+        if self._engine is None:
+            from database.engine import engine
+
+            self._engine = engine
+        conn = await self._engine.connect()
+        try:
+            result = await conn.execute(text("SELECT pg_try_advisory_lock(:key)"), {"key": self.lock_key})
+            acquired = bool(result.scalar())
+            # Блокировка сессионная — транзакцию не держим открытой
+            await conn.commit()
+        except Exception:
+            await conn.close()
+            raise
+        if not acquired:
+            await conn.close()
+            return False
+        self._conn = conn
+        return True
+
+    async def renew(self) -> bool:
+        """Проверяет, что соединение с блокировкой живо."""
+        from sqlalchemy import text
+
+        if self._conn is None:
+            return False
+        try:
+            await self._conn.execute(text("SELECT 1"))
+            await self._conn.commit()
+            return True
+        except Exception as e:
+            logger.warning(f"Соединение с advisory lock потеряно: {e}")
+            await self._close()
+            return False
+
+    async def release(self) -> None:
+        from sqlalchemy import text
+
+        if self._conn is None:
+            return
+        try:
+            await self._conn.execute(text("SELECT pg_advisory_unlock(:key)"), {"key": self.lock_key})
+            await self._conn.commit()
+        except Exception as e:
+            logger.warning(f"Не удалось снять advisory lock: {e}")
+        await self._close()
+
+    async def _close(self) -> None:
+        conn, self._conn = self._conn, None
+        if conn is not None:
+            try:
+                await conn.close()
+            except Exception:
+                pass
+
+
+class RedisLeaderBackend:
+    """Аренда ключа в Redis с продлением только владельцем."""
+
+    name = "redis"
+
+    # Продлить/удалить ключ можно, только если он всё ещё наш
+    RENEW_SCRIPT = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    return redis.call('pexpire', KEYS[1], ARGV[2])
+end
+return 0
+"""
+    RELEASE_SCRIPT = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    return redis.call('del', KEYS[1])
+end
+return 0
+"""
+
+    def __init__(self, key: str = "leader:scheduler", ttl: float = LEADER_LEASE_TTL, client=None) -> None:
+        self.key = key
+        self.ttl_ms = int(ttl * 1000)
+        self.token = f"{os.getpid()}:{uuid.uuid4().hex}"
+        self._client = client
+
+    @property
+    def client(self):
+        if self._client is None:
+            from utils.cache import redis_client
+
+            if redis_client is None:
+                raise RuntimeError("redis-py не установлен")
+            self._client = redis_client
+        return self._client
+
+    async def acquire(self) -> bool:
+        return bool(await self.client.set(self.key, self.token, px=self.ttl_ms, nx=True))
+
+    async def renew(self) -> bool:
+        return bool(await self.client.eval(self.RENEW_SCRIPT, 1, self.key, self.token, self.ttl_ms))
+
+    async def release(self) -> None:
+        try:
+            await self.client.eval(self.RELEASE_SCRIPT, 1, self.key, self.token)
+        except Exception as e:
+            logger.warning(f"Не удалось освободить аренду лидера: {e}")
+
+
+def make_leader_backend(backend: str = LEADER_BACKEND):
+    """Создаёт бэкенд выбора лидера: postgres | redis | none."""
+    if backend == "redis":
+        return RedisLeaderBackend()
+    if backend == "none":
+        return NoopLeaderBackend()
+    if backend != "postgres":
+        logger.warning(f"Неизвестный бэкенд выбора лидера '{backend}', используется 'postgres'.")
+    return PostgresLeaderBackend()
+
+
+class LeaderElector:
+    """Keeps trying to become leader and runs callbacks on role changes."""
+
+    def __init__(
+        self,
+        backend=None,
+        on_elected: Optional[Callback] = None,
+        on_demoted: Optional[Callback] = None,
+        renew_interval: float = LEADER_RENEW_INTERVAL,
+        retry_interval: float = LEADER_RETRY_INTERVAL,
+        name: str = "leader",
+    ) -> None:
+        self._backend = backend or make_leader_backend()
+        self._on_elected = on_elected
+        self._on_demoted = on_demoted
+        self.renew_interval = renew_interval
+        self.retry_interval = retry_interval
+        self.is_leader = False
+        self._task: Optional[asyncio.Task] = None
+
+        self.elections = 0
+        self.demotions = 0
+        self.errors = 0
+
+        register_metrics(name, self.stats)
+
+    async def start(self) -> None:
+        """Делает первую попытку сразу и запускает фоновый цикл."""
+        if self._task is not None:
+            return
+        await self._tick()
+        self._task = asyncio.create_task(self._run(), name="leader-elector")
+
+    async def stop(self) -> None:
+        """Останавливает цикл, снимает роль лидера и освобождает блокировку."""
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        if self.is_leader:
+            await self._demote("остановка процесса")
+        else:
+            await self._backend.release()
+
+    async def _tick(self) -> None:
+        try:
+            if self.is_leader:
+                if not await self._backend.renew():
+                    await self._demote("аренда потеряна")
+            elif await self._backend.acquire():
+                await self._promote()
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            self.errors += 1
+            logger.error(f"Ошибка выбора лидера ({self._backend.name}): {e!r}")
+            if self.is_leader:
+                # Не уверены, что блокировка ещё наша, — безопаснее отступить
+                await self._demote("ошибка бэкенда")
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(self.renew_interval if self.is_leader else self.retry_interval)
+            await self._tick()
+
+    async def _promote(self) -> None:
+        self.is_leader = True
+        self.elections += 1
+        logger.info(f"Процесс {os.getpid()} стал лидером ({self._backend.name}).")
+        if self._on_elected is not None:
+            try:
+                await self._on_elected()
+            except Exception as e:
+                logger.error(f"Ошибка при вступлении в роль лидера: {e!r}", exc_info=True)
+
+    async def _demote(self, reason: str) -> None:
+        self.is_leader = False
+        self.demotions += 1
+        logger.warning(f"Процесс {os.getpid()} больше не лидер: {reason}.")
+        if self._on_demoted is not None:
+            try:
+                await self._on_demoted()
+            except Exception as e:
+                logger.error(f"Ошибка при снятии роли лидера: {e!r}", exc_info=True)
+        await self._backend.release()
+
+    def stats(self) -> dict:
+        return {
+            "backend": self._backend.name,
+            "is_leader": self.is_leader,
+            "pid": os.getpid(),
+            "elections": self.elections,
+            "demotions": self.demotions,
+            "errors": self.errors,
+        }
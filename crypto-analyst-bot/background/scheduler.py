@@ -71,7 +71,7 @@ async def check_price_alerts():
                 if triggered:
                     logger.info(f"Алерт {alert.id} сработал! User: {alert.user_id}, Symbol: {alert.coin_symbol}, Price: {current_price}")
                     
-                    user = await db_ops.get_user(session, alert.user_id)
+                    user = await db_ops.get_user_profile(session, alert.user_id)
                     lang = user.language if user else 'ru'
                     if lang == 'ru':
                         direction_text = 'достигла или превысила' if alert.direction.value == 'above' else 'опустилась до или ниже'
@@ -141,7 +141,7 @@ async def check_subscriptions():
                             try:
                                 await tg_bot.unban_chat_member(PRIVATE_CHANNEL_ID, sub.user_id)
                                 invite = await tg_bot.export_chat_invite_link(PRIVATE_CHANNEL_ID)
-                                user = await db_ops.get_user(session, sub.user_id)
+                                user = await db_ops.get_user_profile(session, sub.user_id)
                                 lang = user.language if user else "ru"
                                 msg = get_text(lang, "subscription_access_granted", link=invite)
                                 send_url = f"https://api.telegram.org/bot{TELEGRAM_BOT_TOKEN}/sendMessage"
@@ -160,7 +160,7 @@ async def check_subscriptions():
                                 await tg_bot.ban_chat_member(PRIVATE_CHANNEL_ID, sub.user_id)
                             except Exception:
                                 pass
-                            user = await db_ops.get_user(session, sub.user_id)
+                            user = await db_ops.get_user_profile(session, sub.user_id)
                             lang = user.language if user else "ru"
                             msg = get_text(lang, "subscription_reminder")
                             send_url = f"https://api.telegram.org/bot{TELEGRAM_BOT_TOKEN}/sendMessage"
@@ -208,7 +208,7 @@ async def send_premarket_digest():
                 )
 
             for sub in subs:
-                user = await db_ops.get_user(session, sub.user_id)
+                user = await db_ops.get_user_profile(session, sub.user_id)
                 lang = user.language if user else 'ru'
                 msg = get_text(lang, 'premarket_digest_header') + "\n" + "\n".join(lines)
                 send_url = f"https://api.telegram.org/bot{TELEGRAM_BOT_TOKEN}/sendMessage"
@@ -265,7 +265,7 @@ async def send_subscription_reminder(user_id: int):
     if not TELEGRAM_BOT_TOKEN:
         return
     async with AsyncSessionFactory() as session:
-        user = await db_ops.get_user(session, user_id)
+        user = await db_ops.get_user_profile(session, user_id)
         if not user:
             return
         lang = user.language
@@ -301,10 +301,18 @@ def schedule_subscription_reminder(user_id: int, next_payment: datetime):
 # --- Управление планировщиком ---
 scheduler = AsyncIOScheduler(timezone="UTC")
 
-def start_scheduler(bot: Bot):
-    """Запускает планировщик фоновых задач."""
-    global tg_bot
-    tg_bot = bot
+# Периодические задачи выполняются только в процессе-лидере (см. background/leader.py)
+PERIODIC_JOB_IDS = (
+    'price_check_job',
+    'subscription_check_job',
+    'premarket_digest_job',
+    'admin_report_job',
+    'prediction_update_job',
+)
+
+
+def start_periodic_jobs():
+    """Регистрирует периодические задачи. Вызывается только лидером."""
     scheduler.add_job(check_price_alerts, 'interval', seconds=60, id='price_check_job', replace_existing=True)
     scheduler.add_job(
         check_subscriptions,
@@ -334,6 +342,28 @@ def start_scheduler(bot: Bot):
         id='prediction_update_job',
         replace_existing=True,
     )
+    logger.info("Периодические задачи зарегистрированы.")
+
+
+def stop_periodic_jobs():
+    """Снимает периодические задачи при потере лидерства."""
+    for job_id in PERIODIC_JOB_IDS:
+        if scheduler.get_job(job_id):
+            scheduler.remove_job(job_id)
+    logger.info("Периодические задачи сняты.")
+
+
+def start_scheduler(bot: Bot, periodic: bool = True):
+    """Запускает планировщик фоновых задач.
+
+    Разовые задачи (напоминания о подписке) планируются в любом воркере,
+    поэтому планировщик запускается везде; ``periodic=False`` оставляет
+    регистрацию периодических задач лидеру.
+    """
+    global tg_bot
+    tg_bot = bot
+    if periodic:
+        start_periodic_jobs()
     if not scheduler.running:
         scheduler.start()
         logger.info("Планировщик успешно запущен.")
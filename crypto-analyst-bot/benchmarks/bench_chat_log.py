@@ -0,0 +1,119 @@
+# benchmarks/bench_chat_log.py
+# Запись истории чата: прямая (INSERT + UPDATE users + commit на каждое
+# сообщение и UPDATE на каждое update_chat_message) против отложенной
+# пакетной записи через database.chat_log.ChatLogWriter.
+#
+# Каждое «сообщение» — как в handle_update: реплика пользователя, два
+# update_chat_message (request_type/entities и duration_ms) и ответ бота.
+# По умолчанию временный файл SQLite (нужен aiosqlite); --url для Postgres.
+#
+# Запуск из каталога crypto-analyst-bot:
+#     python benchmarks/bench_chat_log.py [--users 20] [--messages 25] [--rtt-ms 1]
+
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import time
+import types
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import event, func, select  # noqa: E402
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine  # noqa: E402
+from sqlalchemy.orm import sessionmaker  # noqa: E402
+
+from database import chat_log  # noqa: E402
+from database import operations as db_ops  # noqa: E402
+from database.models import Base, ChatHistory  # noqa: E402
+
+
+class Counter:
+    def __init__(self, engine, rtt: float) -> None:
+        self.statements = 0
+        self.commits = 0
+
+        @event.listens_for(engine.sync_engine, "before_cursor_execute")
+        def _statement(*args):
+            self.statements += 1
+            if rtt:
+                time.sleep(rtt)
+
+        @event.listens_for(engine.sync_engine, "commit")
+        def _commit(*args):
+            self.commits += 1
+            if rtt:
+                time.sleep(rtt)
+
+
+async def conversation(factory, tg_user, messages):
+    for i in range(messages):
+        async with factory() as session:
+            ctx = await db_ops.load_request_context(session, tg_user)
+            msg = await db_ops.add_chat_message(
+                session=session, user_id=tg_user.id, role="user", text=f"цена BTC {i}", dialog_id=ctx.dialog.id
+            )
+            await db_ops.update_chat_message(session, msg, request_type="CRYPTO_INFO", entities="{'coin': 'BTC'}")
+            await db_ops.add_chat_message(session=session, user_id=tg_user.id, role="model", text=f"*BTC* {i}")
+            await db_ops.update_chat_message(session, msg, duration_ms=42)
+
+
+async def run(mode, url, users, messages, rtt):
+    if url is None:
+        # У каждого соединения своя база :memory:, поэтому — файл
+        url = f"sqlite+aiosqlite:///{tempfile.mkdtemp()}/chat_log.db"
+    engine = create_async_engine(url)
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    factory = sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
+    tg_users = [
+        types.SimpleNamespace(id=5000 + n, username=f"{mode}{n}", first_name="Иван", last_name=None)
+        for n in range(users)
+    ]
+    # Пользователи и диалоги создаются до замера
+    for tg_user in tg_users:
+        async with factory() as session:
+            await db_ops.load_request_context(session, tg_user)
+
+    writer = chat_log.ChatLogWriter(session_factory=factory, name=f"bench_chat_log_{mode}")
+    db_ops.chat_log_writer = writer
+    if mode == "buffered":
+        writer._task = asyncio.create_task(writer._run())
+    counter = Counter(engine, rtt)
+    started = time.perf_counter()
+    await asyncio.gather(*(conversation(factory, u, messages) for u in tg_users))
+    await writer.stop()
+    elapsed = time.perf_counter() - started
+
+    async with factory() as session:
+        rows = (await session.execute(select(func.count()).select_from(ChatHistory))).scalar_one()
+        missing = (
+            await session.execute(
+                select(func.count()).select_from(ChatHistory).where(
+                    ChatHistory.role == "user", ChatHistory.duration_ms.is_(None)
+                )
+            )
+        ).scalar_one()
+    await engine.dispose()
+    total = users * messages
+    return counter.statements / total, counter.commits / total, elapsed / total * 1000, rows, missing
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--url", default=None)
+    parser.add_argument("--users", type=int, default=20)
+    parser.add_argument("--messages", type=int, default=25)
+    parser.add_argument("--rtt-ms", type=float, default=0.0)
+    args = parser.parse_args()
+
+    print(f"{args.url or 'sqlite (временный файл)'}, {args.users}×{args.messages} сообщений, RTT {args.rtt_ms} мс")
+    print(f"{'режим':<10}{'запросов':>10}{'commit':>8}{'мс/сообщение':>15}{'строк':>8}{'без duration':>14}")
+    for mode in ("direct", "buffered"):
+        statements, commits, ms, rows, missing = await run(mode, args.url, args.users, args.messages, args.rtt_ms / 1000)
+        print(f"{mode:<10}{statements:>10.2f}{commits:>8.2f}{ms:>15.2f}{rows:>8}{missing:>14}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
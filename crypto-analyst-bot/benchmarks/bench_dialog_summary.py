@@ -0,0 +1,51 @@
+# benchmarks/bench_dialog_summary.py
+# Размер истории в промпте общего чата (ai/summarizer.py) для длинного
+# диалога: 10 последних сообщений целиком против резюме и укороченных реплик.
+#
+# Запуск из каталога crypto-analyst-bot:
+#     python benchmarks/bench_dialog_summary.py [--turns 10] [--report-chars 3000]
+
+import argparse
+import os
+import sys
+import types
+from datetime import datetime, timedelta, timezone
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from ai.summarizer import DialogSummarizer, estimate_tokens, format_turns  # noqa: E402
+
+SUMMARY = (
+    "Пользователь держит BTC и ETH, интересуется мемкоинами (PEPE, WIF), "
+    "просил анализ PEPE и новости по ETF; предпочитает краткие ответы."
+)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--turns", type=int, default=10, help="сообщений в истории промпта")
+    parser.add_argument("--report-chars", type=int, default=3000, help="длина ответа бота (отчёт, новости)")
+    args = parser.parse_args()
+
+    start = datetime.now(timezone.utc)
+    turns = [
+        types.SimpleNamespace(
+            role="model" if i % 2 else "user",
+            message_text=("Отчёт по токену. " * (args.report_chars // 17)) if i % 2 else f"что скажешь про монету {i}?",
+            timestamp=start + timedelta(minutes=i),
+        )
+        for i in range(args.turns)
+    ]
+    # Резюме покрывает всё, кроме последних четырёх реплик
+    dialog = types.SimpleNamespace(summary=SUMMARY, summary_until=turns[-5].timestamp)
+
+    raw = estimate_tokens(format_turns(turns, limit=None))
+    no_summary = estimate_tokens(DialogSummarizer(name="bench_no_summary").prompt_history(None, turns))
+    compact = estimate_tokens(DialogSummarizer(name="bench_summary").prompt_history(dialog, turns))
+    print(f"как раньше:              ~{raw:>6} токенов")
+    print(f"укороченные реплики:     ~{no_summary:>6} токенов ({no_summary / raw:.0%})")
+    print(f"резюме + 4 реплики:      ~{compact:>6} токенов ({compact / raw:.0%})")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,110 @@
+# benchmarks/bench_local_classifier.py
+# Локальный классификатор намерений на размеченной выборке запросов:
+# доля запросов, решённых без LLM, точность этих решений, время одного
+# вызова и ожидаемое время до ответа при заданной задержке LLM.
+#
+# Для запросов, которые должен решить LLM, ожидаемое намерение — None.
+# Без локального решения сообщение ждёт classify_intent и extract_entities,
+# то есть два обращения к LLM.
+#
+# Запуск из каталога crypto-analyst-bot:
+#     python benchmarks/bench_local_classifier.py [--llm-ms 800] [--threshold 0.8] [--number 2000]
+
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from ai.local_classifier import LocalIntentClassifier  # noqa: E402
+
+SAMPLES = [
+    ("цена btc", "CRYPTO_INFO"),
+    ("Цена BTC и ETH?", "CRYPTO_INFO"),
+    ("btc price", "CRYPTO_INFO"),
+    ("почём эфир", "CRYPTO_INFO"),
+    ("курс тон сегодня", "CRYPTO_INFO"),
+    ("сколько стоит солана", "CRYPTO_INFO"),
+    ("price of bitcoin", "CRYPTO_INFO"),
+    ("sol", "CRYPTO_INFO"),
+    ("$pepe", "CRYPTO_INFO"),
+    ("курс биткоина", "CRYPTO_INFO"),
+    ("новости eth", "CRYPTO_NEWS"),
+    ("news solana", "CRYPTO_NEWS"),
+    ("новости по биткоину", "CRYPTO_NEWS"),
+    ("прогноз sol", "PRICE_PREDICTION"),
+    ("btc forecast", "PRICE_PREDICTION"),
+    ("где купить догикоин", "WHERE_TO_BUY"),
+    ("where to buy ton", "WHERE_TO_BUY"),
+    ("добавь рипл в портфель", "TRACK_COIN"),
+    ("add link", "TRACK_COIN"),
+    ("удали кардано", "UNTRACK_COIN"),
+    ("мой портфель", "PORTFOLIO_SUMMARY"),
+    ("покажи портфель", "PORTFOLIO_SUMMARY"),
+    ("мои алерты", "MANAGE_ALERTS"),
+    ("defi фермы", "DEFI_FARM"),
+    ("depin проекты", "DEPIN_PROJECTS"),
+    ("премаркет", "PREMARKET_SCAN"),
+    ("привет", "GENERAL_CHAT"),
+    ("спасибо!", "GENERAL_CHAT"),
+    ("hello", "GENERAL_CHAT"),
+    ("что ты умеешь?", "BOT_HELP"),
+    ("оформить подписку", "SUBSCRIPTION"),
+    # Дальше — запросы для LLM
+    ("почему упал биткоин вчера", None),
+    ("алерт на биток 120000", None),
+    ("что такое дао", None),
+    ("сделай анализ токена 0x6982508145454ce325ddbe47a25d4ec3d2311933", None),
+    ("новости", None),
+    ("привет, какая цена btc и стоит ли покупать", None),
+    ("новости и цена btc", None),
+    ("стоит ли сейчас входить в эфир или подождать коррекции", None),
+    ("расскажи про nft коллекцию bored ape", None),
+    ("купить курс по трейдингу", None),
+    ("как мне настроить уведомления о цене sol выше 200", None),
+    ("track it", None),
+    ("add more", None),
+    ("remove ads", None),
+]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--llm-ms", type=float, default=800.0, help="задержка одного обращения к LLM")
+    parser.add_argument("--threshold", type=float, default=0.8)
+    parser.add_argument("--number", type=int, default=2000, help="повторов выборки для замера времени")
+    args = parser.parse_args()
+
+    clf = LocalIntentClassifier(threshold=args.threshold, name="bench_local_classifier")
+    hits = correct = wrong_llm = 0
+    for text, expected in SAMPLES:
+        result = clf.classify(text)
+        if result is None:
+            if expected is not None:
+                wrong_llm += 1
+            continue
+        hits += 1
+        if result.intent == expected:
+            correct += 1
+        else:
+            print(f"  ошибка: {text!r} -> {result.intent}, ожидалось {expected}")
+
+    started = time.perf_counter()
+    for _ in range(args.number):
+        for text, _ in SAMPLES:
+            clf.predict(text)
+    per_call_us = (time.perf_counter() - started) / (args.number * len(SAMPLES)) * 1_000_000
+
+    total = len(SAMPLES)
+    baseline_ms = 2 * args.llm_ms
+    expected_ms = (hits * per_call_us / 1000 + (total - hits) * (baseline_ms + per_call_us / 1000)) / total
+    print(f"запросов {total}, порог {args.threshold}")
+    print(f"решено локально    {hits:>6} ({hits / total:.0%}), верно {correct}/{hits}")
+    print(f"ушло в LLM зря     {wrong_llm:>6}")
+    print(f"время вызова       {per_call_us:>6.1f} мкс")
+    print(f"среднее до ответа  {baseline_ms:>6.0f} мс -> {expected_ms:.0f} мс (LLM {args.llm_ms:.0f} мс на вызов)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,42 @@
+# benchmarks/bench_price_renderer.py
+# Время локального оформления ответа /simple/price (crypto/price_renderer.py)
+# в сравнении с заданной задержкой LLM-форматтера.
+#
+# Запуск из каталога crypto-analyst-bot:
+#     python benchmarks/bench_price_renderer.py [--coins 3] [--llm-ms 1200] [--number 20000]
+
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from crypto.price_renderer import render_prices  # noqa: E402
+
+QUOTE = {
+    "usd": 65000.12,
+    "usd_market_cap": 1280000000000,
+    "usd_24h_vol": 35000000000,
+    "usd_24h_change": -2.5,
+}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--coins", type=int, default=3, help="монет в одном ответе")
+    parser.add_argument("--llm-ms", type=float, default=1200.0, help="задержка LLM-форматтера")
+    parser.add_argument("--number", type=int, default=20000)
+    args = parser.parse_args()
+
+    price_data = {f"coin-{i}": dict(QUOTE) for i in range(args.coins)}
+    for lang in ("ru", "en"):
+        started = time.perf_counter()
+        for _ in range(args.number):
+            render_prices(price_data, "USD", lang)
+        per_call_us = (time.perf_counter() - started) / args.number * 1_000_000
+        print(f"{lang}: {per_call_us:>7.1f} мкс на ответ из {args.coins} монет (LLM {args.llm_ms:.0f} мс)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,106 @@
+# benchmarks/bench_request_context.py
+# Сколько обращений к БД делает начало handle_update: прежняя цепочка
+# get_or_create_user → get_subscription → count_user_messages_today →
+# start_dialog → add_chat_message против load_request_context → add_chat_message.
+#
+# Считаются SQL-запросы и commit на одно сообщение существующего пользователя.
+# По умолчанию используется SQLite в памяти (нужен aiosqlite); для замера на
+# Postgres передайте --url postgresql+asyncpg://... (таблицы создаются сами).
+# --rtt-ms добавляет задержку к каждому запросу, имитируя сеть до БД.
+#
+# Запуск из каталога crypto-analyst-bot:
+#     python benchmarks/bench_request_context.py [--messages 200] [--rtt-ms 1]
+
+import argparse
+import asyncio
+import os
+import sys
+import time
+import types
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import event  # noqa: E402
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine  # noqa: E402
+from sqlalchemy.orm import sessionmaker  # noqa: E402
+
+from database import operations as db_ops  # noqa: E402
+from database.models import Base  # noqa: E402
+
+
+class Counter:
+    def __init__(self, rtt: float) -> None:
+        self.rtt = rtt
+        self.statements = 0
+        self.commits = 0
+
+    def attach(self, engine) -> None:
+        @event.listens_for(engine.sync_engine, "before_cursor_execute")
+        def _statement(*args):
+            self.statements += 1
+            if self.rtt:
+                time.sleep(self.rtt)
+
+        @event.listens_for(engine.sync_engine, "commit")
+        def _commit(*args):
+            self.commits += 1
+            if self.rtt:
+                time.sleep(self.rtt)
+
+    def reset(self) -> None:
+        self.statements = 0
+        self.commits = 0
+
+
+async def legacy_flow(session, tg_user, text):
+    """Начало handle_update до перехода на load_request_context."""
+    await db_ops.get_or_create_user(session=session, tg_user=tg_user)
+    await db_ops.get_subscription(session, tg_user.id)
+    await db_ops.count_user_messages_today(session, tg_user.id)
+    dialog = await db_ops.start_dialog(session, tg_user.id)
+    await db_ops.add_chat_message(session=session, user_id=tg_user.id, role="user", text=text, dialog_id=dialog.id)
+
+
+async def context_flow(session, tg_user, text):
+    ctx = await db_ops.load_request_context(session, tg_user)
+    await db_ops.add_chat_message(session=session, user_id=tg_user.id, role="user", text=text, dialog_id=ctx.dialog.id)
+
+
+async def run(flow, factory, counter, messages, user_id):
+    tg_user = types.SimpleNamespace(id=user_id, username=f"user{user_id}", first_name="Иван", last_name=None)
+    # Первое сообщение создаёт пользователя и диалог — в замер не входит
+    async with factory() as session:
+        await flow(session, tg_user, "start")
+    counter.reset()
+    started = time.perf_counter()
+    for i in range(messages):
+        async with factory() as session:
+            await flow(session, tg_user, f"сообщение {i}")
+    elapsed = time.perf_counter() - started
+    return counter.statements / messages, counter.commits / messages, elapsed / messages * 1000
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--url", default="sqlite+aiosqlite:///:memory:")
+    parser.add_argument("--messages", type=int, default=200)
+    parser.add_argument("--rtt-ms", type=float, default=0.0)
+    args = parser.parse_args()
+
+    engine = create_async_engine(args.url)
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    factory = sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
+    counter = Counter(args.rtt_ms / 1000)
+    counter.attach(engine)
+
+    print(f"{args.url}, {args.messages} сообщений, RTT {args.rtt_ms} мс")
+    print(f"{'вариант':<22}{'запросов':>10}{'commit':>8}{'мс/сообщение':>15}")
+    for name, flow, user_id in (("legacy", legacy_flow, 1001), ("load_request_context", context_flow, 1002)):
+        statements, commits, ms = await run(flow, factory, counter, args.messages, user_id)
+        print(f"{name:<22}{statements:>10.1f}{commits:>8.1f}{ms:>15.2f}")
+    await engine.dispose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,73 @@
+# benchmarks/bench_update_parser.py
+# Микробенчмарк разбора тела webhook: прежний разбор через str/regex
+# против updates.parser.parse_updates (bytes, orjson при наличии).
+#
+# Запуск из каталога crypto-analyst-bot:
+#     python benchmarks/bench_update_parser.py [--number 20000]
+
+import argparse
+import json
+import os
+import re
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from updates.parser import JSON_BACKEND, parse_updates  # noqa: E402
+
+
+def legacy_load_update_data(raw: bytes) -> list:
+    """Реализация из main.py до перехода на updates.parser."""
+    text = raw.decode("utf-8", "ignore").strip()
+    try:
+        return [json.loads(text)]
+    except json.JSONDecodeError:
+        pass
+    cleaned = re.sub(r",\s*,+", ",", text).rstrip(", \n")
+    return json.loads(f"[{cleaned}]")
+
+
+def _update(update_id: int) -> dict:
+    return {
+        "update_id": update_id,
+        "message": {
+            "message_id": 1000 + update_id,
+            "from": {"id": 123456789, "is_bot": False, "first_name": "Иван", "username": "ivan", "language_code": "ru"},
+            "chat": {"id": 123456789, "first_name": "Иван", "username": "ivan", "type": "private"},
+            "date": 1700000000,
+            "text": "Какая цена биткоина и эфира сегодня? Что по рынку в целом?",
+        },
+    }
+
+
+PAYLOADS = {
+    "single": json.dumps(_update(1), ensure_ascii=False).encode(),
+    "batch_10_array": json.dumps([_update(i) for i in range(10)], ensure_ascii=False).encode(),
+    "batch_10_commas": b",".join(json.dumps(_update(i), ensure_ascii=False).encode() for i in range(10)),
+}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--number", type=int, default=20000)
+    args = parser.parse_args()
+
+    print(f"JSON backend: {JSON_BACKEND}, итераций: {args.number}")
+    for name, raw in PAYLOADS.items():
+        # Прежний парсер оборачивал массив ещё в один список
+        expected = legacy_load_update_data(raw)
+        if len(expected) == 1 and isinstance(expected[0], list):
+            expected = expected[0]
+        assert expected == parse_updates(raw)
+        legacy = timeit.timeit(lambda: legacy_load_update_data(raw), number=args.number)
+        new = timeit.timeit(lambda: parse_updates(raw), number=args.number)
+        per = lambda t: t / args.number * 1e6  # noqa: E731
+        print(
+            f"{name:>16}: legacy {per(legacy):7.2f} µs  new {per(new):7.2f} µs  "
+            f"x{legacy / new if new else float('inf'):.2f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
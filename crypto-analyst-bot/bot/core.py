@@ -1,10 +1,13 @@
 # bot/core.py
 # Основной модуль логики бота с улучшенной обработкой контекста.
 
+import json
 import logging
 import os
 import re
 import asyncio
+import time
+from typing import Dict, List, Tuple
 from datetime import datetime, timedelta, timezone
 from telegram import (
     Update,
@@ -20,7 +23,8 @@ from sqlalchemy.ext.asyncio import AsyncSession
 from utils.validators import is_valid_id, is_valid_symbol
 
 # --- Импорт всех модулей проекта ---
-from ai.dispatcher import classify_intent, extract_entities
+from ai.dispatcher import classify_and_extract, classify_intent, extract_entities, record_dispatch, use_combined
+from ai.local_classifier import LOCAL_INTENT_CLASSIFIER, local_classifier
 from database import operations as db_ops
 from crypto.handler import (
     handle_crypto_info_request,
@@ -36,7 +40,7 @@ from settings.user import (
     MAX_FREE_PORTFOLIO_COINS,
     DAILY_FREE_MESSAGES,
 )
-from settings.messages import get_text
+from settings.messages import get_text, get_translations
 from ai.general import handle_general_ai_conversation
 from analysis.handler import handle_token_analysis
 from crypto.pre_market import get_premarket_signals
@@ -51,6 +55,7 @@ from depin.projects import handle_depin_projects
 from crypto.news import handle_news_command
 from ai.prediction import handle_predict_command
 from utils.intent_router import IntentRouter
+from utils.runtime_metrics import register_metrics
 
 logger = logging.getLogger(__name__)
 router = IntentRouter()
@@ -62,12 +67,12 @@ SUBSCRIPTION_DESC = os.getenv("SUBSCRIPTION_DESC", "Channel subscription")
 TOP_TOPICS_HINT_LIMIT = 10
 TOP_TOPICS_HINT_COOLDOWN = 24 * 60 * 60  # 24 часа
 
-async def safe_update_message(session: AsyncSession, msg_id: int, **kwargs) -> None:
-    """Safely updates a chat message in the background."""
+async def safe_update_message(session: AsyncSession, message, **kwargs) -> None:
+    """Safely updates a chat message (handle, ORM object or id) in the background."""
     try:
-        await db_ops.update_chat_message(session, msg_id, **kwargs)
+        await db_ops.update_chat_message(session, message, **kwargs)
     except Exception as e:
-        logger.error(f"Failed to update chat message {msg_id}: {e}")
+        logger.error(f"Failed to update chat message {getattr(message, 'id', message)}: {e}")
 
 async def send_subscription_invoice(
     update: Update,
@@ -200,8 +205,8 @@ async def handle_premarket_scan(update: Update, context: CallbackContext, payloa
     )
 
     # --- Проверяем подписку пользователя ---
-    subscription = await db_ops.get_subscription(db_session, update.effective_user.id)
-    if not subscription or not subscription.is_active:
+    profile = await db_ops.get_user_profile(db_session, update.effective_user.id)
+    if not profile or not profile.subscription_active:
         reminder = get_text(lang, 'subscription_reminder')
         kb = InlineKeyboardMarkup(
             [[InlineKeyboardButton(get_text(lang, 'subscribe_button'), callback_data='/subscribe')]]
@@ -713,8 +718,8 @@ async def handle_portfolio_summary(update: Update, context: CallbackContext, pay
             return
         # Enforce free portfolio limit for non-subscribers
         portfolio = await db_ops.get_user_portfolio(db_session, user_id)
-        subscription = await db_ops.get_subscription(db_session, user_id)
-        if len(portfolio) >= MAX_FREE_PORTFOLIO_COINS and not (subscription and subscription.is_active):
+        profile = await db_ops.get_user_profile(db_session, user_id)
+        if len(portfolio) >= MAX_FREE_PORTFOLIO_COINS and not (profile and profile.subscription_active):
             await update.effective_message.reply_text(
                 get_text(lang, 'portfolio_limit', limit=MAX_FREE_PORTFOLIO_COINS)
             )
@@ -805,7 +810,7 @@ async def handle_portfolio_summary(update: Update, context: CallbackContext, pay
 
 async def get_symbol_from_context(session: AsyncSession, user_id: int) -> str | None:
     """Извлекает последний упомянутый символ из истории чата."""
-    history = await db_ops.get_chat_history(session, user_id, limit=4)
+    history = await db_ops.get_recent_history(session, user_id, limit=4)
     for msg in reversed(history):
         if msg.role == 'model':
             # Ищем тикеры, выделенные жирным шрифтом в сообщениях бота
@@ -815,6 +820,87 @@ async def get_symbol_from_context(session: AsyncSession, user_id: int) -> str |
                 return found[0]
     return None
 
+# --- Параллельные этапы обработки сообщения ---
+_stage_stats: Dict[str, Dict[str, float]] = {}
+
+
+def stage_metrics() -> dict:
+    return {
+        name: {
+            "calls": stats["calls"],
+            "avg_ms": round(stats["total_ms"] / stats["calls"], 1),
+            "on_critical_path": stats["critical"],
+        }
+        for name, stats in _stage_stats.items()
+    }
+
+
+register_metrics("handle_update_stages", stage_metrics)
+
+
+class StageRunner:
+    """Starts each stage as soon as the stages it depends on have finished.
+
+    A stage is an async function that receives the results of its
+    dependencies in order. Start and end of every stage are kept relative to
+    the runner's creation, so the critical path of a message can be logged
+    and aggregated in runtime metrics.
+    """
+
+    def __init__(self) -> None:
+        self._t0 = time.perf_counter()
+        self._tasks: Dict[str, asyncio.Task] = {}
+        self._deps: Dict[str, Tuple[str, ...]] = {}
+        self.timings: Dict[str, Tuple[float, float]] = {}
+
+    def add(self, name: str, func, *deps: str) -> None:
+        self._deps[name] = deps
+        self._tasks[name] = asyncio.create_task(self._run(name, func, deps), name=f"stage-{name}")
+
+    async def _run(self, name: str, func, deps: Tuple[str, ...]):
+        args = [await self._tasks[dep] for dep in deps]
+        started = time.perf_counter()
+        try:
+            return await func(*args)
+        finally:
+            self.timings[name] = ((started - self._t0) * 1000, (time.perf_counter() - self._t0) * 1000)
+
+    async def result(self, name: str):
+        return await self._tasks[name]
+
+    async def close(self) -> None:
+        """Отменяет незавершённые этапы и забирает их исключения."""
+        for task in self._tasks.values():
+            if not task.done():
+                task.cancel()
+        await asyncio.gather(*self._tasks.values(), return_exceptions=True)
+
+    def critical_path(self) -> List[str]:
+        """Цепочка зависимостей, которая закончилась последней."""
+        if not self.timings:
+            return []
+        name = max(self.timings, key=lambda n: self.timings[n][1])
+        path = [name]
+        while True:
+            deps = [dep for dep in self._deps.get(name, ()) if dep in self.timings]
+            if not deps:
+                break
+            name = max(deps, key=lambda d: self.timings[d][1])
+            path.append(name)
+        return path[::-1]
+
+    def record(self) -> None:
+        path = self.critical_path()
+        for name, (start, end) in self.timings.items():
+            stats = _stage_stats.setdefault(name, {"calls": 0, "total_ms": 0.0, "critical": 0})
+            stats["calls"] += 1
+            stats["total_ms"] += end - start
+            if name in path:
+                stats["critical"] += 1
+        spans = ", ".join(f"{name} {start:.0f}–{end:.0f}" for name, (start, end) in self.timings.items())
+        logger.info(f"Этапы (мс): {spans}; критический путь: {' → '.join(path)}")
+
+
 async def handle_update(update: Update, context: CallbackContext, db_session: AsyncSession):
     if update.callback_query:
         if update.callback_query.data == 'buy_report':
@@ -839,22 +925,25 @@ async def handle_update(update: Update, context: CallbackContext, db_session: As
     if not user_input:
         return
 
-    db_user = await db_ops.get_or_create_user(session=db_session, tg_user=user)
+    # Пользователь, подписка, активный диалог и счётчик сообщений — одним запросом
+    request_ctx = await db_ops.load_request_context(db_session, user)
+    context.user_data['request_context'] = request_ctx
+    db_user = request_ctx.user
     logger.info(f"Обработка сообщения от {db_user.id}: '{user_input}'")
     context.user_data['lang'] = db_user.language
     context.user_data['recommendations_enabled'] = getattr(db_user, 'show_recommendations', True)
     lang = context.user_data.get('lang', 'ru')
 
     # Check daily free message limit
-    subscription = await db_ops.get_subscription(db_session, user.id)
-    msg_count = await db_ops.count_user_messages_today(db_session, user.id)
+    subscription = request_ctx.subscription
+    msg_count = request_ctx.messages_today
     if msg_count >= DAILY_FREE_MESSAGES and not (subscription and subscription.is_active):
         limit_text = get_text(lang, 'free_daily_limit', limit=DAILY_FREE_MESSAGES)
         await message.reply_text(limit_text)
         await db_ops.add_chat_message(session=db_session, user_id=user.id, role='model', text=limit_text)
         return
 
-    dialog = await db_ops.start_dialog(db_session, user.id)
+    dialog = request_ctx.dialog
     user_msg = await db_ops.add_chat_message(
         session=db_session,
         user_id=user.id,
@@ -871,37 +960,15 @@ async def handle_update(update: Update, context: CallbackContext, db_session: As
         hint_state['counter'] = hint_state.get('counter', 0) + 1
     context.user_data['top_topics_hint'] = hint_state
 
-    # --- Обработка встроенных команд БЕЗ AI ---
-    hardcoded_commands = {
-        '/start': handle_bot_help,
-        '/help': handle_bot_help,
-        '/portfolio': handle_portfolio_summary,
-        '/alerts': handle_manage_alerts,
-        '/lang': handle_change_language,
-        '/settings': handle_settings_command,
-        '/shop': handle_shop,
-        '/buy': handle_buy_product,
-        '/subscribe': handle_subscribe,
-        '/course': handle_course_command,
-        '/feedback': handle_feedback,
-        '/hints': handle_hints_command,
-        '/recommend': handle_recommend,
-        '/admin': handle_admin_command,
-        '/my_subscription': handle_my_subscription,
-        '/stats': admin_stats,
-        '/broadcast': broadcast_command,
-        '/defi': handle_defi_farming,
-        '/nft': handle_nft_analytics,
-        '/depin': handle_depin_projects,
-        '/news': handle_news_command,
-        '/predict': handle_predict_command,
-    }
-    for cmd, func in hardcoded_commands.items():
-        if user_input.lower().startswith(cmd):
-            arg = user_input[len(cmd):].strip()
-            logger.info(f"Обработка жестко заданной команды: {cmd}")
-            await func(update, context, arg, db_session)
-            return
+    # --- Команды, кнопки меню и известные фразы — БЕЗ AI ---
+    fast_route = router.match(user_input)
+    if fast_route is not None:
+        route, arg = fast_route
+        logger.info(f"Обработка без AI по быстрому маршруту: {route.name}")
+        if route.intent:
+            await db_ops.update_chat_message(db_session, user_msg, request_type=route.intent)
+        await route.handler(update, context, arg, db_session)
+        return
 
     if user_input.startswith('/'):
         # Нераспознанная команда
@@ -909,66 +976,115 @@ async def handle_update(update: Update, context: CallbackContext, db_session: As
         return
 
     start_ts = datetime.now(timezone.utc)
+    # Независимые этапы идут параллельно: индикатор набора, популярные темы
+    # (единственный, кто в это время читает БД через db_session) и
+    # классификация. Записи о диалоге и сообщении — после ответа обработчика.
+    stages = StageRunner()
     try:
-        await context.bot.send_chat_action(chat_id=message.chat_id, action=constants.ChatAction.TYPING)
-        
-        # Шаг 1: Классификация
-        intent = await classify_intent(user_input)
-        logger.info(f"Шаг 1: Намерение определено как '{intent}'")
+        async def typing():
+            try:
+                await context.bot.send_chat_action(chat_id=message.chat_id, action=constants.ChatAction.TYPING)
+            except Exception as e:
+                logger.debug(f"send_chat_action не удался: {e}")
+
+        async def classify():
+            # Шаг 1: сначала локальными правилами, иначе через LLM
+            # (одним структурированным запросом или двумя, см. DISPATCH_MODE)
+            local = local_classifier.classify(user_input) if LOCAL_INTENT_CLASSIFIER else None
+            if local is not None:
+                logger.info(f"Шаг 1: Намерение определено локально как '{local.intent}' ({local.confidence:.2f})")
+                return local.intent, local.entities, 0.0
+            if use_combined(user.id):
+                intent, entities = await classify_and_extract(user_input)
+                logger.info(f"Шаг 1: Намерение '{intent}' и данные определены одним запросом")
+                return intent, entities, 0.0
+            llm_started = time.perf_counter()
+            intent = await classify_intent(user_input)
+            logger.info(f"Шаг 1: Намерение определено как '{intent}'")
+            return intent, None, (time.perf_counter() - llm_started) * 1000
+
+        async def top_topics():
+            return await db_ops.get_top_user_topics(db_session, user.id)
+
+        async def hint(topics):
+            hint_state = context.user_data.get('top_topics_hint', {})
+            now_ts = datetime.now(timezone.utc).timestamp()
+            last_ts = hint_state.get('last_shown')
+            allow_hint = (
+                last_ts is None
+                or now_ts - last_ts >= TOP_TOPICS_HINT_COOLDOWN
+                or hint_state.get('counter', 0) >= TOP_TOPICS_HINT_LIMIT
+            )
+            if topics and context.user_data.get('recommendations_enabled', True) and allow_hint:
+                hint_text = get_text(lang, 'top_topics_hint', topics=", ".join(topics))
+                kb = InlineKeyboardMarkup(
+                    [[InlineKeyboardButton(get_text(lang, 'full_report_btn'), callback_data='buy_report')]]
+                )
+                await message.reply_text(hint_text, reply_markup=kb)
+                hint_state['last_shown'] = now_ts
+                hint_state['counter'] = 0
+                context.user_data['top_topics_hint'] = hint_state
+
+        async def extract(classified):
+            # Шаг 2: Извлечение данных
+            intent, entities, llm_ms = classified
+            if entities is None:
+                llm_started = time.perf_counter()
+                entities = await extract_entities(intent, user_input)
+                record_dispatch("two_step", llm_ms + (time.perf_counter() - llm_started) * 1000)
+            logger.info(f"Шаг 2: Извлечены данные: {entities}")
+            return intent, entities
+
+        async def handle(extracted, _hint):
+            # Ждёт подсказку: она отвечает раньше и освобождает db_session
+            intent, entities = extracted
+            payload = next(iter(entities.values()))
+
+            # --- НОВАЯ ЛОГИКА: Расширенная проверка контекста ---
+            intents_needing_context = ["CRYPTO_INFO", "TOKEN_ANALYSIS", "WHERE_TO_BUY"]
+            pronouns = ['его', 'ее', 'их', 'него', 'о нем']
+            if intent in intents_needing_context and any(p in user_input.lower() for p in pronouns):
+                context_symbol = await get_symbol_from_context(db_session, user.id)
+                if context_symbol:
+                    payload = context_symbol
+                    logger.info(f"Контекст применен. Новый payload: {payload}")
+
+            handler = router.get(intent) or handle_unsupported_request
+            await handler(update, context, payload, db_session)
+
+        stages.add('typing', typing)
+        stages.add('classify', classify)
+        stages.add('top_topics', top_topics)
+        stages.add('hint', hint, 'top_topics')
+        stages.add('extract', extract, 'classify')
+        stages.add('handler', handle, 'extract', 'hint')
+        await stages.result('handler')
+        intent, entities = await stages.result('extract')
+
+        # Учёт — после ответа пользователю
         if not dialog.topic:
             await db_ops.update_dialog(db_session, dialog.id, topic=intent)
-        top_topics = await db_ops.get_top_user_topics(db_session, user.id)
-        hint_state = context.user_data.get('top_topics_hint', {})
-        now_ts = datetime.now(timezone.utc).timestamp()
-        last_ts = hint_state.get('last_shown')
-        allow_hint = (
-            last_ts is None
-            or now_ts - last_ts >= TOP_TOPICS_HINT_COOLDOWN
-            or hint_state.get('counter', 0) >= TOP_TOPICS_HINT_LIMIT
+        duration = int((datetime.now(timezone.utc) - start_ts).total_seconds() * 1000)
+        await db_ops.update_chat_message(
+            db_session, user_msg, request_type=intent, entities=str(entities), duration_ms=duration
         )
-        if top_topics and context.user_data.get('recommendations_enabled', True) and allow_hint:
-            hint = get_text(lang, 'top_topics_hint', topics=", ".join(top_topics))
-            kb = InlineKeyboardMarkup(
-                [[InlineKeyboardButton(get_text(lang, 'full_report_btn'), callback_data='buy_report')]]
-            )
-            await message.reply_text(hint, reply_markup=kb)
-            hint_state['last_shown'] = now_ts
-            hint_state['counter'] = 0
-            context.user_data['top_topics_hint'] = hint_state
-
-        # Шаг 2: Извлечение данных
-        entities = await extract_entities(intent, user_input)
-        await db_ops.update_chat_message(db_session, user_msg.id, request_type=intent, entities=str(entities))
-        logger.info(f"Шаг 2: Извлечены данные: {entities}")
-
-        payload = next(iter(entities.values()))
-
-        # --- НОВАЯ ЛОГИКА: Расширенная проверка контекста ---
-        intents_needing_context = ["CRYPTO_INFO", "TOKEN_ANALYSIS", "WHERE_TO_BUY"]
-        pronouns = ['его', 'ее', 'их', 'него', 'о нем']
-        if intent in intents_needing_context and any(p in user_input.lower() for p in pronouns):
-            context_symbol = await get_symbol_from_context(db_session, user.id)
-            if context_symbol:
-                payload = context_symbol
-                logger.info(f"Контекст применен. Новый payload: {payload}")
-
-        handler = router.get(intent) or handle_unsupported_request
-        await handler(update, context, payload, db_session)
-        duration = int((datetime.now(timezone.utc) - start_ts).total_seconds() * 1000)
-        await db_ops.update_chat_message(db_session, user_msg.id, duration_ms=duration)
+        await stages.close()
+        stages.record()
 
     except Exception as e:
         logger.error(
             f"Критическая ошибка для {user.id} при запросе '{user_input}': {e}",
             exc_info=True,
         )
+        # Оставшиеся этапы не должны работать с db_session параллельно с записью ошибки
+        await stages.close()
         lang = context.user_data.get('lang', 'ru')
         await message.reply_text(get_text(lang, 'error_generic'))
         duration = int((datetime.now(timezone.utc) - start_ts).total_seconds() * 1000)
         asyncio.create_task(
             safe_update_message(
                 db_session,
-                user_msg.id,
+                user_msg,
                 duration_ms=duration,
                 error=True,
             )
@@ -995,3 +1111,68 @@ router.register("PRICE_PREDICTION", handle_predict_command)
 router.register("SHOP_BUY", handle_buy_product)
 router.register("SUBSCRIPTION", handle_subscribe)
 router.register("COURSE_INFO", handle_course_command)
+
+# --- Быстрые маршруты без AI: команды, кнопки меню, известные фразы ---
+COMMAND_HANDLERS = {
+    '/start': handle_bot_help,
+    '/help': handle_bot_help,
+    '/portfolio': handle_portfolio_summary,
+    '/alerts': handle_manage_alerts,
+    '/lang': handle_change_language,
+    '/settings': handle_settings_command,
+    '/shop': handle_shop,
+    '/buy': handle_buy_product,
+    '/subscribe': handle_subscribe,
+    '/course': handle_course_command,
+    '/feedback': handle_feedback,
+    '/hints': handle_hints_command,
+    '/recommend': handle_recommend,
+    '/admin': handle_admin_command,
+    '/my_subscription': handle_my_subscription,
+    '/stats': admin_stats,
+    '/broadcast': broadcast_command,
+    '/defi': handle_defi_farming,
+    '/nft': handle_nft_analytics,
+    '/depin': handle_depin_projects,
+    '/news': handle_news_command,
+    '/predict': handle_predict_command,
+}
+FAST_ROUTES_FILE = os.path.join(os.path.dirname(os.path.dirname(__file__)), "config", "fast_routes.json")
+
+
+def build_fast_routes(router: IntentRouter, path: str = FAST_ROUTES_FILE) -> int:
+    """Один раз заполняет таблицы быстрых маршрутов роутера.
+
+    Команды попадают в префиксное дерево, подписи кнопок меню на всех языках
+    из settings/messages и фразы из config/fast_routes.json — в хеш-таблицу.
+    """
+    for command, handler in COMMAND_HANDLERS.items():
+        router.register_command(command, handler)
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            config = json.load(f)
+    except Exception as e:
+        logger.error(f"Не удалось загрузить {path}: {e}")
+        config = {}
+
+    def resolve(target: dict):
+        if "command" in target:
+            return COMMAND_HANDLERS.get(target["command"]), None
+        intent = target.get("intent", "")
+        return router.get(intent), intent.upper() or None
+
+    count = 0
+    phrases = [(label, target) for key, target in config.get("menu", {}).items() for label in get_translations(key).values()]
+    phrases += list(config.get("phrases", {}).items())
+    for phrase, target in phrases:
+        handler, intent = resolve(target)
+        if handler is None:
+            logger.warning(f"Быстрый маршрут '{phrase}' указывает на неизвестный обработчик: {target}")
+            continue
+        router.register_phrase(phrase, handler, target.get("payload", ""), intent=intent)
+        count += 1
+    logger.info(f"Быстрых маршрутов: {len(COMMAND_HANDLERS)} команд, {count} фраз")
+    return count
+
+
+build_fast_routes(router)
@@ -9,6 +9,7 @@ from sqlalchemy.ext.asyncio import AsyncSession
 from utils.api_clients import coingecko_client
 from utils.validators import is_valid_symbol
 from ai.formatter import format_data_with_ai
+from crypto.price_renderer import PRICE_RENDERER, render_prices
 from database import operations as db_ops
 from settings.messages import get_text
 
@@ -61,6 +62,7 @@ async def handle_crypto_info_request(update: Update, context: CallbackContext, p
     lang = context.user_data.get('lang', 'ru')
     symbols = payload.split(',')
     coin_ids, not_found = await get_coin_ids_from_symbols(symbols)
+    symbol_by_id = {COIN_ID_MAP[s.strip().upper()]: s.strip().upper() for s in symbols if s.strip().upper() in COIN_ID_MAP}
 
     if not coin_ids:
         response_text = get_text(lang, 'crypto_not_found', payload=payload)
@@ -70,7 +72,14 @@ async def handle_crypto_info_request(update: Update, context: CallbackContext, p
 
     try:
         await context.bot.send_chat_action(chat_id=update.effective_chat.id, action=constants.ChatAction.TYPING)
-        price_data = await coingecko_client.get_simple_price(coin_ids=coin_ids)
+        currency = context.user_data.get('currency')
+        if not currency:
+            user = await db_ops.get_user(db_session, user_id)
+            currency = user.currency if user else 'USD'
+        currency = currency.upper()
+        # USD запрашивается всегда: если CoinGecko не знает валюту пользователя
+        vs_currencies = ['usd'] if currency == 'USD' else [currency.lower(), 'usd']
+        price_data = await coingecko_client.get_simple_price(coin_ids=coin_ids, vs_currencies=vs_currencies)
 
         if not price_data:
             response_text = get_text(lang, 'crypto_no_data')
@@ -78,7 +87,11 @@ async def handle_crypto_info_request(update: Update, context: CallbackContext, p
             await db_ops.add_chat_message(session=db_session, user_id=user_id, role='model', text=response_text)
             return
 
-        formatted_response = await format_data_with_ai(price_data)
+        if PRICE_RENDERER == 'ai':
+            formatted_response = await format_data_with_ai(price_data)
+        else:
+            # Шаблон из settings/messages: без обращения к LLM
+            formatted_response = render_prices(price_data, currency, lang, symbols=symbol_by_id, order=coin_ids)
 
         if not_found:
             missing = get_text(lang, 'crypto_partial_missing', coins=', '.join(not_found))
@@ -23,7 +23,7 @@ SOURCE_WEIGHTS = {
 
 async def _get_symbol_from_history(session: AsyncSession, user_id: int) -> Optional[str]:
     """Attempt to find last mentioned token symbol in recent chat history."""
-    history = await db_ops.get_chat_history(session, user_id, limit=4)
+    history = await db_ops.get_recent_history(session, user_id, limit=4)
     for msg in reversed(history):
         if msg.role == "model":
             found = re.findall(r"\*([A-Z]{2,5})\*", msg.message_text)
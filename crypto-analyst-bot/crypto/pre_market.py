@@ -9,10 +9,11 @@ from typing import List, Dict, Optional
 import asyncio
 import json
 from dotenv import load_dotenv
-import httpx
 from bs4 import BeautifulSoup
+from utils import market_http
 from utils.api_clients import coingecko_client
 from utils.cache import get_cache, set_cache
+from utils.singleflight import singleflight
 
 logger = logging.getLogger(__name__)
 load_dotenv()
@@ -37,9 +38,10 @@ async def fetch_coinmarketcal_events(limit: int = 5) -> List[Dict]:
     else:
         logger.warning("COINMARKETCAL_API_KEY не найден. Используются публичные лимиты.")
     params = {"max": limit}
-    try:
-        async with httpx.AsyncClient(timeout=15.0) as client:
-            response = await client.get(url, params=params, headers=headers)
+
+    async def fetch() -> List[Dict]:
+        try:
+            response = await market_http.get(url, params=params, headers=headers)
             response.raise_for_status()
             data = response.json()
             events = []
@@ -56,9 +58,11 @@ async def fetch_coinmarketcal_events(limit: int = 5) -> List[Dict]:
                 })
             await set_cache(cache_key, json.dumps(events), ttl=45)
             return events
-    except Exception as e:
-        logger.error(f"Ошибка при запросе к CoinMarketCal: {e}")
-        return []
+        except Exception as e:
+            logger.error(f"Ошибка при запросе к CoinMarketCal: {e}")
+            return []
+
+    return await singleflight.do(cache_key, fetch)
 
 async def fetch_icodrops_upcoming(limit: int = 5) -> List[Dict]:
     """Парсит сайт ICO Drops для получения списка предстоящих ICO."""
@@ -68,9 +72,10 @@ async def fetch_icodrops_upcoming(limit: int = 5) -> List[Dict]:
         return json.loads(cached)
 
     url = "https://icodrops.com/category/upcoming-ico/"
-    try:
-        async with httpx.AsyncClient(timeout=15.0) as client:
-            response = await client.get(url)
+
+    async def fetch() -> List[Dict]:
+        try:
+            response = await market_http.get(url)
             response.raise_for_status()
             soup = BeautifulSoup(response.text, "html.parser")
             cards = soup.select(".ico-main-info")[:limit]
@@ -89,9 +94,11 @@ async def fetch_icodrops_upcoming(limit: int = 5) -> List[Dict]:
                 })
             await set_cache(cache_key, json.dumps(icos), ttl=45)
             return icos
-    except Exception as e:
-        logger.error(f"Ошибка при парсинге ICO Drops: {e}")
-        return []
+        except Exception as e:
+            logger.error(f"Ошибка при парсинге ICO Drops: {e}")
+            return []
+
+    return await singleflight.do(cache_key, fetch)
 
 
 async def fetch_coingecko_events(limit: int = 5) -> List[Dict]:
@@ -106,9 +113,10 @@ async def fetch_coingecko_events(limit: int = 5) -> List[Dict]:
         "page": 1,
         "per_page": limit,
     }
-    try:
-        async with httpx.AsyncClient(timeout=15.0) as client:
-            response = await client.get(COINGECKO_EVENTS_URL, params=params)
+
+    async def fetch() -> List[Dict]:
+        try:
+            response = await market_http.get(COINGECKO_EVENTS_URL, params=params)
             response.raise_for_status()
             data = response.json()
             events = []
@@ -126,9 +134,11 @@ async def fetch_coingecko_events(limit: int = 5) -> List[Dict]:
                 })
             await set_cache(cache_key, json.dumps(events), ttl=45)
             return events
-    except Exception as e:
-        logger.error(f"Ошибка при запросе к CoinGecko Events: {e}")
-        return []
+        except Exception as e:
+            logger.error(f"Ошибка при запросе к CoinGecko Events: {e}")
+            return []
+
+    return await singleflight.do(cache_key, fetch)
 
 
 async def fetch_cryptorank_events(limit: int = 5) -> List[Dict]:
@@ -142,9 +152,10 @@ async def fetch_cryptorank_events(limit: int = 5) -> List[Dict]:
     if CRYPTORANK_API_KEY:
         headers["API-KEY"] = CRYPTORANK_API_KEY
     params = {"limit": limit}
-    try:
-        async with httpx.AsyncClient(timeout=15.0) as client:
-            response = await client.get(CRYPTORANK_API_URL, params=params, headers=headers)
+
+    async def fetch() -> List[Dict]:
+        try:
+            response = await market_http.get(CRYPTORANK_API_URL, params=params, headers=headers)
             response.raise_for_status()
             data = response.json()
             events = []
@@ -162,9 +173,11 @@ async def fetch_cryptorank_events(limit: int = 5) -> List[Dict]:
                 })
             await set_cache(cache_key, json.dumps(events), ttl=45)
             return events
-    except Exception as e:
-        logger.error(f"Ошибка при запросе к CryptoRank: {e}")
-        return []
+        except Exception as e:
+            logger.error(f"Ошибка при запросе к CryptoRank: {e}")
+            return []
+
+    return await singleflight.do(cache_key, fetch)
 
 
 async def filter_events_by_type(events: List[Dict], event_type: Optional[str]) -> List[Dict]:
@@ -0,0 +1,120 @@
+# crypto/price_renderer.py
+# Локальное форматирование ответа CoinGecko /simple/price.
+#
+# Раньше JSON с ценами отправлялся в LLM только ради Markdown-карточки, что
+# добавляло обращение к модели (и до 20 с таймаута) к самому частому
+# запросу. Карточка собирается по шаблонам settings/messages на языке
+# пользователя: цена, капитализация, объём и изменение за 24 часа со
+# стрелкой направления, в валюте пользователя. PRICE_RENDERER=ai
+# возвращает оформление через ai.formatter.
+
+import os
+from typing import Dict, List, Optional
+
+from settings.messages import get_text
+
+PRICE_RENDERER = os.getenv("PRICE_RENDERER", "template").lower()
+
+# Символ ставится перед суммой; для остальных валют — код после суммы
+CURRENCY_PREFIX = {"USD": "$", "EUR": "€", "GBP": "£", "JPY": "¥", "CNY": "¥", "INR": "₹"}
+CURRENCY_SUFFIX = {"RUB": "₽", "UAH": "₴", "KZT": "₸", "TRY": "₺"}
+
+TREND_UP = "📈"
+TREND_DOWN = "📉"
+TREND_FLAT = "➖"
+
+
+def _group(number: str, lang: str) -> str:
+    """Разделители разрядов и дробной части по языку: 1,234.5 или 1 234,5."""
+    if lang == "ru":
+        return number.replace(",", " ").replace(".", ",")
+    return number
+
+
+def format_number(value: float, lang: str = "ru", decimals: Optional[int] = None) -> str:
+    """Число с разделителями; без ``decimals`` точность зависит от величины."""
+    if decimals is None:
+        magnitude = abs(value)
+        if magnitude >= 1 or magnitude == 0:
+            decimals = 2
+        else:
+            # Мелкие цены: четыре значащие цифры после нулей
+            decimals = 3
+            while decimals < 12 and magnitude < 10 ** -(decimals - 3):
+                decimals += 1
+    return _group(f"{value:,.{decimals}f}", lang)
+
+
+def format_money(value: float, currency: str, lang: str = "ru", decimals: Optional[int] = None) -> str:
+    currency = currency.upper()
+    number = format_number(value, lang, decimals)
+    if currency in CURRENCY_PREFIX:
+        sign = "-" if number.startswith("-") else ""
+        return f"{sign}{CURRENCY_PREFIX[currency]}{number.lstrip('-')}"
+    return f"{number} {CURRENCY_SUFFIX.get(currency, currency)}"
+
+
+def format_change(change: float, lang: str = "ru") -> str:
+    sign = "+" if change > 0 else ""
+    return f"{sign}{format_number(change, lang, 2)}%"
+
+
+def trend_emoji(change: float) -> str:
+    if change > 0:
+        return TREND_UP
+    if change < 0:
+        return TREND_DOWN
+    return TREND_FLAT
+
+
+def coin_name(coin_id: str) -> str:
+    return coin_id.replace("-", " ").title()
+
+
+def render_coin(coin_id: str, quote: Dict[str, float], currency: str, lang: str = "ru", symbol: Optional[str] = None) -> str:
+    """Карточка одной монеты; ``quote`` — значение ``coin_id`` из /simple/price."""
+    key = currency.lower()
+    no_value = get_text(lang, "price_card_no_value")
+    price = quote.get(key)
+    market_cap = quote.get(f"{key}_market_cap")
+    volume = quote.get(f"{key}_24h_vol")
+    change = quote.get(f"{key}_24h_change")
+
+    lines = [
+        get_text(lang, "price_card_title", name=coin_name(coin_id), symbol=(symbol or coin_id).upper()),
+        get_text(lang, "price_card_price", value=format_money(price, currency, lang) if price is not None else no_value),
+        get_text(
+            lang,
+            "price_card_market_cap",
+            value=format_money(market_cap, currency, lang, 0) if market_cap else no_value,
+        ),
+        get_text(lang, "price_card_volume", value=format_money(volume, currency, lang, 0) if volume else no_value),
+    ]
+    if change is not None:
+        lines.append(get_text(lang, "price_card_change", value=format_change(change, lang), trend=trend_emoji(change)))
+    else:
+        lines.append(get_text(lang, "price_card_change", value=no_value, trend="").rstrip())
+    return "\n".join(lines)
+
+
+def quote_currency(quote: Dict[str, float], currency: str) -> str:
+    """Валюта пользователя, если CoinGecko вернул по ней цену, иначе USD."""
+    return currency if currency.lower() in quote else "USD"
+
+
+def render_prices(
+    price_data: Dict[str, Dict[str, float]],
+    currency: str = "USD",
+    lang: str = "ru",
+    symbols: Optional[Dict[str, str]] = None,
+    order: Optional[List[str]] = None,
+) -> str:
+    """Markdown-карточки всех монет ответа в порядке запроса."""
+    symbols = symbols or {}
+    cards = []
+    for coin_id in order or list(price_data):
+        quote = price_data.get(coin_id)
+        if not quote:
+            continue
+        cards.append(render_coin(coin_id, quote, quote_currency(quote, currency), lang, symbols.get(coin_id)))
+    return "\n\n".join(cards)
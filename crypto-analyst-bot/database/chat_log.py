@@ -0,0 +1,353 @@
+# database/chat_log.py
+# Отложенная пакетная запись истории чата (write-behind).
+#
+# add_chat_message кладёт строку в буфер и сразу возвращает лёгкий
+# ChatLogHandle. Последующие update_chat_message (request_type, entities,
+# duration_ms) сливаются в ещё не записанную строку, поэтому отдельных UPDATE
+# не бывает. Фоновая задача раз в CHAT_LOG_FLUSH_MS или при накоплении
+# CHAT_LOG_BATCH строк пишет буфер одним многострочным INSERT ... RETURNING и
+# обновляет users.last_contact_at одним executemany на пачку. При остановке
+# приложения буфер дописывается полностью. Время сообщения фиксируется при
+# постановке в буфер, поэтому порядок истории не зависит от момента записи.
+#
+# Неудачная пачка возвращается в начало буфера. Если ошибка не связана с
+# соединением и строки пачки не записались CHAT_LOG_MAX_RETRIES раз, пачка
+# пишется половинами, пока не останутся отдельные строки, которые не
+# записываются сами по себе (нарушение ограничения, NUL-байт в тексте); они
+# отбрасываются с записью в лог, остальные строки записываются. Так одна
+# плохая строка не останавливает запись всей истории.
+
+import asyncio
+import logging
+import os
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+from sqlalchemy import bindparam, exc as sqlalchemy_exc, insert, update as sqlalchemy_update
+
+from utils.runtime_metrics import register_metrics
+
+from .models import ChatHistory, User
+
+logger = logging.getLogger(__name__)
+
+CHAT_LOG_MODE = os.getenv("CHAT_LOG_MODE", "buffered").lower()
+CHAT_LOG_FLUSH_MS = int(os.getenv("CHAT_LOG_FLUSH_MS", "500"))
+CHAT_LOG_BATCH = int(os.getenv("CHAT_LOG_BATCH", "200"))
+CHAT_LOG_MAX_PENDING = int(os.getenv("CHAT_LOG_MAX_PENDING", "20000"))
+CHAT_LOG_MAX_RETRIES = int(os.getenv("CHAT_LOG_MAX_RETRIES", "3"))
+
+PENDING = "pending"
+IN_FLIGHT = "in_flight"
+FLUSHED = "flushed"
+DROPPED = "dropped"
+
+
+def _connection_error(error: Exception) -> bool:
+    """Ошибка соединения с базой, а не данных конкретной строки."""
+    if isinstance(error, (OSError, asyncio.TimeoutError)):
+        return True
+    if isinstance(error, (sqlalchemy_exc.OperationalError, sqlalchemy_exc.InterfaceError)):
+        return True
+    return bool(getattr(error, "connection_invalidated", False))
+
+
+class ChatLogHandle:
+    """Buffered chat_history row; ``id`` is known once the row is written."""
+
+    __slots__ = ("row", "id", "state", "deferred", "attempts")
+
+    def __init__(self, row: Dict[str, Any]) -> None:
+        self.row = row
+        self.id: Optional[int] = None
+        self.state = PENDING
+        # Изменения, пришедшие, пока строка записывается
+        self.deferred: Dict[str, Any] = {}
+        # Неудачные попытки записать строку
+        self.attempts = 0
+
+    @property
+    def user_id(self) -> int:
+        return self.row["user_id"]
+
+    @property
+    def dialog_id(self) -> Optional[int]:
+        return self.row.get("dialog_id")
+
+    @property
+    def role(self) -> str:
+        return self.row["role"]
+
+    @property
+    def message_text(self) -> str:
+        return self.row["message_text"]
+
+    @property
+    def timestamp(self) -> datetime:
+        return self.row["timestamp"]
+
+
+class ChatLogWriter:
+    """Collects chat_history rows and writes them in batches."""
+
+    def __init__(
+        self,
+        session_factory=None,
+        flush_interval_ms: int = CHAT_LOG_FLUSH_MS,
+        max_batch: int = CHAT_LOG_BATCH,
+        max_pending: int = CHAT_LOG_MAX_PENDING,
+        max_retries: int = CHAT_LOG_MAX_RETRIES,
+        name: str = "chat_log",
+    ) -> None:
+        self._session_factory = session_factory
+        self.flush_interval = flush_interval_ms / 1000
+        self.max_batch = max(1, max_batch)
+        self.max_pending = max_pending
+        self.max_retries = max(1, max_retries)
+        self._pending: List[ChatLogHandle] = []
+        self._in_flight: List[ChatLogHandle] = []
+        self._updates: List[Tuple[int, Dict[str, Any]]] = []
+        # Подряд неудачные записи, в которых были обновления строк
+        self._update_failures = 0
+        self._wakeup = asyncio.Event()
+        self._flush_lock = asyncio.Lock()
+        self._task: Optional[asyncio.Task] = None
+
+        self.logged = 0
+        self.merged_updates = 0
+        self.written = 0
+        self.flushes = 0
+        self.errors = 0
+        self.dropped = 0
+        self.isolations = 0
+        self.poisoned = 0
+
+        register_metrics(name, self.stats)
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    def _factory(self):
+        if self._session_factory is None:
+            from .engine import AsyncSessionFactory
+
+            self._session_factory = AsyncSessionFactory
+        return self._session_factory
+
+    async def start(self) -> None:
+        if self.running:
+            return
+        if CHAT_LOG_MODE != "buffered":
+            logger.info("CHAT_LOG_MODE=direct: история чата пишется сразу при каждом сообщении.")
+            return
+        self._task = asyncio.create_task(self._run(), name="chat-log-writer")
+        logger.info(
+            f"Отложенная запись истории чата запущена: раз в {self.flush_interval * 1000:.0f} мс "
+            f"или по {self.max_batch} строк"
+        )
+
+    async def stop(self) -> None:
+        """Останавливает фоновую задачу и дописывает всё, что осталось в буфере."""
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        for _ in range(3):
+            # flush берёт тот же lock, поэтому сначала дожидается начатой записи
+            await self.flush()
+            if not self._pending and not self._updates:
+                break
+        if self._pending or self._updates:
+            logger.error(f"При остановке не записано строк истории: {len(self._pending)}")
+
+    def log(self, row: Dict[str, Any]) -> ChatLogHandle:
+        handle = ChatLogHandle(row)
+        self._pending.append(handle)
+        self.logged += 1
+        if len(self._pending) >= self.max_batch:
+            self._wakeup.set()
+        return handle
+
+    def update(self, handle: ChatLogHandle, **kwargs) -> None:
+        """Применяет изменения к строке, где бы она сейчас ни была."""
+        if handle.state == DROPPED:
+            return
+        if handle.state == PENDING:
+            handle.row.update(kwargs)
+            self.merged_updates += 1
+        elif handle.state == IN_FLIGHT:
+            handle.deferred.update(kwargs)
+        else:
+            self._updates.append((handle.id, kwargs))
+            if len(self._updates) >= self.max_batch:
+                self._wakeup.set()
+
+    def pending_for(self, user_id: int) -> List[ChatLogHandle]:
+        """Ещё не записанные строки пользователя, от новых к старым."""
+        rows = [h for h in self._in_flight + self._pending if h.user_id == user_id]
+        rows.sort(key=lambda h: h.timestamp, reverse=True)
+        return rows
+
+    async def flush(self) -> int:
+        """Записывает текущий буфер; возвращает число вставленных строк."""
+        async with self._flush_lock:
+            batch, self._pending = self._pending, []
+            updates, self._updates = self._updates, []
+            if not batch and not updates:
+                return 0
+            for handle in batch:
+                handle.state = IN_FLIGHT
+            self._in_flight = batch
+            try:
+                await self._write(batch, updates)
+            except Exception as e:
+                self.errors += 1
+                logger.error(f"Ошибка записи истории чата ({len(batch)} строк): {e!r}")
+                for handle in batch:
+                    handle.attempts += 1
+                if updates:
+                    self._update_failures += 1
+                if not _connection_error(e) and self._exhausted(batch):
+                    return await self._isolate(batch, updates)
+                self._requeue(batch, updates)
+                return 0
+            finally:
+                self._in_flight = []
+            self._update_failures = 0
+            self._flushed(batch)
+            return len(batch)
+
+    def _exhausted(self, batch: List[ChatLogHandle]) -> bool:
+        if any(handle.attempts >= self.max_retries for handle in batch):
+            return True
+        return not batch and self._update_failures >= self.max_retries
+
+    def _flushed(self, batch: List[ChatLogHandle]) -> None:
+        for handle in batch:
+            handle.state = FLUSHED
+            if handle.deferred:
+                self._updates.append((handle.id, handle.deferred))
+                handle.deferred = {}
+        self.written += len(batch)
+        self.flushes += 1
+
+    async def _isolate(self, batch: List[ChatLogHandle], updates: List[Tuple[int, Dict[str, Any]]]) -> int:
+        """Пишет пачку по частям и отбрасывает строки, которые не записываются сами по себе."""
+        self.isolations += 1
+        written, poisoned, retry = await self._bisect(batch)
+        for handle, error in poisoned:
+            handle.state = DROPPED
+            handle.deferred = {}
+            self.poisoned += 1
+            logger.error(
+                f"Строка истории чата пользователя {handle.user_id} отброшена после "
+                f"{handle.attempts} неудачных записей: {error!r}"
+            )
+        kept: List[Tuple[int, Dict[str, Any]]] = []
+        for item in updates:
+            try:
+                await self._write([], [item])
+            except Exception as e:
+                if _connection_error(e):
+                    kept.append(item)
+                    continue
+                self.poisoned += 1
+                logger.error(f"Обновление строки истории чата {item[0]} отброшено: {e!r}")
+        self._update_failures = 0
+        if written:
+            self._flushed(written)
+        if retry or kept:
+            self._requeue(retry, kept)
+        return len(written)
+
+    async def _bisect(self, batch: List[ChatLogHandle]):
+        """Строки, записанные успешно, отброшенные (с ошибкой) и отложенные до следующей записи."""
+        if not batch:
+            return [], [], []
+        try:
+            await self._write(batch, [])
+        except Exception as e:
+            if _connection_error(e):
+                return [], [], batch
+            if len(batch) == 1:
+                return [], [(batch[0], e)], []
+            mid = len(batch) // 2
+            left = await self._bisect(batch[:mid])
+            right = await self._bisect(batch[mid:])
+            return left[0] + right[0], left[1] + right[1], left[2] + right[2]
+        return batch, [], []
+
+    async def _write(self, batch: List[ChatLogHandle], updates: List[Tuple[int, Dict[str, Any]]]) -> None:
+        async with self._factory()() as session:
+            if batch:
+                result = await session.execute(
+                    insert(ChatHistory).returning(ChatHistory.id, sort_by_parameter_order=True),
+                    [h.row for h in batch],
+                )
+                for handle, message_id in zip(batch, result.scalars().all()):
+                    handle.id = message_id
+                # Одно обновление времени контакта на пользователя за пачку
+                contacts: Dict[int, datetime] = {}
+                for handle in batch:
+                    ts = handle.timestamp
+                    if handle.user_id not in contacts or contacts[handle.user_id] < ts:
+                        contacts[handle.user_id] = ts
+                users = User.__table__
+                await session.execute(
+                    sqlalchemy_update(users)
+                    .where(users.c.id == bindparam("uid"))
+                    .values(last_contact_at=bindparam("ts")),
+                    [{"uid": uid, "ts": ts} for uid, ts in contacts.items()],
+                )
+            history = ChatHistory.__table__
+            for message_id, values in updates:
+                await session.execute(
+                    sqlalchemy_update(history).where(history.c.id == message_id).values(**values)
+                )
+            await session.commit()
+
+    def _requeue(self, batch: List[ChatLogHandle], updates: List[Tuple[int, Dict[str, Any]]]) -> None:
+        """Возвращает неудачную пачку в начало буфера, пока он не переполнен."""
+        for handle in batch:
+            handle.state = PENDING
+            handle.id = None
+            if handle.deferred:
+                handle.row.update(handle.deferred)
+                handle.deferred = {}
+        self._pending = batch + self._pending
+        self._updates = updates + self._updates
+        overflow = len(self._pending) - self.max_pending
+        if overflow > 0:
+            del self._pending[:overflow]
+            self.dropped += overflow
+            logger.error(f"Буфер истории чата переполнен, отброшено строк: {overflow}")
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            if self._pending or self._updates:
+                # stop() отменяет задачу; начатая запись должна завершиться
+                await asyncio.shield(self.flush())
+
+    def stats(self) -> dict:
+        return {
+            "running": self.running,
+            "pending": len(self._pending),
+            "pending_updates": len(self._updates),
+            "logged": self.logged,
+            "merged_updates": self.merged_updates,
+            "written": self.written,
+            "flushes": self.flushes,
+            "errors": self.errors,
+            "dropped": self.dropped,
+            "isolations": self.isolations,
+            "poisoned": self.poisoned,
+        }
+
+
+chat_log_writer = ChatLogWriter()
@@ -3,6 +3,7 @@
 
 import os
 import logging
+from sqlalchemy import text
 from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession
 from sqlalchemy.orm import sessionmaker
 from dotenv import load_dotenv
@@ -57,14 +58,34 @@ async def get_db_session() -> AsyncSession:
             await session.close()
 
 
+# Колонки и индексы, добавленные в модели после того, как таблицы уже были
+# созданы. create_all не меняет существующие таблицы, поэтому они
+# досоздаются здесь; каждая команда безопасна при повторном запуске.
+# Воркеры uvicorn стартуют одновременно, поэтому создание и обновление схемы
+# идут под транзакционным advisory lock.
+SCHEMA_LOCK_KEY = 720312
+SCHEMA_UPGRADES = (
+    # Резюме диалога (ai/summarizer.py)
+    "ALTER TABLE dialogs ADD COLUMN IF NOT EXISTS summary TEXT",
+    "ALTER TABLE dialogs ADD COLUMN IF NOT EXISTS summary_until TIMESTAMP WITH TIME ZONE",
+    # Дневная квота (utils/quota.py) и буфер истории (utils/history_buffer.py)
+    "CREATE INDEX IF NOT EXISTS ix_chat_history_user_role_ts ON chat_history (user_id, role, timestamp)",
+    "CREATE INDEX IF NOT EXISTS ix_chat_history_user_ts ON chat_history (user_id, timestamp)",
+)
+
 async def init_db():
     """
     Инициализирует базу данных, создавая все таблицы на основе моделей.
+    Колонки и индексы из SCHEMA_UPGRADES досоздаются в существующих таблицах.
     Вызывается один раз при старте приложения в main.py.
     """
     async with engine.begin() as conn:
+        await conn.execute(text("SELECT pg_advisory_xact_lock(:key)"), {"key": SCHEMA_LOCK_KEY})
         # `conn.run_sync(Base.metadata.create_all)` создает таблицы,
         # если они еще не существуют.
         logger.info("Проверка и создание таблиц в базе данных...")
         await conn.run_sync(Base.metadata.create_all)
-        logger.info("Таблицы успешно проверены/созданы.")
\ No newline at end of file
+        logger.info("Таблицы успешно проверены/созданы.")
+        for statement in SCHEMA_UPGRADES:
+            await conn.execute(text(statement))
+        logger.info("Схема базы данных обновлена до текущих моделей.")
\ No newline at end of file
@@ -5,7 +5,7 @@ import enum
 from datetime import datetime
 from sqlalchemy import (
     Column, Integer, String, BigInteger, DateTime,
-    Boolean, Float, Enum as SQLAlchemyEnum, ForeignKey, Text
+    Boolean, Float, Enum as SQLAlchemyEnum, ForeignKey, Text, Index
 )
 from sqlalchemy.orm import declarative_base, relationship
 from sqlalchemy.sql import func
@@ -77,6 +77,10 @@ class Dialog(Base):
     started_at = Column(DateTime(timezone=True), server_default=func.now())
     ended_at = Column(DateTime(timezone=True), nullable=True)
     is_active = Column(Boolean, default=True, nullable=False)
+    # Скользящее резюме диалога (ai/summarizer.py) и время последнего
+    # сообщения, уже вошедшего в него
+    summary = Column(Text, nullable=True)
+    summary_until = Column(DateTime(timezone=True), nullable=True)
 
     user = relationship('User')
 
@@ -100,6 +104,13 @@ class ChatHistory(Base):
     timestamp = Column(DateTime(timezone=True), server_default=func.now())
     user = relationship("User", back_populates="chat_history")
     dialog = relationship("Dialog")
+
+    __table_args__ = (
+        # Восстановление дневного счётчика сообщений (utils.quota) из истории
+        Index("ix_chat_history_user_role_ts", "user_id", "role", "timestamp"),
+        # Загрузка последних сообщений в utils/history_buffer.py
+        Index("ix_chat_history_user_ts", "user_id", "timestamp"),
+    )
 
 # --- Новые таблицы для будущего функционала ---
 
@@ -229,3 +240,12 @@ class NewsArticle(Base):
     published_at = Column(DateTime(timezone=True), nullable=True)
     added_at = Column(DateTime(timezone=True), server_default=func.now())
 
+
+class BotState(Base):
+    """Служебные значения бота (например, offset для long polling)."""
+
+    __tablename__ = 'bot_state'
+
+    key = Column(String, primary_key=True)
+    value = Column(String, nullable=True)
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
@@ -6,7 +6,7 @@ from typing import List, Optional, Any
 from datetime import datetime, timedelta, timezone
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.future import select
-from sqlalchemy import update as sqlalchemy_update, desc, delete as sqlalchemy_delete
+from sqlalchemy import update as sqlalchemy_update, desc, delete as sqlalchemy_delete, and_
 from sqlalchemy.orm import selectinload
 from sqlalchemy.sql import func
 from telegram import User as TelegramUser
@@ -25,8 +25,13 @@ from .models import (
     CoursePurchase,
     UsageStats,
     NewsArticle,
+    BotState,
 )
 from utils import hash_value
+from utils.history_buffer import Turn, history_buffer
+from utils.profile_cache import UserProfile, profile_cache
+from utils.quota import daily_quota
+from .chat_log import FLUSHED, ChatLogHandle, chat_log_writer
 
 logger = logging.getLogger(__name__)
 
@@ -37,6 +42,116 @@ async def safe_commit(session: AsyncSession):
         await session.rollback()
         logger.error(f"Ошибка при commit(): {e}")
         raise
+
+# --- Контекст запроса ---
+class RequestContext:
+    """Данные пользователя, нужные для обработки одного сообщения.
+
+    Загружается одним запросом в начале ``handle_update`` и хранится в
+    ``session.info`` и ``context.user_data['request_context']``, поэтому
+    ``get_user``, ``get_subscription``, ``start_dialog`` и ``add_chat_message``
+    в рамках того же запроса не обращаются к БД повторно.
+    """
+
+    __slots__ = ("user", "subscription", "dialog", "messages_today")
+
+    def __init__(self, user: User, subscription: Optional[Subscription], dialog: Dialog, messages_today: int):
+        self.user = user
+        self.subscription = subscription
+        self.dialog = dialog
+        self.messages_today = messages_today
+
+    @property
+    def has_active_subscription(self) -> bool:
+        return bool(self.subscription and self.subscription.is_active)
+
+
+def _request_context(session: AsyncSession, user_id: int) -> Optional[RequestContext]:
+    ctx = session.info.get("request_context")
+    if ctx is not None and ctx.user.id == user_id:
+        return ctx
+    return None
+
+
+async def load_request_context(session: AsyncSession, tg_user: TelegramUser) -> RequestContext:
+    """Загружает пользователя, подписку и активный диалог одним SELECT.
+
+    Число сообщений за сегодня берётся из счётчика в Redis (``utils.quota``);
+    COUNT по chat_history выполняется, только если счётчика ещё нет.
+    Время последнего контакта обновляет ``add_chat_message``; commit здесь
+    нужен, только если создаётся пользователь или диалог либо изменился профиль.
+    """
+    result = await session.execute(
+        select(User, Subscription, Dialog)
+        .outerjoin(Subscription, Subscription.user_id == User.id)
+        .outerjoin(Dialog, and_(Dialog.user_id == User.id, Dialog.is_active == True))
+        .where(User.id == tg_user.id)
+        .limit(1)
+    )
+    row = result.first()
+    now = datetime.now(timezone.utc)
+    if row is None:
+        user = User(
+            id=tg_user.id,
+            username=tg_user.username,
+            first_name=tg_user.first_name,
+            last_name=tg_user.last_name,
+            last_activity_at=now,
+            last_contact_at=now,
+            show_recommendations=True,
+        )
+        dialog = Dialog(user_id=tg_user.id)
+        session.add(user)
+        await session.flush()
+        session.add(dialog)
+        await safe_commit(session)
+        ctx = RequestContext(user, None, dialog, 0)
+    else:
+        user, subscription, dialog = row
+        if user.username != tg_user.username or user.first_name != tg_user.first_name or user.last_name != tg_user.last_name:
+            user.username = tg_user.username
+            user.first_name = tg_user.first_name
+            user.last_name = tg_user.last_name
+        if dialog is None:
+            dialog = Dialog(user_id=user.id)
+            session.add(dialog)
+        if session.new or session.dirty:
+            # Диалог и пользователь должны быть в БД до отложенной записи сообщений
+            await safe_commit(session)
+        messages_today = await daily_quota.count(user.id, lambda: count_user_messages_today(session, user.id))
+        ctx = RequestContext(user, subscription, dialog, messages_today)
+    session.info["request_context"] = ctx
+    # Снимок только что прочитан из БД — освежаем локальный уровень кэша
+    profile_cache.prime(UserProfile.from_models(ctx.user, ctx.subscription))
+    return ctx
+
+
+async def get_user_profile(session: AsyncSession, user_id: int) -> Optional[UserProfile]:
+    """Язык, настройки, баланс звёзд и подписка пользователя.
+
+    Читается из контекста запроса, затем из кэша профилей (память, Redis);
+    в БД идёт только при промахе — одним SELECT пользователя с подпиской.
+    """
+    ctx = _request_context(session, user_id)
+    if ctx is not None:
+        return UserProfile.from_models(ctx.user, ctx.subscription)
+    profile = await profile_cache.get(user_id)
+    if profile is not None:
+        return profile
+    generation = profile_cache.generation(user_id)
+    result = await session.execute(
+        select(User, Subscription)
+        .outerjoin(Subscription, Subscription.user_id == User.id)
+        .where(User.id == user_id)
+        .limit(1)
+    )
+    row = result.first()
+    if row is None:
+        return None
+    profile = UserProfile.from_models(*row)
+    await profile_cache.set(profile, generation=generation)
+    return profile
+
 
 # --- Операции с пользователями ---
 async def get_or_create_user(session: AsyncSession, tg_user: TelegramUser) -> User:
@@ -84,6 +199,9 @@ async def get_or_create_user(session: AsyncSession, tg_user: TelegramUser) -> Us
         return new_user
 
 async def get_user(session: AsyncSession, user_id: int) -> Optional[User]:
+    ctx = _request_context(session, user_id)
+    if ctx is not None:
+        return ctx.user
     result = await session.execute(select(User).filter(User.id == user_id))
     return result.scalar_one_or_none()
 
@@ -94,6 +212,7 @@ async def update_user_settings(session: AsyncSession, user_id: int, **kwargs):
         sqlalchemy_update(User).where(User.id == user_id).values(**kwargs)
     )
     await safe_commit(session)
+    await profile_cache.invalidate(user_id)
 
 async def get_user_stats(session: AsyncSession, user_id: int) -> dict:
     user = await get_user(session, user_id)
@@ -128,6 +247,7 @@ async def add_stars(session: AsyncSession, user_id: int, amount: int):
         .values(stars_balance=User.stars_balance + amount)
     )
     await safe_commit(session)
+    await profile_cache.invalidate(user_id)
     await update_usage_stats(session, user_id)
 
 async def increment_request_counter(session: AsyncSession, user_id: int, field: str):
@@ -154,6 +274,7 @@ async def deduct_stars(session: AsyncSession, user_id: int, amount: int) -> bool
         )
     )
     await safe_commit(session)
+    await profile_cache.invalidate(user_id)
     await update_usage_stats(session, user_id)
     return True
 
@@ -301,6 +422,9 @@ async def remove_coin_from_portfolio(session: AsyncSession, user_id: int, symbol
 
 # --- Операции с Диалогами ---
 async def get_active_dialog(session: AsyncSession, user_id: int) -> Optional[Dialog]:
+    ctx = _request_context(session, user_id)
+    if ctx is not None and ctx.dialog is not None and ctx.dialog.is_active:
+        return ctx.dialog
     result = await session.execute(
         select(Dialog).filter(Dialog.user_id == user_id, Dialog.is_active == True)
     )
@@ -329,6 +453,9 @@ async def end_dialog(session: AsyncSession, dialog_id: int):
         .values(is_active=False, ended_at=datetime.now(timezone.utc))
     )
     await safe_commit(session)
+    ctx = session.info.get("request_context")
+    if ctx is not None and ctx.dialog is not None and ctx.dialog.id == dialog_id:
+        ctx.dialog.is_active = False
 
 
 async def update_dialog(session: AsyncSession, dialog_id: int, **kwargs):
@@ -340,6 +467,21 @@ async def update_dialog(session: AsyncSession, dialog_id: int, **kwargs):
     await safe_commit(session)
 
 
+async def get_dialog(session: AsyncSession, dialog_id: int) -> Optional[Dialog]:
+    return await session.get(Dialog, dialog_id)
+
+
+async def get_dialog_messages(
+    session: AsyncSession, dialog_id: int, after: Optional[datetime] = None, limit: int = 200
+) -> List[ChatHistory]:
+    """Записанные сообщения диалога после ``after``, старые первыми."""
+    query = select(ChatHistory).filter(ChatHistory.dialog_id == dialog_id)
+    if after is not None:
+        query = query.filter(ChatHistory.timestamp > after)
+    result = await session.execute(query.order_by(ChatHistory.timestamp).limit(limit))
+    return list(result.scalars().all())
+
+
 async def get_top_user_topics(session: AsyncSession, user_id: int, limit: int = 3) -> List[str]:
     result = await session.execute(
         select(ChatHistory.request_type, func.count())
@@ -364,12 +506,18 @@ async def add_chat_message(
     error: bool = False,
     event: Optional[str] = None,
 ) -> ChatHistory:
-    """Добавляет новое сообщение в историю чата пользователя."""
+    """Добавляет новое сообщение в историю чата пользователя.
+
+    Пока запущен ``chat_log_writer``, строка записывается отложенно пачкой и
+    возвращается ``ChatLogHandle``; иначе — сразу, как объект ``ChatHistory``.
+    """
+    ctx = _request_context(session, user_id)
     user = await get_user(session, user_id)
     if dialog_id is None:
         dialog = await start_dialog(session, user_id)
         dialog_id = dialog.id
-    new_message = ChatHistory(
+    now = datetime.now(timezone.utc)
+    row = dict(
         user_id=user_id,
         dialog_id=dialog_id,
         role=role,
@@ -386,32 +534,79 @@ async def add_chat_message(
         duration_ms=duration_ms,
         error=error,
         event=event,
-    )
-    session.add(new_message)
-    await session.execute(
-        sqlalchemy_update(User)
-        .where(User.id == user_id)
-        .values(last_contact_at=datetime.now(timezone.utc))
-    )
-    try:
-        await safe_commit(session)
-        await session.refresh(new_message)
-    except Exception as e:
-        logger.error(f"Ошибка при обновлении объекта после commit: {e}")
-        raise
+        timestamp=now,
+    )
+    if ctx is not None and role == "user":
+        ctx.messages_today += 1
+    history_buffer.append(user_id, role, text, now)
+    await history_buffer.publish(user_id, now)
+    if chat_log_writer.running:
+        # last_contact_at обновит сам writer одним UPDATE на пачку
+        new_message = chat_log_writer.log(row)
+    else:
+        new_message = ChatHistory(**row)
+        session.add(new_message)
+        if ctx is not None:
+            # Пользователь уже в сессии: время контакта уйдёт тем же flush
+            ctx.user.last_contact_at = now
+        else:
+            await session.execute(
+                sqlalchemy_update(User)
+                .where(User.id == user_id)
+                .values(last_contact_at=now)
+            )
+        try:
+            await safe_commit(session)
+            if ctx is None:
+                await session.refresh(new_message)
+        except Exception as e:
+            logger.error(f"Ошибка при обновлении объекта после commit: {e}")
+            raise
+    if role == "user":
+        await daily_quota.incr(user_id)
     return new_message
 
-async def update_chat_message(session: AsyncSession, message_id: int, **kwargs):
+async def update_chat_message(session: AsyncSession, message, **kwargs):
+    """Обновляет сообщение: ``ChatLogHandle``, ``ChatHistory`` или id.
+
+    Изменения ещё не записанной строки сливаются в неё без UPDATE.
+    """
     if not kwargs:
         return
+    if isinstance(message, ChatLogHandle):
+        if message.state != FLUSHED or chat_log_writer.running:
+            chat_log_writer.update(message, **kwargs)
+            return
+        message = message.id
+    message_id = getattr(message, "id", message)
     await session.execute(
         sqlalchemy_update(ChatHistory).where(ChatHistory.id == message_id).values(**kwargs)
     )
     await safe_commit(session)
 async def get_chat_history(session: AsyncSession, user_id: int, limit: int = 10) -> List[ChatHistory]:
-    """Возвращает последние N сообщений из истории чата пользователя."""
+    """Возвращает последние N сообщений из истории чата пользователя.
+
+    Ещё не записанные строки из ``chat_log_writer`` тоже учитываются.
+    """
     result = await session.execute(select(ChatHistory).filter(ChatHistory.user_id == user_id).order_by(desc(ChatHistory.timestamp)).limit(limit))
-    return list(reversed(result.scalars().all()))
+    history = list(result.scalars().all())
+    pending = chat_log_writer.pending_for(user_id)
+    if pending:
+        stored = {m.id for m in history}
+        # Буферизованные сообщения новее записанных
+        history = ([h for h in pending if h.id not in stored] + history)[:limit]
+    return list(reversed(history))
+
+
+async def get_recent_history(session: AsyncSession, user_id: int, limit: int = 10) -> List[Turn]:
+    """Последние N реплик для контекста ИИ из буфера в памяти (utils/history_buffer.py).
+
+    При промахе буфер загружается через ``get_chat_history``.
+    """
+    async def load(uid: int, n: int) -> List[ChatHistory]:
+        return await get_chat_history(session, uid, limit=n)
+
+    return await history_buffer.recent(user_id, limit, load)
 
 
 async def count_user_messages_today(session: AsyncSession, user_id: int) -> int:
@@ -543,11 +738,18 @@ async def create_or_update_subscription(
     except Exception as e:
         logger.error(f"Ошибка при обновлении объекта после commit: {e}")
         raise
+    ctx = _request_context(session, user_id)
+    if ctx is not None:
+        ctx.subscription = sub
+    await profile_cache.invalidate(user_id)
     await update_usage_stats(session, user_id)
     return sub
 
 
 async def get_subscription(session: AsyncSession, user_id: int) -> Optional[Subscription]:
+    ctx = _request_context(session, user_id)
+    if ctx is not None:
+        return ctx.subscription
     result = await session.execute(select(Subscription).filter(Subscription.user_id == user_id))
     return result.scalar_one_or_none()
 
@@ -750,3 +952,17 @@ async def get_recent_news(session: AsyncSession, symbol: str, limit: int = 5) ->
     )
     return result.scalars().all()
 
+
+# --- Служебное состояние бота ---
+async def get_bot_state(session: AsyncSession, key: str) -> Optional[str]:
+    result = await session.execute(select(BotState.value).filter(BotState.key == key))
+    return result.scalar_one_or_none()
+
+
+async def set_bot_state(session: AsyncSession, key: str, value: str) -> None:
+    state = await session.get(BotState, key)
+    if state:
+        state.value = value
+    else:
+        session.add(BotState(key=key, value=value))
+    await safe_commit(session)
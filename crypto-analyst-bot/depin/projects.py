@@ -1,10 +1,10 @@
 import logging
-import httpx
 from telegram import Update, constants
 from telegram.ext import CallbackContext
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from settings.messages import get_text
+from utils import market_http
 
 logger = logging.getLogger(__name__)
 
@@ -23,10 +23,9 @@ async def handle_depin_projects(update: Update, context: CallbackContext, payloa
         "page": 1,
     }
     try:
-        async with httpx.AsyncClient(timeout=15.0) as client:
-            resp = await client.get(API_URL, params=params)
-            resp.raise_for_status()
-            data = resp.json()
+        resp = await market_http.get(API_URL, params=params)
+        resp.raise_for_status()
+        data = resp.json()
     except Exception as e:
         logger.error(f"DePIN request failed: {e}")
         await update.effective_message.reply_text(get_text(lang, 'depin_no_data'))
@@ -5,10 +5,8 @@
 import os
 import logging
 import json
-import re
 from datetime import datetime
 import uvicorn
-import asyncio
 from fastapi import FastAPI, Request, Response, Depends
 from dotenv import load_dotenv
 from starlette.requests import ClientDisconnect
@@ -28,97 +26,202 @@ load_dotenv()
 # --- Конфигурация ---
 TELEGRAM_BOT_TOKEN = os.getenv("TELEGRAM_BOT_TOKEN")
 WEBHOOK_URL = os.getenv("WEBHOOK_URL")
+# webhook — Telegram присылает обновления сам; polling — бот забирает их через getUpdates
+UPDATE_MODE = os.getenv("UPDATE_MODE", "webhook").lower()
+# Сбрасывать ли накопившиеся обновления при установке вебхука
+WEBHOOK_DROP_PENDING = os.getenv("WEBHOOK_DROP_PENDING", "false").lower() in ("1", "true", "yes")
 
 if not TELEGRAM_BOT_TOKEN:
     logger.error("TELEGRAM_BOT_TOKEN не найден в переменных окружения!")
     raise ValueError("Необходимо указать TELEGRAM_BOT_TOKEN")
-if not WEBHOOK_URL:
+if UPDATE_MODE == "webhook" and not WEBHOOK_URL:
     logger.warning("WEBHOOK_URL не указан. Вебхук не будет установлен для продакшена.")
 
 
 # --- Импорт модулей бота ---
 from bot.core import handle_update
 from database.engine import init_db, get_db_session, AsyncSessionFactory
-from background.scheduler import start_scheduler
+from background.scheduler import start_scheduler, start_periodic_jobs, stop_periodic_jobs
+from background.leader import LeaderElector
 from analysis.metrics import gather_metrics
 from admin.routes import router as admin_router
 from database import operations as db_ops
+from database.chat_log import chat_log_writer
 from settings.messages import get_text
+from updates.queue import UpdateQueue, OVERFLOW_REJECT
+from updates.lanes import LaneScheduler
+from updates.parser import parse_updates
+from updates.dedup import UpdateDeduplicator
+from updates.polling import TELEGRAM_API_URL, UpdatePoller, make_offset_store
+from utils.runtime_metrics import collect_runtime_metrics
+from utils.profile_cache import profile_cache
+from utils.http_clients import http_clients
+from ai.summarizer import dialog_summarizer
 
 # --- Инициализация FastAPI ---
 app = FastAPI(title="Crypto AI Analyst Bot", version="1.0.0")
 app.include_router(admin_router)
 
 # --- Инициализация Telegram Bot API ---
-application = Application.builder().token(TELEGRAM_BOT_TOKEN).build()
+# base_url позволяет направить и ответы бота на локальный фейковый Bot API
+application = (
+    Application.builder()
+    .token(TELEGRAM_BOT_TOKEN)
+    .base_url(f"{TELEGRAM_API_URL.rstrip('/')}/bot")
+    .build()
+)
 bot = application.bot
 
 
 def _load_update_data(raw: bytes) -> list[dict]:
     """Парсит тело webhook-запроса и ВСЕГДА отдаёт список объектов."""
-    text = raw.decode("utf-8", "ignore").strip()
+    return parse_updates(raw)
 
-    # ① одиночный объект → оборачиваем в list
-    try:
-        return [json.loads(text)]
-    except json.JSONDecodeError:
-        pass
 
-    # ② несколько объектов подряд, разделённые запятой
-    cleaned = re.sub(r",\s*,+", ",", text).rstrip(", \n")
-    as_array = f"[{cleaned}]"
-    return json.loads(as_array)
+# Повторные доставки одного update_id отбрасываются ещё до очереди
+update_dedup = UpdateDeduplicator()
 
 
 async def process_update(update_data: dict) -> None:
     """Handle an incoming Telegram update in the background."""
-    async with AsyncSessionFactory() as session:
-        update = Update.de_json(update_data, bot)
-        context = CallbackContext.from_update(update, application)
-        await handle_update(update, context, session)
+    try:
+        async with AsyncSessionFactory() as session:
+            update = Update.de_json(update_data, bot)
+            context = CallbackContext.from_update(update, application)
+            await handle_update(update, context, session)
+    finally:
+        _ack_polled_update(update_data)
+
+
+def _ack_polled_update(update_data: dict) -> None:
+    """Подтверждает обработку для long polling, чтобы сдвинуть offset."""
+    if update_poller is not None:
+        update_poller.ack(update_data.get("update_id"))
+
+
+# Очередь входящих обновлений: вебхук только ставит задачу, воркеры обрабатывают.
+# Воркеры передают обновления в дорожки, чтобы сообщения одного пользователя
+# не обрабатывались параллельно и не конкурировали за строки users/dialogs.
+update_lanes = LaneScheduler(process_update, on_drop=_ack_polled_update)
+update_queue = UpdateQueue(update_lanes.dispatch)
+
+
+async def enqueue_polled_update(update_data: dict) -> bool:
+    """Ставит обновление из getUpdates в очередь, ожидая свободного места."""
+    update_id = update_data.get("update_id")
+    if await update_dedup.is_duplicate(update_id):
+        logger.info(f"Повторная доставка update_id={update_id} пропущена.")
+        update_poller.ack(update_id)
+        return True
+    accepted = await update_queue.put(update_data)
+    if not accepted:
+        await update_dedup.forget(update_id)
+    return accepted
+
+
+# Long polling кладёт обновления в ту же очередь, что и вебхук
+update_poller = (
+    UpdatePoller(
+        TELEGRAM_BOT_TOKEN,
+        enqueue_polled_update,
+        offset_store=make_offset_store(session_factory=AsyncSessionFactory),
+        allowed_updates=list(Update.ALL_TYPES),
+    )
+    if UPDATE_MODE == "polling"
+    else None
+)
 
 
 # --- Обработчики событий FastAPI ---
 
 
+async def _register_webhook() -> None:
+    webhook_url_path = f"/webhook/{TELEGRAM_BOT_TOKEN}"
+    full_webhook_url = f"{WEBHOOK_URL.rstrip('/')}{webhook_url_path}"
+
+    masked_token = TELEGRAM_BOT_TOKEN[:4] + "..." + TELEGRAM_BOT_TOKEN[-4:]
+    masked_url = f"{WEBHOOK_URL.rstrip('/')}/webhook/{masked_token}"
+
+    logger.info(f"Установка вебхука на URL: {masked_url}")
+    success = await bot.set_webhook(
+        url=full_webhook_url,
+        allowed_updates=Update.ALL_TYPES,
+        drop_pending_updates=WEBHOOK_DROP_PENDING,
+    )
+    if success:
+        logger.info("Вебхук успешно установлен.")
+    else:
+        logger.error("Не удалось установить вебхук.")
+
+
+async def _on_elected() -> None:
+    """Задачи, которые должны выполняться только в одном воркере."""
+    if update_poller is not None:
+        # Вебхук и getUpdates взаимоисключающие; очередь обновлений не сбрасываем
+        await bot.delete_webhook(drop_pending_updates=False)
+        await update_poller.start()
+    elif WEBHOOK_URL:
+        await _register_webhook()
+    start_periodic_jobs()
+
+
+async def _on_demoted() -> None:
+    stop_periodic_jobs()
+    if update_poller is not None:
+        await update_poller.stop()
+
+
+# Лидер среди воркеров uvicorn: планировщик, вебхук и long polling работают в одном процессе
+leader_elector = LeaderElector(on_elected=_on_elected, on_demoted=_on_demoted)
+
+
 @app.on_event("startup")
 async def startup_event():
     logger.info("Приложение запускается...")
     await init_db()
+    # Пулы соединений к LLM и внешним API живут всё время работы процесса
+    await http_clients.start()
 
     await application.initialize()
     await application.start()
+    # Подписка на инвалидации профилей от других воркеров
+    await profile_cache.start()
+    await chat_log_writer.start()
+    await update_queue.start()
 
-    if WEBHOOK_URL:
-        webhook_url_path = f"/webhook/{TELEGRAM_BOT_TOKEN}"
-        full_webhook_url = f"{WEBHOOK_URL.rstrip('/')}{webhook_url_path}"
-
-        masked_token = TELEGRAM_BOT_TOKEN[:4] + "..." + TELEGRAM_BOT_TOKEN[-4:]
-        masked_url = f"{WEBHOOK_URL.rstrip('/')}/webhook/{masked_token}"
-
-        logger.info(f"Установка вебхука на URL: {masked_url}")
-        success = await bot.set_webhook(
-            url=full_webhook_url,
-            allowed_updates=Update.ALL_TYPES,
-            drop_pending_updates=True,
-        )
-        if success:
-            logger.info("Вебхук успешно установлен.")
-        else:
-            logger.error("Не удалось установить вебхук.")
-
-    # Запускаем планировщик фоновых задач
-    start_scheduler(bot)
+    # Планировщик нужен в каждом воркере для разовых напоминаний;
+    # периодические задачи регистрирует только лидер
+    start_scheduler(bot, periodic=False)
     logger.info("Планировщик запущен.")
+    await leader_elector.start()
 
 
 @app.on_event("shutdown")
 async def shutdown_event():
     logger.info("Приложение останавливается...")
+    was_leader = leader_elector.is_leader
+    if update_poller is not None:
+        # Прекращаем забирать новые обновления
+        await update_poller.stop()
+    # Сначала дорабатываем уже принятые обновления, пока бот ещё запущен
+    await update_queue.stop()
+    # Дописываем отложенную историю чата
+    await chat_log_writer.stop()
+    if update_poller is not None and was_leader:
+        # Offset сдвигается только по обработанным обновлениям: недоработанное
+        # Telegram пришлёт снова после перезапуска
+        await update_poller.save_offset()
+    # Роль лидера освобождается после дренажа очереди, чтобы новый лидер
+    # не начал забирать обновления, которые этот процесс ещё обрабатывает
+    await leader_elector.stop()
     await application.stop()
     await application.shutdown()
-    await bot.delete_webhook()
-    logger.info("Вебхук удален.")
+    await profile_cache.stop()
+    await dialog_summarizer.stop()
+    await http_clients.stop()
+    if was_leader and update_poller is None:
+        await bot.delete_webhook()
+        logger.info("Вебхук удален.")
 
 
 # --- Эндпоинты FastAPI ---
@@ -134,6 +237,11 @@ async def metrics_endpoint(db_session: AsyncSession = Depends(get_db_session)):
     return await gather_metrics(db_session)
 
 
+@app.get("/metrics/runtime", summary="Метрики процесса")
+async def runtime_metrics_endpoint():
+    return collect_runtime_metrics()
+
+
 @app.post("/payments/callback", summary="Payment webhook")
 async def payments_callback(
     request: Request,
@@ -146,9 +254,9 @@ async def payments_callback(
 
     event_type = data.get("type")
     lang = "ru"
-    user = await db_ops.get_user(db_session, user_id)
-    if user:
-        lang = user.language
+    profile = await db_ops.get_user_profile(db_session, user_id)
+    if profile:
+        lang = profile.language
 
     if event_type == "stars":
         amount = int(data.get("amount", 0))
@@ -187,18 +295,29 @@ async def payments_callback(
 
 
 @app.post("/webhook/{token}", summary="Вебхук для Telegram")
-async def telegram_webhook(
-    request: Request, token: str, db_session: AsyncSession = Depends(get_db_session)
-):
+async def telegram_webhook(request: Request, token: str):
     if token != TELEGRAM_BOT_TOKEN:
         return Response(status_code=403)
 
+    raw_body = None
     try:
         raw_body = await request.body()  # читаем тело один раз
         updates = _load_update_data(raw_body)  # ВСЕГДА list[dict]
 
+        rejected = 0
         for upd in updates:
-            asyncio.create_task(process_update(upd))
+            update_id = upd.get("update_id")
+            if await update_dedup.is_duplicate(update_id):
+                # Повтор Telegram не занимает место в очереди и не вызывает 503
+                logger.info(f"Повторная доставка update_id={update_id} пропущена.")
+                continue
+            if not update_queue.submit(upd):
+                rejected += 1
+                # Без отметки повторная доставка этого обновления будет принята
+                await update_dedup.forget(update_id)
+        if rejected and update_queue.overflow == OVERFLOW_REJECT:
+            # Telegram повторит доставку позже — так нагрузка сбрасывается без потерь
+            return Response(status_code=503)
 
     except ClientDisconnect:
         logger.warning(
@@ -219,8 +338,6 @@ async def telegram_webhook(
     return Response(status_code=200)
 
 
-
-
 # --- Запуск приложения ---
 if __name__ == "__main__":
     uvicorn.run("main:app", host="0.0.0.0", port=8000, reload=True)
@@ -1,10 +1,10 @@
 import logging
-import httpx
 from telegram import Update, constants
 from telegram.ext import CallbackContext
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from settings.messages import get_text
+from utils import market_http
 
 logger = logging.getLogger(__name__)
 
@@ -21,10 +21,9 @@ async def handle_nft_analytics(update: Update, context: CallbackContext, payload
     await update.effective_message.reply_text(get_text(lang, 'nft_searching', slug=slug))
 
     try:
-        async with httpx.AsyncClient(timeout=15.0) as client:
-            resp = await client.get(API_URL.format(slug=slug))
-            resp.raise_for_status()
-            data = resp.json().get('stats', {})
+        resp = await market_http.get(API_URL.format(slug=slug))
+        resp.raise_for_status()
+        data = resp.json().get('stats', {})
     except Exception as e:
         logger.exception(f"OpenSea request failed: {e}")
         await update.effective_message.reply_text(
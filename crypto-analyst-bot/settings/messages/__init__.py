@@ -10,7 +10,7 @@ def _load_messages():
     if messages:
         return messages
 
-    base = pathlib.Path(__file__).with_suffix("")
+    base = pathlib.Path(__file__).parent
     for fp in base.glob("*.json"):
         try:
             with fp.open(encoding="utf-8") as f:
@@ -28,3 +28,8 @@ def get_text(language: str, key: str, **kwargs) -> str:
     lang = language if language in msgs else "ru"
     text = msgs.get(lang, {}).get(key) or msgs.get("ru", {}).get(key, "")
     return text.format(**kwargs)
+
+
+def get_translations(key: str) -> dict:
+    """Возвращает текст ключа на всех языках: {lang: text}."""
+    return {lang: msgs[key] for lang, msgs in _load_messages().items() if msgs.get(key)}
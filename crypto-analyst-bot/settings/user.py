@@ -49,8 +49,8 @@ async def handle_setup_alert(update: Update, context: CallbackContext, payload:
 
         # Check free alert limit for non-subscribers
         alerts = await db_ops.get_user_alerts(db_session, user_id)
-        subscription = await db_ops.get_subscription(db_session, user_id)
-        if len(alerts) >= MAX_FREE_ALERTS and not (subscription and subscription.is_active):
+        profile = await db_ops.get_user_profile(db_session, user_id)
+        if len(alerts) >= MAX_FREE_ALERTS and not (profile and profile.subscription_active):
             await update.effective_message.reply_text(get_text(lang, 'alert_limit', limit=MAX_FREE_ALERTS))
             return
 
@@ -185,8 +185,8 @@ async def handle_hints_command(update: Update, context: CallbackContext, payload
         await db_ops.update_user_settings(db_session, user_id, show_recommendations=enabled)
         context.user_data['recommendations_enabled'] = enabled
     else:
-        user = await db_ops.get_user(db_session, user_id)
-        enabled = getattr(user, 'show_recommendations', True)
+        profile = await db_ops.get_user_profile(db_session, user_id)
+        enabled = profile.show_recommendations if profile else True
 
     text = get_text(lang, 'recommendations_on' if enabled else 'recommendations_off')
     await update.effective_message.reply_text(text)
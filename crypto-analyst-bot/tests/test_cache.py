@@ -0,0 +1,138 @@
+import asyncio
+import json
+
+from utils.cache import NOT_FOUND, LayeredCache
+from utils.circuit_breaker import CircuitBreaker, OPEN
+
+
+class _Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+class FakeRedis:
+    def __init__(self):
+        self.data = {}
+        self.calls = 0
+        self.down = False
+
+    async def get(self, key):
+        self.calls += 1
+        if self.down:
+            raise ConnectionError("connection refused")
+        return self.data.get(key)
+
+    async def set(self, key, value, ex=None, nx=False):
+        self.calls += 1
+        if self.down:
+            raise ConnectionError("connection refused")
+        if nx and key in self.data:
+            return None
+        self.data[key] = value
+        return True
+
+    async def delete(self, key):
+        self.calls += 1
+        self.data.pop(key, None)
+
+
+def _cache(redis, clock, **kwargs):
+    breaker = CircuitBreaker(failure_threshold=2, reset_timeout=10, clock=clock)
+    return LayeredCache(redis, local_prefixes={"cg", "pred"}, breaker=breaker, clock=clock, **kwargs)
+
+
+def test_local_tier_serves_market_prefixes_only():
+    redis, clock = FakeRedis(), _Clock()
+    cache = _cache(redis, clock, name="test_cache_local")
+
+    async def scenario():
+        await cache.set("cg:/simple/price:ids=bitcoin", "{}", ttl=45)
+        await cache.set("offset:bot", "42", ttl=60)
+        calls = redis.calls
+        for _ in range(5):
+            assert await cache.get("cg:/simple/price:ids=bitcoin") == "{}"
+            assert await cache.get("offset:bot") == "42"
+        return redis.calls - calls
+
+    assert asyncio.run(scenario()) == 5  # только offset:bot ходит в Redis
+    stats = cache.stats()["prefixes"]
+    assert stats["cg"]["local_hits"] == 5 and stats["cg"]["hit_rate"] == 1.0
+    assert stats["offset"]["redis_hits"] == 5
+
+
+def test_breaker_bypasses_redis_while_it_is_down():
+    redis, clock = FakeRedis(), _Clock()
+    cache = _cache(redis, clock, name="test_cache_breaker")
+    redis.down = True
+
+    async def scenario():
+        for _ in range(10):
+            assert await cache.get("hist:bitcoin:30") is None
+        assert cache.breaker.state == OPEN
+        assert await cache.set_nx("upd:1") is None
+        calls = redis.calls
+        # Через reset_timeout — одна проба; Redis снова доступен
+        clock.now += 11
+        redis.down = False
+        await cache.set("hist:bitcoin:30", "[]")
+        assert await cache.get("hist:bitcoin:30") == "[]"
+        return calls
+
+    assert asyncio.run(scenario()) == 2
+    stats = cache.stats()
+    assert stats["redis_errors"] == 2 and stats["redis_bypassed"] == 9
+
+
+def test_stale_value_is_served_and_refreshed_in_background():
+    redis, clock = FakeRedis(), _Clock()
+    cache = _cache(redis, clock, stale_ttl=60, name="test_cache_swr")
+    fetched = []
+
+    async def fetch():
+        fetched.append(1)
+        await asyncio.sleep(0.01)
+        return {"short": len(fetched)}
+
+    async def scenario():
+        assert await cache.get_or_fetch("pred:BTC", fetch, ttl=30) == {"short": 1}
+        assert await cache.get_or_fetch("pred:BTC", fetch, ttl=30) == {"short": 1}
+        clock.now += 31
+        # Устаревшее значение отдаётся сразу, обновление одно на всех
+        stale = await asyncio.gather(*(cache.get_or_fetch("pred:BTC", fetch, ttl=30) for _ in range(5)))
+        assert stale == [{"short": 1}] * 5
+        await asyncio.sleep(0.05)
+        return await cache.get_or_fetch("pred:BTC", fetch, ttl=30)
+
+    assert asyncio.run(scenario()) == {"short": 2}
+    assert len(fetched) == 2
+    counts = cache.stats()["prefixes"]["pred"]
+    assert counts["stale"] == 5 and counts["refreshes"] == 1
+
+
+def test_not_found_is_cached_and_errors_are_not():
+    redis, clock = FakeRedis(), _Clock()
+    cache = _cache(redis, clock, negative_ttl=120, name="test_cache_negative")
+    calls = {"missing": 0, "broken": 0}
+
+    async def missing():
+        calls["missing"] += 1
+        return NOT_FOUND
+
+    async def broken():
+        calls["broken"] += 1
+        return None
+
+    async def scenario():
+        for _ in range(3):
+            assert await cache.get_or_fetch("cg:/coins/nope/market_chart", missing, ttl=45) is None
+            assert await cache.get_or_fetch("cg:/coins/down/market_chart", broken, ttl=45) is None
+        # Значение без срока свежести (записано до обновления) читается как есть
+        redis.data["bin:/api/v3/ticker/price:symbol=BTCUSDT"] = json.dumps({"price": "1"})
+        return await cache.get_or_fetch("bin:/api/v3/ticker/price:symbol=BTCUSDT", broken, ttl=45)
+
+    assert asyncio.run(scenario()) == {"price": "1"}
+    assert calls == {"missing": 1, "broken": 3}
+    assert cache.stats()["prefixes"]["cg"]["negative_hits"] == 2
@@ -0,0 +1,81 @@
+import asyncio
+import sys
+import types
+
+sys.modules.setdefault('httpx', types.ModuleType('httpx'))
+dotenv_mod = types.ModuleType('dotenv')
+dotenv_mod.load_dotenv = lambda *args, **kwargs: None
+sys.modules.setdefault('dotenv', dotenv_mod)
+
+from ai import dispatcher
+
+
+def test_structured_response_is_validated():
+    result = dispatcher.parse_structured_response(
+        '```json\n{"intent": "crypto_info", "entities": {"symbols": ["BTC", "ETH"]}, "confidence": 0.9}\n```'
+    )
+    assert result.intent == "CRYPTO_INFO"
+    assert result.entities == {"symbols": "BTC,ETH"}
+    assert result.confidence == 0.9
+
+    assert dispatcher.parse_structured_response('{"intent": "GENERAL_CHAT"}').entities == {"payload": ""}
+    assert dispatcher.parse_structured_response('{"intent": "MAKE_COFFEE", "entities": {}}') is None
+    assert dispatcher.parse_structured_response('{"intent": "CRYPTO_INFO", "entities": "BTC"}') is None
+    assert dispatcher.parse_structured_response("CRYPTO_INFO") is None
+
+
+def test_key_values_keeps_every_pair():
+    assert dispatcher.parse_key_values("symbol:BTC\nprice: 120000\n") == {"symbol": "BTC", "price": "120000"}
+    assert dispatcher.parse_key_values("alert_data:BTC:120000:above") == {"alert_data": "BTC:120000:above"}
+    assert dispatcher.parse_key_values("payload:") == {"payload": ""}
+
+
+def test_combined_call_falls_back_to_two_steps(monkeypatch):
+    calls = []
+
+    async def bad_json(prompt):
+        calls.append("combined")
+        return "CRYPTO_INFO symbols BTC"
+
+    async def classify(text):
+        calls.append("classify")
+        return "CRYPTO_INFO"
+
+    async def extract(intent, text):
+        calls.append("extract")
+        return {"symbols": "BTC"}
+
+    monkeypatch.setattr(dispatcher, "GEMINI_API_KEY", "key")
+    monkeypatch.setattr(dispatcher, "OPENAI_API_KEY", None)
+    monkeypatch.setattr(dispatcher, "_combined_gemini", bad_json)
+    monkeypatch.setattr(dispatcher, "classify_intent", classify)
+    monkeypatch.setattr(dispatcher, "extract_entities", extract)
+
+    assert asyncio.run(dispatcher.classify_and_extract("цена биткоина")) == ("CRYPTO_INFO", {"symbols": "BTC"})
+    assert calls == ["combined", "classify", "extract"]
+
+
+def test_first_valid_structured_answer_wins(monkeypatch):
+    async def gemini(prompt):
+        return "не JSON"
+
+    async def openai(prompt):
+        await asyncio.sleep(0.01)
+        return '{"intent": "PRICE_PREDICTION", "entities": {"symbol": "SOL"}, "confidence": 0.8}'
+
+    monkeypatch.setattr(dispatcher, "GEMINI_API_KEY", "key")
+    monkeypatch.setattr(dispatcher, "OPENAI_API_KEY", "key")
+    monkeypatch.setattr(dispatcher, "_combined_gemini", gemini)
+    monkeypatch.setattr(dispatcher, "_combined_openai", openai)
+
+    intent, entities = asyncio.run(dispatcher.classify_and_extract("прогноз солана"))
+    assert intent == "PRICE_PREDICTION" and entities == {"symbol": "SOL"}
+
+
+def test_ab_split_by_user(monkeypatch):
+    monkeypatch.setattr(dispatcher, "DISPATCH_MODE", "ab")
+    monkeypatch.setattr(dispatcher, "DISPATCH_AB_PERCENT", 30)
+    assert dispatcher.use_combined(129) is True
+    assert dispatcher.use_combined(131) is False
+    monkeypatch.setattr(dispatcher, "DISPATCH_MODE", "two_step")
+    assert dispatcher.use_combined(129) is False
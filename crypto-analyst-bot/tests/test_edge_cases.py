@@ -67,6 +67,7 @@ def _noop_sync(*a, **k):
 async def _noop(*a, **k):
     return None
 sys.modules['database.operations'].start_dialog = _noop
+sys.modules['database.operations'].load_request_context = _noop
 sys.modules['database.operations'].add_chat_message = lambda *a, **k: None
 async def _return_none(*a, **k):
     return None
@@ -99,7 +100,7 @@ def test_handle_update_ignores_callback(monkeypatch):
     context = types.SimpleNamespace(bot=types.SimpleNamespace(id=1), user_data={})
     async def fail(*a, **k):
         raise AssertionError('db should not be accessed')
-    monkeypatch.setattr(core.db_ops, 'get_or_create_user', fail)
+    monkeypatch.setattr(core.db_ops, 'load_request_context', fail)
     asyncio.run(core.handle_update(update, context, db_session=None))
     assert answered.get('ok')
 
@@ -115,14 +116,14 @@ def test_daily_limit_exceeded(monkeypatch):
         effective_user=types.SimpleNamespace(is_bot=False, id=9),
     )
     context = types.SimpleNamespace(bot=types.SimpleNamespace(id=1), user_data={})
-    async def user_func(*a, **k):
-        return types.SimpleNamespace(id=9, language='ru', show_recommendations=True)
-    monkeypatch.setattr(core.db_ops, 'get_or_create_user', user_func)
-    monkeypatch.setattr(core.db_ops, 'get_subscription', _noop)
-    async def count_msgs(*a, **k):
-        return core.DAILY_FREE_MESSAGES + 1
-    monkeypatch.setattr(core.db_ops, 'count_user_messages_today', count_msgs)
-    monkeypatch.setattr(core.db_ops, 'start_dialog', _noop)
+    async def load_ctx(*a, **k):
+        return types.SimpleNamespace(
+            user=types.SimpleNamespace(id=9, language='ru', show_recommendations=True),
+            subscription=None,
+            dialog=types.SimpleNamespace(id=1, topic=None),
+            messages_today=core.DAILY_FREE_MESSAGES + 1,
+        )
+    monkeypatch.setattr(core.db_ops, 'load_request_context', load_ctx)
     monkeypatch.setattr(core.db_ops, 'add_chat_message', _noop)
     monkeypatch.setattr(core, 'classify_intent', _noop)
     monkeypatch.setattr(core, 'get_text', lambda lang, key, **kw: 'LIMIT' if key == 'free_daily_limit' else key)
@@ -61,6 +61,7 @@ sys.modules['database.operations'].count_user_messages_today = lambda *args, **k
 async def _noop(*a, **k):
     return None
 sys.modules['database.operations'].start_dialog = _noop
+sys.modules['database.operations'].load_request_context = _noop
 sys.modules['database.operations'].add_chat_message = lambda *a, **k: None
 sys.modules.setdefault('database.engine', types.ModuleType('database.engine'))
 sys.modules['database.engine'].AsyncSessionFactory = object
@@ -81,7 +82,7 @@ def test_handle_update_ignores_bot(monkeypatch):
     async def fail(*args, **kwargs):
         raise AssertionError("db should not be accessed")
 
-    monkeypatch.setattr(core.db_ops, "get_or_create_user", fail)
+    monkeypatch.setattr(core.db_ops, "load_request_context", fail)
 
     asyncio.run(core.handle_update(update, context, db_session=None))
 
@@ -98,7 +99,7 @@ def test_handle_update_ignores_empty(monkeypatch):
     async def fail(*args, **kwargs):
         raise AssertionError("db should not be accessed")
 
-    monkeypatch.setattr(core.db_ops, "get_or_create_user", fail)
+    monkeypatch.setattr(core.db_ops, "load_request_context", fail)
 
     asyncio.run(core.handle_update(update, context, db_session=None))
 
@@ -117,21 +118,19 @@ def test_handle_update_daily_limit(monkeypatch):
     )
     context = types.SimpleNamespace(bot=types.SimpleNamespace(id=1), user_data={})
 
-    async def user_func(*args, **kwargs):
-        return types.SimpleNamespace(id=3, language="ru", show_recommendations=True)
+    async def load_ctx(*args, **kwargs):
+        return types.SimpleNamespace(
+            user=types.SimpleNamespace(id=3, language="ru", show_recommendations=True),
+            subscription=None,
+            dialog=types.SimpleNamespace(id=1, topic=None),
+            messages_today=core.DAILY_FREE_MESSAGES,
+        )
 
-    monkeypatch.setattr(core.db_ops, "get_or_create_user", user_func)
-    async def no_sub(*a, **k):
-        return None
-    async def count_msgs(*a, **k):
-        return core.DAILY_FREE_MESSAGES
-    monkeypatch.setattr(core.db_ops, "get_subscription", no_sub)
-    monkeypatch.setattr(core.db_ops, "count_user_messages_today", count_msgs)
+    monkeypatch.setattr(core.db_ops, "load_request_context", load_ctx)
 
     async def fail(*a, **k):
         raise AssertionError("should not be called")
 
-    monkeypatch.setattr(core.db_ops, "start_dialog", fail)
     async def add_msg(*a, **k):
         pass
     monkeypatch.setattr(core.db_ops, "add_chat_message", add_msg)
@@ -140,3 +139,114 @@ def test_handle_update_daily_limit(monkeypatch):
 
     asyncio.run(core.handle_update(update, context, db_session=None))
     assert messages.get("text") == "LIMIT"
+
+
+def test_menu_button_skips_llm(monkeypatch):
+    update = types.SimpleNamespace(
+        callback_query=None,
+        pre_checkout_query=None,
+        effective_message=types.SimpleNamespace(text="Цены"),
+        effective_user=types.SimpleNamespace(is_bot=False, id=4),
+    )
+    context = types.SimpleNamespace(bot=types.SimpleNamespace(id=1), user_data={})
+
+    async def load_ctx(*args, **kwargs):
+        return types.SimpleNamespace(
+            user=types.SimpleNamespace(id=4, language="ru", show_recommendations=False),
+            subscription=None,
+            dialog=types.SimpleNamespace(id=1, topic=None),
+            messages_today=0,
+        )
+
+    async def fail(*a, **k):
+        raise AssertionError("LLM should not be called")
+
+    calls = []
+
+    async def prices(update, context, payload, db_session):
+        calls.append(payload)
+
+    async def record(*a, **k):
+        calls.append(k.get("request_type"))
+
+    monkeypatch.setattr(core.db_ops, "load_request_context", load_ctx)
+    monkeypatch.setattr(core.db_ops, "add_chat_message", _noop)
+    monkeypatch.setattr(core.db_ops, "update_chat_message", record, raising=False)
+    monkeypatch.setattr(core, "classify_intent", fail)
+    monkeypatch.setattr(core, "extract_entities", fail)
+    route, _ = core.router.match("Цены")
+    monkeypatch.setattr(route, "handler", prices)
+
+    asyncio.run(core.handle_update(update, context, db_session=None))
+    assert calls == ["CRYPTO_INFO", "BTC,ETH"]
+
+
+def test_independent_stages_overlap_and_bookkeeping_follows_reply(monkeypatch):
+    import time
+
+    events = []
+
+    async def reply(text=None, *a, **k):
+        events.append(("reply", text))
+
+    update = types.SimpleNamespace(
+        callback_query=None,
+        pre_checkout_query=None,
+        effective_message=types.SimpleNamespace(text="что там с рынком", chat_id=5, reply_text=reply),
+        effective_user=types.SimpleNamespace(is_bot=False, id=5),
+    )
+
+    async def send_chat_action(**kwargs):
+        events.append(("typing",))
+
+    context = types.SimpleNamespace(bot=types.SimpleNamespace(id=1, send_chat_action=send_chat_action), user_data={})
+
+    async def load_ctx(*args, **kwargs):
+        return types.SimpleNamespace(
+            user=types.SimpleNamespace(id=5, language="ru", show_recommendations=False),
+            subscription=None,
+            dialog=types.SimpleNamespace(id=1, topic=None),
+            messages_today=0,
+        )
+
+    async def classify(text):
+        await asyncio.sleep(0.05)
+        return "GENERAL_CHAT"
+
+    async def extract(intent, text):
+        return {"payload": text}
+
+    async def topics(*a, **k):
+        await asyncio.sleep(0.05)
+        return ["CRYPTO_INFO"]
+
+    async def update_dialog(*a, **k):
+        events.append(("update_dialog", k.get("topic")))
+
+    async def update_msg(session, msg, **k):
+        events.append(("update_msg", k.get("request_type")))
+
+    async def handler(update, context, payload, db_session):
+        events.append(("handler", payload))
+
+    monkeypatch.setattr(core, "LOCAL_INTENT_CLASSIFIER", False)
+    monkeypatch.setattr(core, "use_combined", lambda user_id: False)
+    monkeypatch.setattr(core, "classify_intent", classify)
+    monkeypatch.setattr(core, "extract_entities", extract)
+    monkeypatch.setattr(core.db_ops, "load_request_context", load_ctx)
+    monkeypatch.setattr(core.db_ops, "add_chat_message", _noop)
+    monkeypatch.setattr(core.db_ops, "get_top_user_topics", topics, raising=False)
+    monkeypatch.setattr(core.db_ops, "update_dialog", update_dialog, raising=False)
+    monkeypatch.setattr(core.db_ops, "update_chat_message", update_msg, raising=False)
+    monkeypatch.setitem(core.router._handlers, "GENERAL_CHAT", handler)
+
+    started = time.perf_counter()
+    asyncio.run(core.handle_update(update, context, db_session=None))
+    elapsed = time.perf_counter() - started
+
+    # Классификация и запрос тем идут одновременно
+    assert elapsed < 0.09
+    names = [e[0] for e in events]
+    assert names.index("handler") < names.index("update_dialog") < names.index("update_msg")
+    assert ("update_msg", "GENERAL_CHAT") in events
+    assert core.stage_metrics()["classify"]["calls"] >= 1
@@ -0,0 +1,115 @@
+import asyncio
+import types
+from datetime import datetime, timezone
+
+from utils.history_buffer import HistoryBuffer
+
+
+def _row(role, text):
+    return types.SimpleNamespace(role=role, message_text=text, timestamp=None)
+
+
+class _Loader:
+    def __init__(self, rows):
+        self.rows = rows
+        self.calls = []
+
+    async def __call__(self, user_id, limit):
+        self.calls.append((user_id, limit))
+        return self.rows.get(user_id, [])[-limit:]
+
+
+def test_loads_once_then_serves_appends_from_memory():
+    buffer = HistoryBuffer(turns=4, max_users=10, name="test_history_buffer")
+    loader = _Loader({1: [_row("user", "btc"), _row("model", "*BTC* $65,000")]})
+
+    async def scenario():
+        first = await buffer.recent(1, 4, loader)
+        buffer.append(1, "user", "а eth?")
+        buffer.append(1, "model", "*ETH* $3,000")
+        buffer.append(1, "user", "спасибо")
+        return first, await buffer.recent(1, 4, loader)
+
+    first, second = asyncio.run(scenario())
+    assert [t.message_text for t in first] == ["btc", "*BTC* $65,000"]
+    # Кольцевой буфер хранит только четыре последние реплики
+    assert [t.message_text for t in second] == ["*BTC* $65,000", "а eth?", "*ETH* $3,000", "спасибо"]
+    assert loader.calls == [(1, 4)]
+    assert buffer.stats()["hits"] == 1
+
+
+def test_append_before_load_is_not_a_partial_buffer():
+    buffer = HistoryBuffer(turns=4, max_users=10, name="test_history_buffer_cold")
+    buffer.append(1, "user", "привет")
+    loader = _Loader({1: [_row("user", "старое"), _row("user", "привет")]})
+
+    turns = asyncio.run(buffer.recent(1, 4, loader))
+    assert [t.message_text for t in turns] == ["старое", "привет"]
+
+
+def test_turn_added_while_loading_is_kept():
+    buffer = HistoryBuffer(turns=4, max_users=10, name="test_history_buffer_race")
+
+    async def loader(user_id, limit):
+        buffer.append(user_id, "model", "ответ")
+        return [_row("user", "вопрос")]
+
+    turns = asyncio.run(buffer.recent(1, 4, loader))
+    assert [t.message_text for t in turns] == ["вопрос", "ответ"]
+
+
+def test_lru_cap_and_ttl_reload():
+    clock = types.SimpleNamespace(now=0.0)
+    buffer = HistoryBuffer(turns=4, max_users=2, ttl=10, clock=lambda: clock.now, name="test_history_buffer_lru")
+    loader = _Loader({})
+
+    async def scenario():
+        for user_id in (1, 2, 3):
+            await buffer.recent(user_id, 2, loader)
+        assert buffer.stats()["users"] == 2
+        await buffer.recent(1, 2, loader)  # вытеснен — загружается снова
+        clock.now = 11
+        await buffer.recent(3, 2, loader)  # TTL истёк
+        await buffer.recent(3, 10, loader)  # больше ёмкости буфера — прямо из БД
+
+    asyncio.run(scenario())
+    assert loader.calls == [(1, 4), (2, 4), (3, 4), (1, 4), (3, 4), (3, 10)]
+    assert buffer.stats()["evictions"] == 2
+
+
+def test_turn_handled_by_another_worker_reloads_buffer():
+    stamps = {}
+
+    async def read_stamp(user_id):
+        return stamps.get(user_id)
+
+    async def write_stamp(user_id, stamp, ttl):
+        stamps[user_id] = stamp
+
+    def worker(name):
+        return HistoryBuffer(
+            turns=4, max_users=10, stamp_reader=read_stamp, stamp_writer=write_stamp, name=name
+        )
+
+    first, second = worker("test_history_buffer_worker_a"), worker("test_history_buffer_worker_b")
+    db = {1: []}
+    loader = _Loader(db)
+
+    async def say(buffer, text, at):
+        ts = datetime(2024, 1, 1, 12, 0, at, tzinfo=timezone.utc)
+        db[1].append(types.SimpleNamespace(role="user", message_text=text, timestamp=ts))
+        buffer.append(1, "user", text, ts)
+        await buffer.publish(1, ts)
+
+    async def scenario():
+        await first.recent(1, 4, loader)
+        await say(first, "цена btc", 1)
+        assert [t.message_text for t in await first.recent(1, 4, loader)] == ["цена btc"]
+        await say(second, "а eth?", 2)
+        return await first.recent(1, 4, loader)
+
+    turns = asyncio.run(scenario())
+    assert [t.message_text for t in turns] == ["цена btc", "а eth?"]
+    # Первая загрузка и перечитывание после реплики второго воркера
+    assert loader.calls == [(1, 4), (1, 4)]
+    assert first.stats()["stale"] == 1 and first.stats()["hits"] == 1
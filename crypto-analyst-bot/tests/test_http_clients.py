@@ -0,0 +1,134 @@
+import asyncio
+import sys
+import types
+
+sys.modules.setdefault('httpx', types.ModuleType('httpx'))
+
+import utils.http_clients as http_clients_mod
+from utils.http_clients import HttpClientRegistry
+
+
+class _FakeAsyncClient:
+    created = 0
+
+    def __init__(self, **kwargs):
+        _FakeAsyncClient.created += 1
+        self.kwargs = kwargs
+        self.is_closed = False
+        self.calls = []
+
+    async def request(self, method, url, **kwargs):
+        if url.endswith("/fail"):
+            raise RuntimeError("boom")
+        self.calls.append((method, url, kwargs))
+        return types.SimpleNamespace(status_code=200)
+
+    async def aclose(self):
+        self.is_closed = True
+
+
+def _fake_httpx(monkeypatch):
+    _FakeAsyncClient.created = 0
+    fake = types.SimpleNamespace(
+        AsyncClient=_FakeAsyncClient,
+        Timeout=lambda timeout, connect=None: ("timeout", timeout, connect),
+        Limits=lambda **kwargs: kwargs,
+    )
+    monkeypatch.setattr(http_clients_mod, "httpx", fake)
+
+
+def test_requests_reuse_one_pooled_client(monkeypatch):
+    _fake_httpx(monkeypatch)
+    registry = HttpClientRegistry(name="test_http_pools")
+    pool = registry.register("llm:test", max_connections=7, max_keepalive=3)
+    assert registry.register("llm:test") is pool
+
+    async def scenario():
+        await registry.start()
+        await pool.post("https://example.com/a", json={}, timeout=2.0)
+        await pool.get("https://example.com/b")
+        try:
+            await pool.post("https://example.com/fail")
+        except RuntimeError:
+            pass
+        client = pool._client
+        await registry.stop()
+        return client
+
+    client = asyncio.run(scenario())
+    assert _FakeAsyncClient.created == 1
+    assert client.kwargs["limits"]["max_connections"] == 7
+    assert client.kwargs["limits"]["max_keepalive_connections"] == 3
+    assert [c[0] for c in client.calls] == ["POST", "GET"]
+    assert client.calls[0][2]["timeout"] == 2.0
+    assert client.is_closed
+
+    stats = registry.stats()["llm:test"]
+    assert stats["requests"] == 3
+    assert stats["errors"] == 1
+    assert stats["in_flight"] == 0
+    assert stats["open"] is False
+
+
+def test_closed_client_is_reopened_on_demand(monkeypatch):
+    _fake_httpx(monkeypatch)
+    registry = HttpClientRegistry(name="test_http_pools_reopen")
+    pool = registry.register("market:test")
+
+    async def scenario():
+        await registry.stop()
+        await pool.get("https://example.com/a")
+        await registry.stop()
+        await pool.get("https://example.com/b")
+
+    asyncio.run(scenario())
+    assert _FakeAsyncClient.created == 2
+    assert pool.stats()["opened"] == 2
+
+
+def test_llm_gateway_posts_through_provider_pool(monkeypatch):
+    _fake_httpx(monkeypatch)
+    from ai import llm_gateway
+
+    monkeypatch.setattr(llm_gateway, "httpx", http_clients_mod.httpx)
+    pool = llm_gateway._clients["openai"]
+    monkeypatch.setattr(pool, "_client", None)
+
+    async def scenario():
+        await llm_gateway.post("openai", "https://api.example.com/v1", json={"x": 1}, timeout=15.0)
+        await llm_gateway.post("openai", "https://api.example.com/v1", json={"x": 2}, timeout=15.0)
+        client = pool._client
+        await pool.aclose()
+        return client
+
+    client = asyncio.run(scenario())
+    assert _FakeAsyncClient.created == 1
+    assert len(client.calls) == 2
+    assert client.calls[0][2]["timeout"] == ("timeout", 15.0, llm_gateway.LLM_CONNECT_TIMEOUT)
+
+
+def test_market_requests_share_one_client_per_host(monkeypatch):
+    _fake_httpx(monkeypatch)
+    from utils import market_http
+
+    gecko = market_http.client_for("https://api.coingecko.com/api/v3/simple/price")
+    binance = market_http.client_for("https://api.binance.com/api/v3/ticker/price")
+    assert gecko is market_http.client_for("https://API.coingecko.com/api/v3/search")
+    assert gecko is not binance
+    assert binance.timeout == 10.0
+    for pool in (gecko, binance):
+        monkeypatch.setattr(pool, "_client", None)
+
+    async def scenario():
+        await market_http.get("https://api.coingecko.com/api/v3/simple/price", params={"ids": "bitcoin"})
+        await market_http.get("https://api.coingecko.com/api/v3/search", params={"query": "eth"})
+        await market_http.get("https://api.binance.com/api/v3/ticker/price")
+        clients = gecko._client, binance._client
+        await gecko.aclose()
+        await binance.aclose()
+        return clients
+
+    gecko_client, binance_client = asyncio.run(scenario())
+    assert _FakeAsyncClient.created == 2
+    assert len(gecko_client.calls) == 2 and len(binance_client.calls) == 1
+    assert gecko_client.kwargs["timeout"] == ("timeout", 15.0, market_http.MARKET_HTTP_CONNECT_TIMEOUT)
@@ -0,0 +1,109 @@
+import asyncio
+
+from background.leader import LeaderElector, NoopLeaderBackend, RedisLeaderBackend
+
+
+class FakeRedis:
+    """Shared in-memory store emulating SET NX PX and the lease scripts."""
+
+    def __init__(self):
+        self.data = {}
+
+    async def set(self, key, value, px=None, nx=False):
+        if nx and key in self.data:
+            return None
+        self.data[key] = value
+        return True
+
+    async def eval(self, script, numkeys, key, token, *args):
+        if self.data.get(key) != token:
+            return 0
+        if script == RedisLeaderBackend.RELEASE_SCRIPT:
+            del self.data[key]
+        return 1
+
+    def expire(self, key):
+        self.data.pop(key, None)
+
+
+def _elector(redis, events, tag):
+    async def elected():
+        events.append(("elected", tag))
+
+    async def demoted():
+        events.append(("demoted", tag))
+
+    return LeaderElector(
+        backend=RedisLeaderBackend(client=redis),
+        on_elected=elected,
+        on_demoted=demoted,
+        renew_interval=0.01,
+        retry_interval=0.01,
+        name=f"test_leader_{tag}",
+    )
+
+
+def test_only_one_leader_and_failover_on_stop():
+    redis = FakeRedis()
+    events = []
+
+    async def run():
+        a, b = _elector(redis, events, "a"), _elector(redis, events, "b")
+        await a.start()
+        await b.start()
+        assert a.is_leader and not b.is_leader
+        await a.stop()
+        await asyncio.sleep(0.05)
+        leader_b = b.is_leader
+        await b.stop()
+        return leader_b
+
+    assert asyncio.run(run()) is True
+    assert events == [("elected", "a"), ("demoted", "a"), ("elected", "b"), ("demoted", "b")]
+
+
+def test_lost_lease_demotes_and_other_worker_takes_over():
+    redis = FakeRedis()
+    events = []
+
+    async def run():
+        a, b = _elector(redis, events, "a"), _elector(redis, events, "b")
+        await a.start()
+        await b.start()
+        # аренда истекла (например, процесс a завис дольше TTL)
+        redis.expire("leader:scheduler")
+        await asyncio.sleep(0.05)
+        state = (a.is_leader, b.is_leader)
+        await a.stop()
+        await b.stop()
+        return state
+
+    a_leader, b_leader = asyncio.run(run())
+    assert a_leader != b_leader
+    assert ("demoted", "a") in events
+
+
+def test_backend_errors_demote_leader():
+    class FlakyBackend(NoopLeaderBackend):
+        name = "flaky"
+        fail = False
+
+        async def renew(self):
+            if self.fail:
+                raise ConnectionError("db down")
+            return True
+
+    backend = FlakyBackend()
+    elector = LeaderElector(backend=backend, renew_interval=0.01, retry_interval=10, name="test_leader_flaky")
+
+    async def run():
+        await elector.start()
+        assert elector.is_leader
+        backend.fail = True
+        await asyncio.sleep(0.05)
+        leader = elector.is_leader
+        await elector.stop()
+        return leader
+
+    assert asyncio.run(run()) is False
+    assert elector.stats()["errors"] >= 1
@@ -0,0 +1,103 @@
+import asyncio
+
+import ai.llm_cache as llm_cache_mod
+from ai.llm_cache import LLMCache
+
+
+class FakeRedis:
+    def __init__(self):
+        self.data = {}
+        self.ttls = {}
+
+    async def get(self, key):
+        return self.data.get(key)
+
+    async def set(self, key, value, ttl=60):
+        self.data[key] = value
+        self.ttls[key] = ttl
+
+
+def patch_redis(monkeypatch):
+    redis = FakeRedis()
+    monkeypatch.setattr(llm_cache_mod, "get_cache", redis.get)
+    monkeypatch.setattr(llm_cache_mod, "set_cache", redis.set)
+    return redis
+
+
+def test_identical_prompts_hit_local_tier(monkeypatch):
+    redis = patch_redis(monkeypatch)
+    cache = LLMCache(name="test_llm_cache_local")
+    calls = []
+
+    @cache.cached("classify", "gemini", "flash")
+    async def classify(prompt):
+        calls.append(prompt)
+        return "CRYPTO_INFO"
+
+    async def run():
+        first = await classify("Запрос:  цена btc\n")
+        # Отличие только в пробелах — тот же ключ
+        second = await classify("Запрос: цена btc")
+        return first, second
+
+    assert asyncio.run(run()) == ("CRYPTO_INFO", "CRYPTO_INFO")
+    assert len(calls) == 1
+    assert list(redis.ttls.values()) == [llm_cache_mod.CALL_SITE_TTLS["classify"]]
+    assert cache.stats()["sites"]["classify"]["local_hits"] == 1
+
+
+def test_redis_tier_is_shared_and_failures_are_not_cached(monkeypatch):
+    patch_redis(monkeypatch)
+    worker_a = LLMCache(name="test_llm_cache_a")
+    worker_b = LLMCache(name="test_llm_cache_b")
+    answers = [None, {"symbols": "BTC"}]
+
+    async def call(prompt):
+        return answers.pop(0)
+
+    extract_a = worker_a.cached("extract", "openai", "gpt")(call)
+    extract_b = worker_b.cached("extract", "openai", "gpt")(call)
+
+    async def run():
+        assert await extract_a("prompt") is None
+        assert await extract_a("prompt") == {"symbols": "BTC"}
+        return await extract_b("prompt")
+
+    assert asyncio.run(run()) == {"symbols": "BTC"}
+    assert worker_b.stats()["sites"]["extract"]["redis_hits"] == 1
+    assert worker_a.stats()["sites"]["extract"]["misses"] == 2
+
+
+def test_provider_and_model_are_part_of_the_key(monkeypatch):
+    patch_redis(monkeypatch)
+    cache = LLMCache(name="test_llm_cache_key")
+
+    async def gemini(prompt):
+        return "gemini"
+
+    async def openai(prompt):
+        return "openai"
+
+    async def run():
+        a = await cache.cached("format", "gemini", "flash")(gemini)("same")
+        b = await cache.cached("format", "openai", "gpt")(openai)("same")
+        return a, b
+
+    assert asyncio.run(run()) == ("gemini", "openai")
+
+
+def test_lru_evicts_oldest(monkeypatch):
+    patch_redis(monkeypatch)
+    cache = LLMCache(max_size=2, name="test_llm_cache_lru")
+
+    async def echo(prompt):
+        return prompt
+
+    cached_echo = cache.cached("classify", "gemini", "flash")(echo)
+
+    async def run():
+        for prompt in ("a", "b", "c"):
+            await cached_echo(prompt)
+
+    asyncio.run(run())
+    assert cache.stats()["size"] == 2
@@ -0,0 +1,76 @@
+from ai.local_classifier import LocalIntentClassifier
+
+INTENTS = {
+    "GENERAL_CHAT": "Описание без правил тоже допустимо.",
+    "CRYPTO_INFO": {"description": "Цена.", "keywords": ["цена", "сколько стоит", "price"], "entity": "symbols"},
+    "CRYPTO_NEWS": {"description": "Новости.", "keywords": ["новости", "news"], "entity": "symbol"},
+    "PORTFOLIO_SUMMARY": {"description": "Портфель.", "keywords": ["портфель"]},
+    "TRACK_COIN": {
+        "description": "Добавить монету.",
+        "patterns": ["^(?:добавь|track|add)\\s+(?P<symbol>[a-zа-я0-9]{2,15})(?:\\s+в портфель)?$"],
+        "entity": "symbol",
+        "known_symbols": True,
+    },
+    "UNTRACK_COIN": {
+        "description": "Удалить монету.",
+        "patterns": ["^(?:удали|remove)\\s+(?P<symbol>[a-zа-я0-9]{2,15})$"],
+        "entity": "symbol",
+        "known_symbols": True,
+    },
+}
+SYMBOLS = {"BTC": ["bitcoin", "биток"], "ETH": ["эфир"], "BNB": ["binance coin"]}
+
+
+def make(name):
+    return LocalIntentClassifier(INTENTS, SYMBOLS, threshold=0.8, name=name)
+
+
+def test_keywords_and_lexicon_resolve_intent_and_symbols():
+    clf = make("test_local_keywords")
+    result = clf.classify("Сколько стоит биток и эфир?")
+    assert result.intent == "CRYPTO_INFO"
+    assert result.entities == {"symbols": "BTC,ETH"}
+    assert clf.classify("binance coin price").entities == {"symbols": "BNB"}
+    assert clf.classify("новости btc").entities == {"symbol": "BTC"}
+
+
+def test_pattern_beats_keyword_of_another_intent():
+    clf = make("test_local_pattern")
+    result = clf.classify("добавь биток в портфель")
+    assert result.intent == "TRACK_COIN"
+    assert result.entities == {"symbol": "BTC"}
+
+
+def test_portfolio_changes_accept_only_known_symbols():
+    clf = make("test_local_known_symbols")
+    assert clf.classify("add btc").entities == {"symbol": "BTC"}
+    assert clf.classify("remove bitcoin").entities == {"symbol": "BTC"}
+    # Обычные слова, похожие на тикер, не должны менять портфель
+    for text in ("track it", "add more", "remove ads", "добавь еще"):
+        assert clf.classify(text) is None, text
+
+
+def test_low_confidence_falls_back_to_llm():
+    clf = make("test_local_fallback")
+    # Слова вне правил снижают уверенность
+    assert clf.predict("почему цена btc упала вчера").confidence < 0.8
+    assert clf.classify("почему цена btc упала вчера") is None
+    # Два намерения сразу — тоже решает LLM
+    assert clf.classify("новости и цена btc") is None
+    # Намерению нужна монета, а её нет
+    assert clf.classify("новости") is None
+    assert clf.classify("расскажи анекдот") is None
+
+    stats = clf.stats()
+    assert stats["calls"] == 4 and stats["hits"] == 0
+    assert stats["fallbacks"] == 2 and stats["misses"] == 2
+
+
+def test_hit_rate_metric():
+    clf = make("test_local_metric")
+    clf.classify("цена btc")
+    clf.classify("мой портфель")
+    clf.classify("что такое dao")
+    stats = clf.stats()
+    assert stats["hit_rate"] == round(2 / 3, 3)
+    assert stats["hits_by_intent"] == {"CRYPTO_INFO": 1, "PORTFOLIO_SUMMARY": 1}
@@ -0,0 +1,42 @@
+from crypto.price_renderer import format_money, render_prices, trend_emoji
+
+PRICE_DATA = {
+    "bitcoin": {
+        "usd": 65000, "usd_market_cap": 1280000000000, "usd_24h_vol": 35000000000, "usd_24h_change": -2.5,
+        "eur": 60000.5, "eur_market_cap": 1180000000000, "eur_24h_vol": 32000000000, "eur_24h_change": -2.4,
+    },
+    "pepe": {"usd": 0.00001234, "usd_market_cap": 0, "usd_24h_change": 5.123},
+}
+
+
+def test_card_matches_the_ai_formatter_layout():
+    text = render_prices({"bitcoin": PRICE_DATA["bitcoin"]}, "USD", "en", symbols={"bitcoin": "BTC"})
+    assert text == (
+        "📊 *Bitcoin (BTC)*\n"
+        "*Price:* $65,000.00\n"
+        "*Market cap:* $1,280,000,000,000\n"
+        "*Volume (24h):* $35,000,000,000\n"
+        "*Change (24h):* -2.50% 📉"
+    )
+
+
+def test_user_currency_and_russian_number_format():
+    text = render_prices(PRICE_DATA, "EUR", "ru", symbols={"bitcoin": "BTC"}, order=["bitcoin"])
+    assert "*Цена:* €60 000,50" in text
+    assert "-2,40% 📉" in text
+    assert "Pepe" not in text
+
+
+def test_missing_currency_falls_back_to_usd_and_small_prices_keep_digits():
+    text = render_prices(PRICE_DATA, "EUR", "en", order=["pepe"])
+    assert "📊 *Pepe (PEPE)*" in text
+    assert "*Price:* $0.00001234" in text
+    assert "*Market cap:* no data" in text
+    assert "+5.12% 📈" in text
+
+
+def test_money_and_trend_helpers():
+    assert format_money(1234.5, "RUB", "ru") == "1 234,50 ₽"
+    assert format_money(-3, "USD", "en") == "-$3.00"
+    assert format_money(10, "CHF", "en") == "10.00 CHF"
+    assert trend_emoji(0) == "➖"
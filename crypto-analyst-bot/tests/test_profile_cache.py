@@ -0,0 +1,106 @@
+import asyncio
+from datetime import datetime, timezone
+
+from utils.profile_cache import ProfileCache, UserProfile
+
+
+class FakePubSub:
+    def __init__(self, broker):
+        self.broker = broker
+        self.queue = asyncio.Queue()
+
+    async def subscribe(self, channel):
+        self.broker.subscribers.setdefault(channel, []).append(self.queue)
+
+    async def listen(self):
+        while True:
+            yield await self.queue.get()
+
+    async def close(self):
+        for queues in self.broker.subscribers.values():
+            if self.queue in queues:
+                queues.remove(self.queue)
+
+
+class FakeBroker:
+    """Redis pub/sub в памяти: publish доставляет всем подписчикам канала."""
+
+    def __init__(self):
+        self.subscribers = {}
+
+    def pubsub(self):
+        return FakePubSub(self)
+
+    async def publish(self, channel, data):
+        for queue in self.subscribers.get(channel, []):
+            queue.put_nowait({"type": "message", "data": data})
+        return len(self.subscribers.get(channel, []))
+
+
+def test_profile_json_round_trip():
+    profile = UserProfile(
+        7,
+        language="en",
+        stars_balance=15,
+        subscription_active=True,
+        subscription_level="premium",
+        next_payment=datetime(2026, 1, 2, tzinfo=timezone.utc),
+    )
+    restored = UserProfile.from_json(profile.to_json())
+    assert restored.language == "en"
+    assert restored.is_premium
+    assert restored.next_payment == profile.next_payment
+
+
+def test_local_lru_evicts_oldest():
+    cache = ProfileCache(max_size=2, name="test_profile_lru")
+
+    async def run():
+        for user_id in (1, 2):
+            await cache.set(UserProfile(user_id))
+        await cache.get(1)
+        await cache.set(UserProfile(3))
+        return [await cache.get(i) for i in (1, 2, 3)]
+
+    one, two, three = asyncio.run(run())
+    assert one is not None and three is not None
+    assert two is None
+    assert cache.stats()["local_hits"] == 3
+
+
+def test_stale_read_is_not_cached_after_invalidation():
+    cache = ProfileCache(name="test_profile_generation")
+
+    async def run():
+        generation = cache.generation(5)
+        # Пока «читали из БД», профиль изменился
+        await cache.invalidate(5)
+        await cache.set(UserProfile(5, language="ru"), generation=generation)
+        return await cache.get(5)
+
+    assert asyncio.run(run()) is None
+
+
+def test_invalidation_reaches_other_workers():
+    broker = FakeBroker()
+    worker_a = ProfileCache(client=broker, name="test_profile_worker_a")
+    worker_b = ProfileCache(client=broker, name="test_profile_worker_b")
+
+    async def run():
+        await worker_a.start()
+        await worker_b.start()
+        await asyncio.sleep(0)
+        worker_a.prime(UserProfile(9, language="ru"))
+        worker_b.prime(UserProfile(9, language="ru"))
+        await worker_a.invalidate(9)
+        await asyncio.sleep(0.01)
+        result = (await worker_a.get(9), await worker_b.get(9))
+        await worker_a.stop()
+        await worker_b.stop()
+        return result
+
+    a, b = asyncio.run(run())
+    assert a is None and b is None
+    assert worker_b.stats()["remote_invalidations"] == 1
+    # Своё сообщение воркер не считает удалённой инвалидацией
+    assert worker_a.stats()["remote_invalidations"] == 0
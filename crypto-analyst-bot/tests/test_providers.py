@@ -0,0 +1,132 @@
+import asyncio
+
+import ai.llm_cache as llm_cache_mod
+import ai.providers as providers
+from ai.llm_cache import LLMCache
+from ai.providers import ProviderRouter
+from utils.circuit_breaker import CircuitBreaker
+
+
+def test_empty_first_answer_does_not_lose_the_call():
+    router = ProviderRouter(name="test_providers_failover")
+
+    async def gemini():
+        return None
+
+    async def openai():
+        return "ok"
+
+    result = asyncio.run(router.first_success("classify", {"gemini": gemini, "openai": openai}))
+    assert result == "ok"
+    assert router.failovers == 1
+
+
+def test_second_provider_only_after_hedge_delay(monkeypatch):
+    monkeypatch.setattr(providers, "LLM_HEDGE_DEFAULT_MS", 20)
+    monkeypatch.setattr(providers, "LLM_HEDGE_MIN_MS", 1)
+    started = []
+
+    def provider(name, delay):
+        async def call():
+            started.append(name)
+            await asyncio.sleep(delay)
+            return name
+
+        return call
+
+    async def run(gemini_delay):
+        router = ProviderRouter(name="test_providers_hedge")
+        result = await router.first_success(
+            "classify", {"gemini": provider("gemini", gemini_delay), "openai": provider("openai", 0)}
+        )
+        return result, router.hedged
+
+    # Быстрый ответ — второй провайдер не вызывался вовсе
+    assert asyncio.run(run(0.001)) == ("gemini", 0)
+    assert started == ["gemini"]
+    # Медленный — через 20 мс уходит страховочный запрос, и он побеждает
+    assert asyncio.run(run(0.2)) == ("openai", 1)
+    assert started == ["gemini", "gemini", "openai"]
+
+
+def test_fastest_provider_is_tried_first():
+    router = ProviderRouter(hedge=False, name="test_providers_ewma")
+    router.provider("gemini").success("chat", 900)
+    router.provider("openai").success("chat", 300)
+    order = []
+
+    def provider(name):
+        async def call():
+            order.append(name)
+            return name
+
+        return call
+
+    result = asyncio.run(router.first_success("chat", {"gemini": provider("gemini"), "openai": provider("openai")}))
+    assert result == "openai" and order == ["openai"]
+
+
+def test_breaker_skips_failing_provider(monkeypatch):
+    router = ProviderRouter(hedge=False, name="test_providers_breaker")
+    router.provider("gemini").breaker = CircuitBreaker(failure_threshold=2, reset_timeout=60)
+    calls = []
+
+    async def broken():
+        calls.append("gemini")
+        raise RuntimeError("503")
+
+    async def healthy():
+        return "ok"
+
+    async def run():
+        for _ in range(3):
+            assert await router.first_success("extract", {"gemini": broken, "openai": healthy}) == "ok"
+
+    asyncio.run(run())
+    assert calls == ["gemini", "gemini"]
+    assert router.stats()["providers"]["gemini"]["state"] == "open"
+
+
+def test_breaker_half_open_probe():
+    now = [0.0]
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=10, clock=lambda: now[0])
+    breaker.record_failure()
+    assert not breaker.allow()
+    now[0] = 11
+    assert breaker.allow()
+    # Пока идёт проба, остальные вызовы не пропускаются
+    assert not breaker.allow()
+    breaker.record_success()
+    assert breaker.state == "closed" and breaker.allow()
+
+
+def test_cache_hits_do_not_count_as_provider_latency(monkeypatch):
+    store = {}
+
+    async def get_cache(key):
+        return store.get(key)
+
+    async def set_cache(key, value, ttl=60):
+        store[key] = value
+
+    monkeypatch.setattr(llm_cache_mod, "get_cache", get_cache)
+    monkeypatch.setattr(llm_cache_mod, "set_cache", set_cache)
+    cache = LLMCache(name="test_providers_llm_cache")
+    router = ProviderRouter(hedge=False, name="test_providers_cached")
+
+    @cache.cached("classify", "gemini", "model")
+    async def gemini(prompt):
+        await asyncio.sleep(0.03)
+        return prompt.upper()
+
+    async def run():
+        for i in range(40):
+            # 10 разных промптов уходят к провайдеру, остальные — попадания в кэш
+            prompt = f"q{i % 10}"
+            assert await router.first_success("classify", {"gemini": lambda: gemini(prompt)}) == prompt.upper()
+
+    asyncio.run(run())
+    site = router.provider("gemini").site("classify")
+    assert site.successes == 10 and site.cached == 30
+    assert site.quantile(0.95) >= 25
+    assert router.hedge_delay("classify", "gemini") >= 0.025
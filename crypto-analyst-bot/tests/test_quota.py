@@ -0,0 +1,85 @@
+import asyncio
+
+from utils.quota import DailyQuota
+
+
+class FakeRedis:
+    """GET, SET NX EXAT and the conditional INCR script."""
+
+    def __init__(self):
+        self.data = {}
+        self.expire_at = {}
+
+    async def get(self, key):
+        value = self.data.get(key)
+        return None if value is None else str(value)
+
+    async def set(self, key, value, exat=None, nx=False):
+        if nx and key in self.data:
+            return None
+        self.data[key] = int(value)
+        self.expire_at[key] = exat
+        return True
+
+    async def eval(self, script, numkeys, key):
+        assert script == DailyQuota.INCR_SCRIPT
+        if key not in self.data:
+            return None
+        self.data[key] += 1
+        return self.data[key]
+
+
+def test_counter_is_rebuilt_once_then_served_from_redis():
+    redis = FakeRedis()
+    quota = DailyQuota(client=redis, name="test_quota_rebuild")
+    loads = []
+
+    async def loader():
+        loads.append(1)
+        return 4
+
+    async def run():
+        first = await quota.count(1, loader)
+        await quota.incr(1)
+        second = await quota.count(1, loader)
+        return first, second
+
+    assert asyncio.run(run()) == (4, 5)
+    assert len(loads) == 1
+    key = quota.key(1)
+    # Истекает в ближайшую полночь UTC
+    assert redis.expire_at[key] % 86400 == 0
+
+
+def test_incr_without_counter_does_not_start_from_zero():
+    redis = FakeRedis()
+    quota = DailyQuota(client=redis, name="test_quota_lost")
+
+    async def run():
+        assert await quota.incr(2) is None
+
+        async def loader():
+            return 7
+
+        return await quota.count(2, loader)
+
+    # Redis потерял ключ: значение восстанавливается из БД, а не с единицы
+    assert asyncio.run(run()) == 7
+
+
+def test_without_redis_every_check_uses_loader(monkeypatch):
+    import utils.quota as quota_mod
+
+    monkeypatch.setattr(quota_mod, "redis_client", None)
+    quota = DailyQuota(name="test_quota_fallback")
+    calls = []
+
+    async def loader():
+        calls.append(1)
+        return 3
+
+    async def run():
+        return [await quota.count(3, loader) for _ in range(2)]
+
+    assert asyncio.run(run()) == [3, 3]
+    assert len(calls) == 2
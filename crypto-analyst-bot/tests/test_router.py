@@ -13,3 +13,35 @@ def test_intent_router_dispatch():
 
     result = asyncio.run(router.dispatch("TEST", None, None, "ok", None))
     assert result == "handled ok"
+
+
+def test_command_trie_prefers_longest_command_and_strips_bot_name():
+    async def short(update, context, payload, db):
+        return "short"
+
+    async def long(update, context, payload, db):
+        return "long"
+
+    router = IntentRouter()
+    router.register_command("/alert", short)
+    router.register_command("/alerts", long)
+
+    route, arg = router.match("/Alerts@CryptoBot  BTC > 100")
+    assert route.handler is long and arg == "BTC > 100"
+    route, arg = router.match("/alert ETH")
+    assert route.handler is short and arg == "ETH"
+    assert router.match("/unknown") is None
+
+
+def test_phrases_match_exactly_with_fixed_payload():
+    async def prices(update, context, payload, db):
+        return payload
+
+    router = IntentRouter()
+    router.register_phrase("📈 Цены", prices, "BTC,ETH", intent="CRYPTO_INFO")
+
+    route, arg = router.match("  📈  цены ")
+    assert route.handler is prices and arg == "BTC,ETH"
+    assert route.intent == "CRYPTO_INFO"
+    # Свободный текст по-прежнему уходит в LLM
+    assert router.match("цены на btc") is None
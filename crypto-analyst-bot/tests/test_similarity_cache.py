@@ -0,0 +1,83 @@
+from ai.similarity_cache import SimilarityCache, jaccard, normalize_question, shingles
+
+
+class _Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_normalization_ignores_case_and_punctuation():
+    assert normalize_question("  Что такое  СТЕЙКИНГ?! ") == "что такое стейкинг"
+    assert normalize_question("Ещё") == "еще"
+
+
+def test_near_duplicate_question_hits_and_reports_saved_latency():
+    cache = SimilarityCache(threshold=0.8, name="test_similarity_hit")
+    cache.put("что такое стейкинг", "Стейкинг — блокировка монет ради вознаграждения.", latency_ms=1200.0)
+
+    assert cache.get("Что такое стейкинг?") == "Стейкинг — блокировка монет ради вознаграждения."
+    assert cache.get("что такое стейкинк") is not None  # опечатка в одной букве
+    assert cache.get("что такое халвинг") is None
+    # Пары с высоким сходством n-грамм, но разным смыслом
+    for stored, asked in (
+        ("что такое pos", "что такое pow"),
+        ("что такое layer 1", "что такое layer 2"),
+        ("мне грустно", "мне не грустно"),
+    ):
+        cache.put(stored, f"ответ про {stored}")
+        assert cache.get(asked) is None, asked
+        assert cache.get(stored) == f"ответ про {stored}"
+    assert cache.get("что такое стейкинг", lang="en") is None
+
+    stats = cache.stats()
+    assert stats["hits"] == 5 and stats["lookups"] == 10
+    assert stats["word_mismatches"] == 3
+    assert stats["saved_provider_ms"] == 2400.0
+
+
+def test_threshold_is_tunable():
+    a, b = "как купить биткоин", "как купить биткоин на бирже"
+    score = jaccard(shingles(normalize_question(a)), shingles(normalize_question(b)))
+    strict = SimilarityCache(threshold=0.9, name="test_similarity_strict")
+    loose = SimilarityCache(threshold=score - 0.01, name="test_similarity_loose")
+    for cache in (strict, loose):
+        cache.put(a, "ответ")
+    assert strict.get(b) is None
+    assert loose.get(b) == "ответ"
+
+
+def test_questions_referencing_history_are_skipped():
+    cache = SimilarityCache(name="test_similarity_context")
+    assert cache.cacheable("что такое стейкинг?")
+    assert not cache.cacheable("а что с ним сейчас?")
+    assert not cache.cacheable("Помнишь, что ты говорил?")
+    assert not cache.cacheable("расскажи подробнее")
+    assert not cache.cacheable("А эфир?")
+    assert cache.stats()["skipped_context"] == 4
+
+
+def test_ttl_and_size_bounds():
+    clock = _Clock()
+    cache = SimilarityCache(ttl=60, max_size=2, clock=clock, name="test_similarity_bounds")
+    cache.put("что такое стейкинг", "1")
+    clock.now = 61
+    assert cache.get("что такое стейкинг") is None
+    assert cache.stats()["expired"] == 1
+
+    cache.put("что такое стейкинг", "1")
+    cache.put("что такое халвинг", "2")
+    cache.put("что такое майнинг", "3")
+    assert cache.stats()["size"] == 2
+    assert cache.get("что такое стейкинг") is None
+    assert cache.get("что такое майнинг") == "3"
+
+
+def test_storing_a_near_duplicate_replaces_the_old_answer():
+    cache = SimilarityCache(name="test_similarity_replace")
+    cache.put("что такое стейкинг", "старый")
+    cache.put("Что такое стейкинг?", "новый")
+    assert cache.stats()["size"] == 1
+    assert cache.get("что такое стейкинг") == "новый"
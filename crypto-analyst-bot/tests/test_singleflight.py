@@ -0,0 +1,113 @@
+import asyncio
+import sys
+import types
+
+sys.modules.setdefault('httpx', types.ModuleType('httpx'))
+dotenv_mod = types.ModuleType('dotenv')
+dotenv_mod.load_dotenv = lambda *args, **kwargs: None
+sys.modules.setdefault('dotenv', dotenv_mod)
+
+import pytest
+
+from utils.singleflight import SingleFlight
+
+
+def test_concurrent_calls_share_one_request():
+    flight = SingleFlight(name="test_singleflight_share")
+    calls = []
+
+    async def fetch():
+        calls.append(1)
+        await asyncio.sleep(0.01)
+        return {"bitcoin": {"usd": 1}}
+
+    async def scenario():
+        results = await asyncio.gather(*(flight.do("cg:/simple/price:ids=bitcoin", fetch) for _ in range(20)))
+        # Запрос завершён — следующий вызов идёт в API заново
+        await flight.do("cg:/simple/price:ids=bitcoin", fetch)
+        return results
+
+    results = asyncio.run(scenario())
+    assert len(calls) == 2
+    assert all(r == {"bitcoin": {"usd": 1}} for r in results)
+    assert flight.stats() == {"in_flight": 0, "keys": {"cg": {"calls": 2, "coalesced": 19, "errors": 0}}}
+
+
+def test_errors_are_shared_but_not_remembered():
+    flight = SingleFlight(name="test_singleflight_errors")
+    calls = []
+
+    async def failing():
+        calls.append(1)
+        await asyncio.sleep(0.01)
+        raise RuntimeError("429")
+
+    async def scenario():
+        results = await asyncio.gather(*(flight.do("bin:x", failing) for _ in range(3)), return_exceptions=True)
+        assert all(isinstance(r, RuntimeError) for r in results)
+        with pytest.raises(RuntimeError):
+            await flight.do("bin:x", failing)
+
+    asyncio.run(scenario())
+    assert len(calls) == 2
+    assert flight.stats()["keys"]["bin"]["errors"] == 2
+
+
+def test_cancelled_waiter_does_not_cancel_the_request():
+    flight = SingleFlight(name="test_singleflight_cancel")
+
+    async def fetch():
+        await asyncio.sleep(0.02)
+        return "ok"
+
+    async def scenario():
+        first = asyncio.create_task(flight.do("cp:btc", fetch))
+        second = asyncio.create_task(flight.do("cp:btc", fetch))
+        await asyncio.sleep(0)
+        first.cancel()
+        return await second
+
+    assert asyncio.run(scenario()) == "ok"
+
+
+def test_coingecko_cache_misses_are_coalesced(monkeypatch):
+    import utils.api_clients as api_clients
+
+    import utils.cache as cache_mod
+
+    upstream = []
+    stored = {}
+
+    class _Redis:
+        async def get(self, key):
+            return stored.get(key)
+
+        async def set(self, key, value, ex=None, nx=False):
+            stored[key] = value
+
+    class _Response:
+        status_code = 200
+
+        def raise_for_status(self):
+            pass
+
+        def json(self):
+            return {"bitcoin": {"usd": 65000}}
+
+    async def get(url, **kwargs):
+        upstream.append(url)
+        await asyncio.sleep(0.01)
+        return _Response()
+
+    monkeypatch.setattr(api_clients.market_http, "get", get)
+    monkeypatch.setattr(cache_mod, "cache", cache_mod.LayeredCache(_Redis(), name="test_singleflight_cache"))
+
+    client = api_clients.CoinGeckoClient(api_key=None)
+
+    async def scenario():
+        return await asyncio.gather(*(client.get_simple_price(["bitcoin"]) for _ in range(10)))
+
+    results = asyncio.run(scenario())
+    assert len(upstream) == 1
+    assert len(stored) == 1
+    assert all(r["bitcoin"]["usd"] == 65000 for r in results)
@@ -0,0 +1,149 @@
+import asyncio
+import contextlib
+import json
+import sys
+import types
+
+sys.modules.setdefault('telegram', types.ModuleType('telegram'))
+if not hasattr(sys.modules['telegram'], 'constants'):
+    sys.modules['telegram'].constants = types.SimpleNamespace(ParseMode=types.SimpleNamespace(MARKDOWN='MARKDOWN'))
+
+import ai.streaming as streaming
+from ai.providers import ProviderRouter
+from ai.streaming import StreamingReply, gemini_delta, openai_delta, stream_reply
+
+
+class _Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class _Bot:
+    def __init__(self):
+        self.edits = []
+
+    async def edit_message_text(self, chat_id, message_id, text, parse_mode=None):
+        self.edits.append((text, parse_mode))
+
+
+class _Message:
+    def __init__(self):
+        self.replies = []
+
+    async def reply_text(self, text, **kwargs):
+        self.replies.append(text)
+        return types.SimpleNamespace(chat_id=1, message_id=10)
+
+
+class _Response:
+    def __init__(self, lines, fail_after=None):
+        self.lines = lines
+        self.fail_after = fail_after
+
+    def raise_for_status(self):
+        pass
+
+    async def aiter_lines(self):
+        for i, line in enumerate(self.lines):
+            if self.fail_after is not None and i == self.fail_after:
+                raise RuntimeError("connection reset")
+            yield line
+
+
+def _openai_stream(chunks, fail_after=None):
+    lines = [f"data: {json.dumps({'choices': [{'delta': {'content': c}}]})}" for c in chunks] + ["data: [DONE]"]
+
+    @contextlib.asynccontextmanager
+    async def open_stream():
+        yield _Response(lines, fail_after)
+
+    return open_stream
+
+
+def _failing_stream():
+    @contextlib.asynccontextmanager
+    async def open_stream():
+        raise RuntimeError("503")
+        yield
+
+    return open_stream
+
+
+def _setup(monkeypatch):
+    monkeypatch.setattr(streaming, "llm_router", ProviderRouter(name="test_streaming_router"))
+    monkeypatch.setattr(streaming, "constants", types.SimpleNamespace(ParseMode=types.SimpleNamespace(MARKDOWN="MARKDOWN")))
+
+
+def test_delta_parsers():
+    assert gemini_delta({"candidates": [{"content": {"parts": [{"text": "При"}, {"text": "вет"}]}}]}) == "Привет"
+    assert openai_delta({"choices": [{"delta": {"role": "assistant"}}]}) == ""
+    assert openai_delta({"choices": [{"delta": {"content": "hi"}}]}) == "hi"
+
+
+def test_first_chunk_is_sent_immediately_and_edits_are_throttled(monkeypatch):
+    _setup(monkeypatch)
+    clock = _Clock()
+    message, bot = _Message(), _Bot()
+    reply = StreamingReply(message, bot, interval=1.0, min_chars=5, clock=clock)
+
+    async def scenario():
+        await reply.push("Привет")
+        assert message.replies == ["Привет" + streaming.CURSOR]
+        await reply.push(", это длинный ответ")
+        assert bot.edits == []  # интервал ещё не прошёл
+        clock.now = 1.5
+        await reply.push(" бота")
+        assert len(bot.edits) == 1
+        await reply.push("!")  # сразу после правки — не чаще интервала
+        return await reply.finish()
+
+    final = asyncio.run(scenario())
+    assert final == "Привет, это длинный ответ бота!"
+    assert len(message.replies) == 1
+    assert bot.edits[-1] == (final, "MARKDOWN")
+
+
+def test_stream_fails_over_before_anything_is_shown(monkeypatch):
+    _setup(monkeypatch)
+    message, bot = _Message(), _Bot()
+    reply = StreamingReply(message, bot)
+    streams = {
+        "gemini": (_failing_stream(), gemini_delta),
+        "openai": (_openai_stream(["Всё ", "хорошо"]), openai_delta),
+    }
+
+    text = asyncio.run(stream_reply("chat_stream", streams, reply))
+    assert text == "Всё хорошо"
+    assert reply.complete
+    assert len(message.replies) == 1
+    assert streaming.llm_router.provider("gemini").site("chat_stream").failures == 1
+
+
+def test_interrupted_stream_keeps_the_shown_text(monkeypatch):
+    _setup(monkeypatch)
+    message, bot = _Message(), _Bot()
+    reply = StreamingReply(message, bot)
+    streams = {
+        "openai": (_openai_stream(["Первая часть", " вторая"], fail_after=1), openai_delta),
+        "gemini": (_openai_stream(["другой ответ"]), openai_delta),
+    }
+
+    async def scenario():
+        text = await stream_reply("chat_stream", streams, reply)
+        return text, await reply.finish()
+
+    text, final = asyncio.run(scenario())
+    assert text == final == "Первая часть"
+    assert not reply.complete  # обрезанный ответ не попадает в кэш
+    assert len(message.replies) == 1
+
+
+def test_no_stream_returns_none(monkeypatch):
+    _setup(monkeypatch)
+    reply = StreamingReply(_Message(), _Bot())
+    text = asyncio.run(stream_reply("chat_stream", {"gemini": (_failing_stream(), gemini_delta)}, reply))
+    assert text is None
+    assert reply.sent is None
@@ -0,0 +1,86 @@
+import asyncio
+import sys
+import types
+from datetime import datetime, timedelta, timezone
+
+sys.modules.setdefault('httpx', types.ModuleType('httpx'))
+dotenv_mod = types.ModuleType('dotenv')
+dotenv_mod.load_dotenv = lambda *args, **kwargs: None
+sys.modules.setdefault('dotenv', dotenv_mod)
+sys.modules.setdefault('database', types.ModuleType('database'))
+sys.modules.setdefault('database.operations', types.ModuleType('database.operations'))
+
+import ai.summarizer as summarizer
+from ai.summarizer import DialogSummarizer
+
+T0 = datetime(2026, 1, 1, tzinfo=timezone.utc)
+
+
+def _turn(i, role, text):
+    return types.SimpleNamespace(role=role, message_text=text, timestamp=T0 + timedelta(minutes=i))
+
+
+REPORT = "Отчёт по токену. " * 200
+
+
+def test_prompt_carries_summary_and_short_unsummarized_turns():
+    s = DialogSummarizer(name="test_dialog_summary_prompt")
+    turns = [
+        _turn(0, "user", "анализ pepe"),
+        _turn(1, "model", REPORT),
+        _turn(2, "user", "а что с btc?"),
+        _turn(3, "model", "*BTC* растёт"),
+    ]
+    dialog = types.SimpleNamespace(summary="Пользователь интересуется мемкоинами.", summary_until=turns[1].timestamp)
+
+    text = s.prompt_history(dialog, turns)
+    assert text.startswith("Краткое содержание предыдущей беседы: Пользователь интересуется мемкоинами.")
+    assert "анализ pepe" not in text
+    assert "Пользователь: а что с btc?" in text
+    assert s.stats()["avg_prompt_history_tokens"] < s.stats()["avg_raw_history_tokens"] / 10
+
+
+def test_long_turns_are_shortened_before_any_summary_exists():
+    s = DialogSummarizer(name="test_dialog_summary_no_summary")
+    text = s.prompt_history(None, [_turn(0, "user", "анализ pepe"), _turn(1, "model", REPORT)])
+    assert "Пользователь: анализ pepe" in text
+    assert len(text) < summarizer.DIALOG_SUMMARY_TURN_CHARS + 100
+    assert s.prompt_history(None, []) == "Нет предыдущих сообщений."
+
+
+def test_update_folds_old_turns_once_budget_is_exceeded(monkeypatch):
+    s = DialogSummarizer(name="test_dialog_summary_update")
+    dialog = types.SimpleNamespace(id=5, summary=None, summary_until=None)
+    rows = [_turn(i, "model" if i % 2 else "user", REPORT if i == 1 else f"сообщение {i}") for i in range(6)]
+    saved = {}
+
+    async def get_dialog(session, dialog_id):
+        return dialog
+
+    async def get_dialog_messages(session, dialog_id, after=None):
+        return [r for r in rows if after is None or r.timestamp > after]
+
+    async def update_dialog(session, dialog_id, **kwargs):
+        saved.update(kwargs)
+        dialog.summary = kwargs["summary"]
+        dialog.summary_until = kwargs["summary_until"]
+
+    folded = []
+
+    async def summarize(summary, turns):
+        folded.append([t.message_text for t in turns])
+        return "Резюме: анализ токена."
+
+    monkeypatch.setattr(summarizer.db_ops, "get_dialog", get_dialog, raising=False)
+    monkeypatch.setattr(summarizer.db_ops, "get_dialog_messages", get_dialog_messages, raising=False)
+    monkeypatch.setattr(summarizer.db_ops, "update_dialog", update_dialog, raising=False)
+    monkeypatch.setattr(summarizer, "summarize", summarize)
+    monkeypatch.setattr(summarizer, "DIALOG_SUMMARY_RECENT_TURNS", 4)
+
+    assert asyncio.run(s.update(None, 5)) is True
+    # Последние четыре реплики остаются как есть
+    assert folded == [["сообщение 0", REPORT]]
+    assert saved["summary_until"] == rows[1].timestamp
+    # Оставшиеся реплики укладываются в бюджет — повторного запроса нет
+    assert asyncio.run(s.update(None, 5)) is False
+    assert len(folded) == 1
@@ -49,6 +49,9 @@ class DummyBuilder:
     def token(self, token):
         return self
 
+    def base_url(self, url):
+        return self
+
     def build(self):
         return DummyApp()
 
@@ -94,12 +97,28 @@ sys.modules["database.engine"] = db_engine
 
 bg_sched = types.ModuleType("background.scheduler")
 bg_sched.start_scheduler = lambda *a, **k: None
+bg_sched.start_periodic_jobs = lambda *a, **k: None
+bg_sched.stop_periodic_jobs = lambda *a, **k: None
 sys.modules["background.scheduler"] = bg_sched
 
 analysis_mod = types.ModuleType("analysis.metrics")
 analysis_mod.gather_metrics = lambda *a, **k: {}
 sys.modules["analysis.metrics"] = analysis_mod
 
+chat_log_mod = types.ModuleType("database.chat_log")
+
+
+class _FakeChatLogWriter:
+    async def start(self):
+        pass
+
+    async def stop(self):
+        pass
+
+
+chat_log_mod.chat_log_writer = _FakeChatLogWriter()
+sys.modules["database.chat_log"] = chat_log_mod
+
 db_ops_mod = types.ModuleType("database.operations")
 
 
@@ -127,6 +146,19 @@ def _make_request(data: bytes):
     return types.SimpleNamespace(body=body)
 
 
+class _FakeQueue:
+    def __init__(self, accept=True, overflow="reject"):
+        self.items = []
+        self.accept = accept
+        self.overflow = overflow
+
+    def submit(self, item):
+        if not self.accept:
+            return False
+        self.items.append(item)
+        return True
+
+
 def test_telegram_webhook_valid_body(monkeypatch):
     update = {
         "callback_query": None,
@@ -143,17 +175,14 @@ def test_telegram_webhook_valid_body(monkeypatch):
         called["data"] = data
 
     monkeypatch.setattr(main, "process_update", fake_process)
-    scheduled = {}
-    monkeypatch.setattr(
-        asyncio, "create_task", lambda coro: scheduled.setdefault("coro", coro)
-    )
-
-    res = asyncio.run(
-        main.telegram_webhook(req, os.environ["TELEGRAM_BOT_TOKEN"], db_session=None)
-    )
+    queue = _FakeQueue()
+    monkeypatch.setattr(main, "update_queue", queue)
+
+    res = asyncio.run(main.telegram_webhook(req, os.environ["TELEGRAM_BOT_TOKEN"]))
     assert res.status_code == 200
 
-    asyncio.run(scheduled["coro"])
+    assert queue.items == [update]
+    asyncio.run(main.process_update(queue.items[0]))
     assert called["data"] == update
 
 
@@ -161,15 +190,13 @@ def test_telegram_webhook_invalid_json(monkeypatch):
     req = _make_request(b"{")
     warnings = []
     monkeypatch.setattr(main.logger, "debug", lambda *a, **k: warnings.append(a))
-    monkeypatch.setattr(main, "process_update", lambda *a, **k: None)
-    monkeypatch.setattr(asyncio, "create_task", lambda coro: warnings.append("task"))
+    queue = _FakeQueue()
+    monkeypatch.setattr(main, "update_queue", queue)
 
-    res = asyncio.run(
-        main.telegram_webhook(req, os.environ["TELEGRAM_BOT_TOKEN"], db_session=None)
-    )
+    res = asyncio.run(main.telegram_webhook(req, os.environ["TELEGRAM_BOT_TOKEN"]))
     assert res.status_code == 200
     assert warnings and warnings[0]
-    assert "task" not in warnings
+    assert not queue.items
 
 
 def test_telegram_webhook_trailing_comma(monkeypatch):
@@ -189,17 +216,14 @@ def test_telegram_webhook_trailing_comma(monkeypatch):
         called["data"] = data
 
     monkeypatch.setattr(main, "process_update", fake_process)
-    scheduled = {}
-    monkeypatch.setattr(
-        asyncio, "create_task", lambda coro: scheduled.setdefault("coro", coro)
-    )
-
-    res = asyncio.run(
-        main.telegram_webhook(req, os.environ["TELEGRAM_BOT_TOKEN"], db_session=None)
-    )
+    queue = _FakeQueue()
+    monkeypatch.setattr(main, "update_queue", queue)
+
+    res = asyncio.run(main.telegram_webhook(req, os.environ["TELEGRAM_BOT_TOKEN"]))
     assert res.status_code == 200
 
-    asyncio.run(scheduled["coro"])
+    assert queue.items == [update]
+    asyncio.run(main.process_update(queue.items[0]))
     assert called["data"] == update
 
 
@@ -222,17 +246,13 @@ def test_telegram_webhook_trailing_comma_inside(monkeypatch):
         called["data"] = data
 
     monkeypatch.setattr(main, "process_update", fake_process)
-    scheduled = {}
-    monkeypatch.setattr(
-        asyncio, "create_task", lambda coro: scheduled.setdefault("coro", coro)
-    )
-
-    res = asyncio.run(
-        main.telegram_webhook(req, os.environ["TELEGRAM_BOT_TOKEN"], db_session=None)
-    )
+    queue = _FakeQueue()
+    monkeypatch.setattr(main, "update_queue", queue)
+
+    res = asyncio.run(main.telegram_webhook(req, os.environ["TELEGRAM_BOT_TOKEN"]))
     assert res.status_code == 200
 
-    assert "coro" not in scheduled
+    assert not queue.items
 
 
 def test_telegram_webhook_double_comma(monkeypatch):
@@ -254,14 +274,49 @@ def test_telegram_webhook_double_comma(monkeypatch):
         called["data"] = data
 
     monkeypatch.setattr(main, "process_update", fake_process)
-    scheduled = {}
-    monkeypatch.setattr(
-        asyncio, "create_task", lambda coro: scheduled.setdefault("coro", coro)
-    )
-
-    res = asyncio.run(
-        main.telegram_webhook(req, os.environ["TELEGRAM_BOT_TOKEN"], db_session=None)
-    )
+    queue = _FakeQueue()
+    monkeypatch.setattr(main, "update_queue", queue)
+
+    res = asyncio.run(main.telegram_webhook(req, os.environ["TELEGRAM_BOT_TOKEN"]))
     assert res.status_code == 200
 
-    assert "coro" not in scheduled
+    assert not queue.items
+
+
+def test_telegram_webhook_queue_full_rejects(monkeypatch):
+    update = {"update_id": 1, "message": {"text": "hi"}}
+    req = _make_request(json.dumps(update).encode("utf-8"))
+    monkeypatch.setattr(main, "update_queue", _FakeQueue(accept=False))
+
+    res = asyncio.run(main.telegram_webhook(req, os.environ["TELEGRAM_BOT_TOKEN"]))
+    assert res.status_code == 503
+
+
+def test_telegram_webhook_queue_full_drop_policy(monkeypatch):
+    update = {"update_id": 1, "message": {"text": "hi"}}
+    req = _make_request(json.dumps(update).encode("utf-8"))
+    monkeypatch.setattr(main, "update_queue", _FakeQueue(accept=False, overflow="drop_newest"))
+
+    res = asyncio.run(main.telegram_webhook(req, os.environ["TELEGRAM_BOT_TOKEN"]))
+    assert res.status_code == 200
+
+
+def test_telegram_webhook_drops_redelivered_update(monkeypatch):
+    from updates.dedup import UpdateDeduplicator
+
+    update = {"update_id": 42, "message": {"text": "hi"}}
+    body = json.dumps(update).encode("utf-8")
+    monkeypatch.setattr(main, "update_dedup", UpdateDeduplicator(backend="memory", name="test_webhook_dedup"))
+
+    rejecting = _FakeQueue(accept=False)
+    monkeypatch.setattr(main, "update_queue", rejecting)
+    res = asyncio.run(main.telegram_webhook(_make_request(body), os.environ["TELEGRAM_BOT_TOKEN"]))
+    assert res.status_code == 503
+
+    # после 503 повтор должен быть принят, а следующий — отброшен до очереди
+    queue = _FakeQueue()
+    monkeypatch.setattr(main, "update_queue", queue)
+    for _ in range(2):
+        res = asyncio.run(main.telegram_webhook(_make_request(body), os.environ["TELEGRAM_BOT_TOKEN"]))
+        assert res.status_code == 200
+    assert queue.items == [update]
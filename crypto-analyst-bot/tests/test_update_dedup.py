@@ -0,0 +1,74 @@
+import asyncio
+
+from updates import dedup
+from updates.dedup import UpdateDeduplicator
+
+
+def test_memory_dedup_drops_repeats():
+    d = UpdateDeduplicator(backend="memory", window=60, name="test_dedup_memory")
+
+    async def run():
+        return [await d.is_duplicate(i) for i in (1, 2, 1, 3, 2)]
+
+    assert asyncio.run(run()) == [False, False, True, False, True]
+    assert d.stats()["duplicates"] == 2
+
+
+def test_memory_dedup_window_expires(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(dedup.time, "monotonic", lambda: now[0])
+    d = UpdateDeduplicator(backend="memory", window=10, name="test_dedup_window")
+
+    async def run():
+        first = await d.is_duplicate(7)
+        now[0] += 11
+        return first, await d.is_duplicate(7)
+
+    assert asyncio.run(run()) == (False, False)
+
+
+def test_memory_dedup_size_bound():
+    d = UpdateDeduplicator(backend="memory", window=60, max_size=2, name="test_dedup_size")
+
+    async def run():
+        for i in range(5):
+            await d.is_duplicate(i)
+        return await d.is_duplicate(0)
+
+    assert asyncio.run(run()) is False
+    assert d.stats()["size"] <= 2
+
+
+def test_missing_update_id_is_never_duplicate():
+    d = UpdateDeduplicator(backend="memory", name="test_dedup_none")
+    assert asyncio.run(d.is_duplicate(None)) is False
+
+
+def test_redis_backend_and_fallback(monkeypatch):
+    store = set()
+
+    async def fake_nx(key, value="1", ttl=60):
+        if key in store:
+            return False
+        store.add(key)
+        return True
+
+    monkeypatch.setattr(dedup, "set_cache_nx", fake_nx)
+    d = UpdateDeduplicator(backend="redis", name="test_dedup_redis")
+
+    async def run():
+        return [await d.is_duplicate(i) for i in (1, 1)]
+
+    assert asyncio.run(run()) == [False, True]
+    assert "upd:1" in store
+
+    async def unavailable(key, value="1", ttl=60):
+        return None
+
+    monkeypatch.setattr(dedup, "set_cache_nx", unavailable)
+
+    async def run_fallback():
+        return [await d.is_duplicate(i) for i in (5, 5)]
+
+    assert asyncio.run(run_fallback()) == [False, True]
+    assert d.stats()["redis_fallbacks"] == 2
@@ -0,0 +1,56 @@
+import json
+
+import pytest
+
+from updates import parser
+from updates.parser import parse_updates
+
+
+def test_single_object():
+    assert parse_updates(b'{"update_id": 1}') == [{"update_id": 1}]
+
+
+def test_array_is_flattened():
+    assert parse_updates(b'[{"update_id": 1}, {"update_id": 2}]') == [{"update_id": 1}, {"update_id": 2}]
+
+
+def test_concatenated_objects():
+    raw = b' {"update_id": 1},, {"update_id": 2}\n{"update_id": 3},\n'
+    assert [u["update_id"] for u in parse_updates(raw)] == [1, 2, 3]
+
+
+def test_empty_body():
+    assert parse_updates(b"") == []
+    assert parse_updates(b"  \n") == []
+
+
+@pytest.mark.parametrize("raw", [b'{"update_id": 1,}', b'{"text": "hi",,}', b"not json"])
+def test_invalid_json_raises(raw):
+    with pytest.raises(json.JSONDecodeError):
+        parse_updates(raw)
+
+
+def test_stdlib_backend(monkeypatch):
+    monkeypatch.setattr(parser, "orjson", None)
+    assert parse_updates('{"text": "привет"}'.encode()) == [{"text": "привет"}]
+    assert len(parse_updates(b'{"update_id": 1},{"update_id": 2}')) == 2
+
+
+def test_concatenated_objects_are_parsed_once(monkeypatch):
+    calls = []
+    real_loads = parser.loads_json
+
+    def counting_loads(raw):
+        calls.append(bytes(raw))
+        return real_loads(raw)
+
+    monkeypatch.setattr(parser, "loads_json", counting_loads)
+    monkeypatch.setattr(parser, "_parse_stream", None)
+    raw = b'{"update_id": 1}, {"update_id": 2}{"update_id": 3}'
+    assert [u["update_id"] for u in parse_updates(raw)] == [1, 2, 3]
+    assert calls == [b'{"update_id": 1}', b'{"update_id": 2}', b'{"update_id": 3}']
+
+
+def test_escaped_key_inside_text_is_not_a_boundary():
+    raw = b'{"update_id": 1, "message": {"text": "{\\"update_id\\": 2}"}}'
+    assert len(parse_updates(raw)) == 1
@@ -0,0 +1,196 @@
+import asyncio
+import json
+import threading
+import types
+import urllib.request
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from updates.polling import MemoryOffsetStore, UpdatePoller
+from updates.queue import UpdateQueue
+
+
+def _dumps(data):
+    return json.dumps(data).encode()
+
+
+def _updates(update_ids):
+    return [{"update_id": i, "message": {"from": {"id": i % 3}, "text": str(i)}} for i in update_ids]
+
+
+class FakeBotApi:
+    """Minimal getUpdates: updates below the requested offset are confirmed and deleted."""
+
+    def __init__(self, update_ids):
+        self.pending = _updates(update_ids)
+        self.calls = []
+
+    def get_updates(self, params):
+        self.calls.append(dict(params))
+        offset = params.get("offset")
+        if offset is not None:
+            self.pending = [u for u in self.pending if u["update_id"] >= offset]
+        return {"ok": True, "result": self.pending[: params["limit"]]}
+
+    async def post(self, url, json=None):
+        await asyncio.sleep(0)  # как настоящий сетевой запрос, отдаём управление циклу
+        return types.SimpleNamespace(content=_dumps(self.get_updates(json)))
+
+
+def test_poller_batches_feed_queue_and_ack_advances_offset():
+    api = FakeBotApi(range(100, 105))
+    store = MemoryOffsetStore()
+    seen = []
+    poller = None
+
+    async def handler(upd):
+        seen.append(upd["update_id"])
+        poller.ack(upd["update_id"])
+
+    async def run():
+        nonlocal poller
+        q = UpdateQueue(handler, workers=2, maxsize=2, name="test_poll_queue")
+        await q.start()
+        poller = UpdatePoller("T", q.put, offset_store=store, limit=2, timeout=0, client=api, name="test_poller")
+        while await poller.poll_once():
+            await asyncio.sleep(0.01)
+        await q.stop(timeout=1)
+        await poller.save_offset()
+
+    asyncio.run(run())
+    assert sorted(seen) == [100, 101, 102, 103, 104]
+    assert store.offset == 105
+    assert api.calls[-1]["offset"] == 105
+    assert poller.stats()["in_flight"] == 0
+
+
+def test_unprocessed_updates_survive_restart():
+    api = FakeBotApi([1, 2, 3])
+    store = MemoryOffsetStore()
+    queued = []
+
+    async def sink(upd):
+        queued.append(upd["update_id"])
+        return True
+
+    async def first_run():
+        poller = UpdatePoller("T", sink, offset_store=store, timeout=0, client=api, name="test_poller_crash")
+        await poller.poll_once()
+        poller.ack(1)
+        poller.ack(3)  # 2 ещё в обработке, когда процесс падает
+        await poller.poll_once()
+        return poller
+
+    poller = asyncio.run(first_run())
+    assert queued == [1, 2, 3]
+    assert poller.offset == 2
+    assert store.offset == 2
+    # Telegram не удалил необработанное обновление
+    assert [u["update_id"] for u in api.pending] == [2, 3]
+
+    queued.clear()
+
+    async def second_run():
+        poller = UpdatePoller("T", sink, offset_store=store, timeout=0, client=api, name="test_poller_restart")
+        await poller.start()
+        await asyncio.sleep(0.01)
+        await poller.stop()
+
+    asyncio.run(second_run())
+    assert queued[:2] == [2, 3]
+
+
+def test_poller_keeps_offset_when_sink_rejects():
+    api = FakeBotApi([10, 11])
+    store = MemoryOffsetStore()
+    poller = None
+
+    async def sink(upd):
+        if upd["update_id"] == 10:
+            poller.ack(10)
+            return True
+        return False
+
+    poller = UpdatePoller("T", sink, offset_store=store, timeout=0, client=api, name="test_poller_reject")
+    assert asyncio.run(poller.poll_once()) == 1
+    assert poller.offset == 11
+    assert store.offset == 11
+
+
+def test_poller_raises_on_api_error():
+    class ErrorApi:
+        async def post(self, url, json=None):
+            return types.SimpleNamespace(content=_dumps({"ok": False, "error_code": 409, "description": "Conflict"}))
+
+    async def sink(upd):
+        return True
+
+    poller = UpdatePoller("T", sink, timeout=0, client=ErrorApi(), name="test_poller_error")
+    try:
+        asyncio.run(poller.poll_once())
+    except RuntimeError as e:
+        assert "409" in str(e)
+    else:
+        raise AssertionError("expected RuntimeError")
+
+
+class _UrllibClient:
+    """HTTP-клиент поверх urllib: настоящий запрос к локальному серверу."""
+
+    async def post(self, url, json=None):
+        body = _dumps(json)
+
+        def call():
+            req = urllib.request.Request(url, data=body, headers={"Content-Type": "application/json"})
+            with urllib.request.urlopen(req, timeout=5) as resp:
+                return resp.read()
+
+        return types.SimpleNamespace(content=await asyncio.to_thread(call))
+
+
+def test_poller_against_local_fake_bot_api_server():
+    api = FakeBotApi([7, 8])
+    paths = []
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            paths.append(self.path)
+            params = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+            payload = _dumps(api.get_updates(params))
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    seen = []
+    poller = None
+
+    async def sink(upd):
+        seen.append(upd["update_id"])
+        poller.ack(upd["update_id"])
+        return True
+
+    try:
+        poller = UpdatePoller(
+            "123:ABC",
+            sink,
+            api_url=f"http://127.0.0.1:{server.server_port}/",
+            timeout=0,
+            client=_UrllibClient(),
+            name="test_poller_http",
+        )
+        asyncio.run(poller.poll_once())
+        asyncio.run(poller.poll_once())
+    finally:
+        server.shutdown()
+        server.server_close()
+
+    assert seen == [7, 8]
+    assert paths == ["/bot123:ABC/getUpdates"] * 2
+    assert api.calls[-1]["offset"] == 9
@@ -0,0 +1,211 @@
+import asyncio
+
+from updates.queue import UpdateQueue
+from updates.lanes import LaneScheduler, update_lane_key
+
+
+def test_queue_processes_all_items():
+    seen = []
+
+    async def handler(item):
+        await asyncio.sleep(0)
+        seen.append(item)
+
+    async def run():
+        q = UpdateQueue(handler, workers=3, maxsize=10, name="test_queue_all")
+        await q.start()
+        for i in range(10):
+            assert q.submit(i)
+        await q.stop(timeout=1)
+        return q
+
+    q = asyncio.run(run())
+    assert sorted(seen) == list(range(10))
+    stats = q.stats()
+    assert stats["processed"] == 10
+    assert stats["depth"] == 0
+    assert stats["max_depth"] >= 1
+
+
+def test_queue_reject_when_full():
+    release = None
+
+    async def handler(item):
+        await release.wait()
+
+    async def run():
+        nonlocal release
+        release = asyncio.Event()
+        q = UpdateQueue(handler, workers=1, maxsize=2, overflow="reject", name="test_queue_reject")
+        await q.start()
+        results = [q.submit(i) for i in range(4)]
+        release.set()
+        await q.stop(timeout=1)
+        return q, results
+
+    q, results = asyncio.run(run())
+    assert results == [True, True, False, False]
+    assert q.stats()["rejected"] == 2
+
+
+def test_queue_drop_oldest_keeps_newest():
+    seen = []
+    release = None
+
+    async def handler(item):
+        await release.wait()
+        seen.append(item)
+
+    async def run():
+        nonlocal release
+        release = asyncio.Event()
+        q = UpdateQueue(handler, workers=1, maxsize=2, overflow="drop_oldest", name="test_queue_drop")
+        await q.start()
+        for i in range(5):
+            assert q.submit(i)
+        release.set()
+        await q.stop(timeout=1)
+        return q
+
+    q = asyncio.run(run())
+    assert seen == [3, 4]
+    assert q.stats()["dropped"] == 3
+
+
+def test_queue_handler_errors_do_not_stop_workers():
+    seen = []
+
+    async def handler(item):
+        if item == 0:
+            raise RuntimeError("boom")
+        seen.append(item)
+
+    async def run():
+        q = UpdateQueue(handler, workers=1, maxsize=5, name="test_queue_errors")
+        await q.start()
+        q.submit(0)
+        q.submit(1)
+        await q.stop(timeout=1)
+        return q
+
+    q = asyncio.run(run())
+    assert seen == [1]
+    assert q.stats()["failed"] == 1
+
+
+def test_submit_before_start_is_rejected():
+    async def handler(item):
+        pass
+
+    q = UpdateQueue(handler, name="test_queue_not_started")
+    assert q.submit(1) is False
+
+
+def test_lane_key_from_update():
+    assert update_lane_key({"update_id": 1, "message": {"from": {"id": 5}, "chat": {"id": 9}}}) == 5
+    assert update_lane_key({"update_id": 2, "callback_query": {"from": {"id": 6}}}) == 6
+    assert update_lane_key({"update_id": 3, "channel_post": {"chat": {"id": 1}}}) is None
+
+
+def test_lanes_keep_per_user_order_and_run_users_in_parallel():
+    events = []
+
+    async def handler(item):
+        user, seq = item["message"]["from"]["id"], item["seq"]
+        events.append(("start", user, seq))
+        await asyncio.sleep(0.01 if seq == 0 else 0)
+        events.append(("end", user, seq))
+
+    def upd(user, seq):
+        return {"message": {"from": {"id": user}}, "seq": seq}
+
+    async def run():
+        lanes = LaneScheduler(handler, name="test_lanes_order")
+        q = UpdateQueue(lanes.dispatch, workers=4, maxsize=20, name="test_lanes_queue")
+        await q.start()
+        for seq in range(3):
+            q.submit(upd(1, seq))
+            q.submit(upd(2, seq))
+        await q.stop(timeout=1)
+        return lanes
+
+    lanes = asyncio.run(run())
+    for user in (1, 2):
+        user_events = [e for e in events if e[1] == user]
+        # строго последовательно: start/end одного обновления идут парой по порядку
+        assert user_events == [(kind, user, seq) for seq in range(3) for kind in ("start", "end")]
+    # второй пользователь стартовал, пока первый ещё обрабатывал первое сообщение
+    assert events.index(("start", 2, 0)) < events.index(("end", 1, 0))
+    # простаивающие дорожки удалены
+    assert lanes.active_lanes() == 0
+    assert lanes.stats()["queued_behind"] >= 2
+    assert lanes.stats()["processed"] == 6
+
+
+def test_lane_overflow_drops_updates():
+    release = None
+    seen = []
+
+    async def handler(item):
+        await release.wait()
+        seen.append(item["seq"])
+
+    async def run():
+        nonlocal release
+        release = asyncio.Event()
+        lanes = LaneScheduler(handler, max_pending=1, overflow="drop_newest", name="test_lanes_overflow")
+        first = asyncio.create_task(lanes.dispatch({"message": {"from": {"id": 1}}, "seq": 0}))
+        await asyncio.sleep(0)
+        await lanes.dispatch({"message": {"from": {"id": 1}}, "seq": 1})
+        await lanes.dispatch({"message": {"from": {"id": 1}}, "seq": 2})
+        release.set()
+        await first
+        return lanes
+
+    lanes = asyncio.run(run())
+    assert seen == [0, 1]
+    assert lanes.stats()["dropped"] == 1
+
+
+def test_lane_overflow_under_reject_policy_does_not_hold_workers():
+    release = None
+    seen = []
+    dropped = []
+
+    async def handler(item):
+        await release.wait()
+        seen.append(item["seq"])
+
+    async def run():
+        nonlocal release
+        release = asyncio.Event()
+        lanes = LaneScheduler(
+            handler, max_pending=1, overflow="reject", on_drop=dropped.append, name="test_lanes_reject"
+        )
+        first = asyncio.create_task(lanes.dispatch({"message": {"from": {"id": 1}}, "seq": 0}))
+        await asyncio.sleep(0)
+        await lanes.dispatch({"message": {"from": {"id": 1}}, "seq": 1})
+        # Переполненная дорожка не держит воркеров: каждый вызов сразу возвращается
+        for seq in range(2, 12):
+            await asyncio.wait_for(lanes.dispatch({"message": {"from": {"id": 1}}, "seq": seq}), 0.1)
+        # Другой пользователь обслуживается, пока первый ждёт
+        other = asyncio.create_task(lanes.dispatch({"message": {"from": {"id": 2}}, "seq": 100}))
+        release.set()
+        await asyncio.gather(first, other)
+        return lanes
+
+    lanes = asyncio.run(run())
+    assert sorted(seen) == [0, 1, 100]
+    assert [item["seq"] for item in dropped] == list(range(2, 12))
+    assert lanes.stats()["rejected"] == 10
+    assert lanes.stats()["dropped"] == 10
+
+
+def test_lane_counts_failures():
+    async def handler(item):
+        raise RuntimeError("boom")
+
+    lanes = LaneScheduler(handler, name="test_lanes_failed")
+    asyncio.run(lanes.dispatch({"message": {"from": {"id": 1}}}))
+    assert lanes.stats()["failed"] == 1
+    assert lanes.stats()["processed"] == 0
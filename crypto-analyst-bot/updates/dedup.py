@@ -0,0 +1,110 @@
+# updates/dedup.py
+# Скользящее окно update_id для отсечения повторных доставок Telegram.
+#
+# Если обработчик отвечает медленно, Telegram присылает то же обновление
+# ещё раз. Без дедупликации каждый повтор снова вызывает классификацию
+# интента в LLM и пишет лишнюю строку в chat_history. Проверка выполняется
+# до постановки в очередь, чтобы повтор не занимал место в ней и не вызывал
+# ответ 503; непринятое очередью обновление снимается с учёта через
+# ``forget``, иначе его повторная доставка была бы потеряна. Хранилище в памяти
+# подходит для одного воркера; для нескольких воркеров uvicorn используется
+# Redis (SET NX с TTL), при его недоступности — память.
+
+import logging
+import os
+import time
+from collections import OrderedDict
+from typing import Any, Optional
+
+from utils.cache import delete_cache, set_cache_nx
+from utils.runtime_metrics import register_metrics
+
+logger = logging.getLogger(__name__)
+
+UPDATE_DEDUP_BACKEND = os.getenv("UPDATE_DEDUP_BACKEND", "memory").lower()
+UPDATE_DEDUP_WINDOW = int(os.getenv("UPDATE_DEDUP_WINDOW", "600"))
+UPDATE_DEDUP_MAX = int(os.getenv("UPDATE_DEDUP_MAX", "100000"))
+
+BACKEND_MEMORY = "memory"
+BACKEND_REDIS = "redis"
+
+
+class UpdateDeduplicator:
+    """Sliding-window store of recently seen ``update_id`` values."""
+
+    def __init__(
+        self,
+        backend: str = UPDATE_DEDUP_BACKEND,
+        window: int = UPDATE_DEDUP_WINDOW,
+        max_size: int = UPDATE_DEDUP_MAX,
+        prefix: str = "upd:",
+        name: str = "update_dedup",
+    ) -> None:
+        if backend not in (BACKEND_MEMORY, BACKEND_REDIS):
+            logger.warning(f"Неизвестный бэкенд дедупликации '{backend}', используется '{BACKEND_MEMORY}'.")
+            backend = BACKEND_MEMORY
+        self.backend = backend
+        self.window = max(1, window)
+        self.max_size = max(1, max_size)
+        self.prefix = prefix
+        # update_id -> момент истечения; порядок вставки совпадает с порядком истечения
+        self._seen: "OrderedDict[Any, float]" = OrderedDict()
+
+        self.checked = 0
+        self.duplicates = 0
+        self.redis_fallbacks = 0
+
+        register_metrics(name, self.stats)
+
+    def _evict(self, now: float) -> None:
+        while self._seen:
+            key, expires = next(iter(self._seen.items()))
+            if expires > now and len(self._seen) <= self.max_size:
+                break
+            self._seen.popitem(last=False)
+
+    def _seen_in_memory(self, update_id: Any) -> bool:
+        now = time.monotonic()
+        self._evict(now)
+        if update_id in self._seen:
+            return True
+        self._seen[update_id] = now + self.window
+        if len(self._seen) > self.max_size:
+            self._seen.popitem(last=False)
+        return False
+
+    async def is_duplicate(self, update_id: Optional[Any]) -> bool:
+        """Отмечает ``update_id`` как увиденный; ``True`` — если он уже был в окне."""
+        if update_id is None:
+            return False
+        self.checked += 1
+        duplicate: Optional[bool] = None
+        if self.backend == BACKEND_REDIS:
+            created = await set_cache_nx(f"{self.prefix}{update_id}", ttl=self.window)
+            if created is None:
+                self.redis_fallbacks += 1
+            else:
+                duplicate = not created
+        if duplicate is None:
+            duplicate = self._seen_in_memory(update_id)
+        if duplicate:
+            self.duplicates += 1
+        return duplicate
+
+    async def forget(self, update_id: Optional[Any]) -> None:
+        """Снимает отметку: обновление не принято и должно пройти при повторе."""
+        if update_id is None:
+            return
+        self._seen.pop(update_id, None)
+        if self.backend == BACKEND_REDIS:
+            await delete_cache(f"{self.prefix}{update_id}")
+
+    def stats(self) -> dict:
+        return {
+            "backend": self.backend,
+            "window_s": self.window,
+            "size": len(self._seen),
+            "checked": self.checked,
+            "duplicates": self.duplicates,
+            "redis_fallbacks": self.redis_fallbacks,
+        }
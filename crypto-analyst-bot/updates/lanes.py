@@ -0,0 +1,183 @@
+# updates/lanes.py
+# Планировщик "дорожек": обновления одного пользователя выполняются строго
+# по очереди, обновления разных пользователей — параллельно.
+#
+# Воркер, получивший обновление для свободной дорожки, становится её
+# владельцем и обрабатывает все обновления, накопившиеся в ней. Если дорожка
+# уже занята, обновление дописывается в её хвост, а воркер сразу
+# освобождается — один активный пользователь не блокирует весь пул.
+#
+# Переполнение дорожки (LANE_MAX_PENDING) подчиняется той же политике, что и
+# очередь, но воркер никогда не ждёт места в чужой дорожке: иначе один
+# пользователь, приславший LANE_MAX_PENDING + UPDATE_WORKERS сообщений,
+# занял бы весь пул. При ``reject`` и ``drop_newest`` новое сообщение
+# отбрасывается (счётчик rejected/dropped), при ``drop_oldest`` вытесняется
+# самое старое ожидающее.
+
+import logging
+import os
+from collections import deque
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional
+
+from updates.queue import (
+    OVERFLOW_DROP_OLDEST,
+    OVERFLOW_POLICIES,
+    OVERFLOW_REJECT,
+    UPDATE_QUEUE_OVERFLOW,
+)
+from utils.runtime_metrics import register_metrics
+
+logger = logging.getLogger(__name__)
+
+LANE_MAX_PENDING = int(os.getenv("LANE_MAX_PENDING", "50"))
+
+# Типы обновлений, у которых есть отправитель в поле "from"
+_SENDER_FIELDS = (
+    "message",
+    "edited_message",
+    "callback_query",
+    "inline_query",
+    "chosen_inline_result",
+    "shipping_query",
+    "pre_checkout_query",
+    "my_chat_member",
+    "chat_member",
+    "chat_join_request",
+    "message_reaction",
+)
+
+Handler = Callable[[Any], Awaitable[None]]
+
+
+def update_lane_key(update_data: dict) -> Optional[Hashable]:
+    """Возвращает ключ дорожки (ID пользователя) для сырого обновления."""
+    for field in _SENDER_FIELDS:
+        obj = update_data.get(field)
+        if not isinstance(obj, dict):
+            continue
+        sender = obj.get("from") or obj.get("user")
+        if isinstance(sender, dict) and sender.get("id") is not None:
+            return sender["id"]
+        chat = obj.get("chat")
+        if isinstance(chat, dict) and chat.get("id") is not None:
+            return f"chat:{chat['id']}"
+    return None
+
+
+class _Lane:
+    __slots__ = ("pending",)
+
+    def __init__(self) -> None:
+        self.pending: deque = deque()
+
+
+class LaneScheduler:
+    """Per-key ordered execution on top of a shared worker pool."""
+
+    def __init__(
+        self,
+        handler: Handler,
+        key_func: Callable[[Any], Optional[Hashable]] = update_lane_key,
+        max_pending: int = LANE_MAX_PENDING,
+        overflow: str = UPDATE_QUEUE_OVERFLOW,
+        on_drop: Optional[Callable[[Any], None]] = None,
+        name: str = "update_lanes",
+    ) -> None:
+        if overflow not in OVERFLOW_POLICIES:
+            overflow = OVERFLOW_REJECT
+        self._handler = handler
+        self._key_func = key_func
+        self.max_pending = max(1, max_pending)
+        self.overflow = overflow
+        # Вызывается для каждого отброшенного обновления (например, чтобы его
+        # не ждал long polling)
+        self._on_drop = on_drop
+        self._lanes: Dict[Hashable, _Lane] = {}
+
+        self.dispatched = 0
+        self.processed = 0
+        self.failed = 0
+        self.queued_behind = 0
+        self.rejected = 0
+        self.dropped = 0
+        self.collected = 0
+        self.max_lanes = 0
+
+        register_metrics(name, self.stats)
+
+    def active_lanes(self) -> int:
+        return len(self._lanes)
+
+    async def dispatch(self, item: Any) -> None:
+        """Выполняет ``item`` в дорожке его пользователя с сохранением порядка."""
+        self.dispatched += 1
+        key = self._key_func(item)
+        if key is None:
+            # Без отправителя порядок не важен — обрабатываем сразу
+            await self._run(key, item)
+            return
+
+        lane = self._lanes.get(key)
+        if lane is not None and len(lane.pending) >= self.max_pending:
+            if self.overflow == OVERFLOW_DROP_OLDEST:
+                self._dropped(lane.pending.popleft())
+                logger.warning(f"Дорожка {key} переполнена ({self.max_pending}), вытеснено старое обновление.")
+            else:
+                # reject/drop_newest: воркер не ждёт места, чтобы не занимать пул
+                if self.overflow == OVERFLOW_REJECT:
+                    self.rejected += 1
+                self._dropped(item)
+                logger.warning(f"Дорожка {key} переполнена ({self.max_pending}), обновление отброшено.")
+                return
+        if lane is not None:
+            lane.pending.append(item)
+            self.queued_behind += 1
+            return
+
+        lane = _Lane()
+        self._lanes[key] = lane
+        if len(self._lanes) > self.max_lanes:
+            self.max_lanes = len(self._lanes)
+        try:
+            while True:
+                await self._run(key, item)
+                if not lane.pending:
+                    break
+                item = lane.pending.popleft()
+        finally:
+            # Пустая дорожка удаляется сразу — состояние не копится по неактивным пользователям
+            self._lanes.pop(key, None)
+            self.collected += 1
+            if lane.pending:
+                logger.warning(f"Дорожка {key} закрыта с {len(lane.pending)} необработанными обновлениями.")
+
+    def _dropped(self, item: Any) -> None:
+        self.dropped += 1
+        if self._on_drop is not None:
+            self._on_drop(item)
+
+    async def _run(self, key: Optional[Hashable], item: Any) -> None:
+        try:
+            await self._handler(item)
+            self.processed += 1
+        except Exception as e:
+            # Ошибка одного обновления не должна ломать дорожку
+            self.failed += 1
+            logger.error(f"Ошибка обработки обновления в дорожке {key}: {e!r}", exc_info=True)
+
+    def stats(self) -> dict:
+        # processed/failed — фактически выполненные обновления; счётчики
+        # очереди учитывают только передачу обновления в дорожку
+        return {
+            "active": len(self._lanes),
+            "max_active": self.max_lanes,
+            "overflow": self.overflow,
+            "pending": sum(len(lane.pending) for lane in self._lanes.values()),
+            "dispatched": self.dispatched,
+            "processed": self.processed,
+            "failed": self.failed,
+            "queued_behind": self.queued_behind,
+            "rejected": self.rejected,
+            "dropped": self.dropped,
+            "collected": self.collected,
+        }
@@ -0,0 +1,113 @@
+# updates/parser.py
+# Разбор тела webhook-запроса Telegram напрямую из bytes.
+#
+# Форма тела определяется до разбора: массив или одиночный объект
+# разбираются за один вызов без промежуточной строки (orjson из
+# requirements.txt принимает bytes; без него — stdlib json). Несколько
+# объектов подряд (в том числе через запятую) узнаются по нескольким ключам
+# "update_id": каждый документ разбирается ровно один раз по заранее
+# найденным границам, а в нестандартных случаях — одним потоковым проходом
+# через ``raw_decode``. Пробного разбора и регулярных выражений нет.
+
+import json
+import logging
+from typing import Any, List
+
+try:
+    import orjson
+except Exception:
+    orjson = None
+
+logger = logging.getLogger(__name__)
+
+JSON_BACKEND = "orjson" if orjson else "json"
+
+_decoder = json.JSONDecoder()
+# Разделители, допустимые между объектами при "склеенной" доставке
+_SEPARATORS = " \t\r\n,"
+_SEPARATOR_BYTES = _SEPARATORS.encode()
+# Ключ верхнего уровня каждого обновления. Внутри строковых значений кавычки
+# экранированы, поэтому ложных совпадений в тексте сообщений не бывает.
+_UPDATE_KEY = b'"update_id"'
+_DOC_START = b'{"update_id"'
+
+
+def loads_json(raw) -> Any:
+    """Декодирует JSON из bytes выбранным бэкендом (orjson или stdlib)."""
+    if orjson is not None:
+        return orjson.loads(raw)
+    if isinstance(raw, memoryview):
+        raw = raw.tobytes()
+    return json.loads(raw)
+
+
+def _as_updates(doc: Any, out: List[dict]) -> None:
+    if isinstance(doc, dict):
+        out.append(doc)
+    elif isinstance(doc, list):
+        for item in doc:
+            _as_updates(item, out)
+    else:
+        logger.debug(f"Пропущен элемент обновления неожиданного типа: {type(doc).__name__}")
+
+
+def _parse_documents(body: bytes, count: int) -> List[dict]:
+    """Разбирает склеенные обновления, каждое отдельным вызовом ``loads_json``.
+
+    Telegram всегда начинает обновление с ``{"update_id"``; если это верно
+    для всех ``count`` ключей, границы документов известны заранее и каждый
+    срез разбирается ровно один раз. Иначе — общий потоковый проход.
+    """
+    starts = []
+    pos = body.find(_DOC_START)
+    while pos != -1:
+        starts.append(pos)
+        pos = body.find(_DOC_START, pos + 1)
+    if len(starts) != count or starts[0] != 0:
+        return _parse_stream(body)
+    view = memoryview(body)
+    updates: List[dict] = []
+    ends = starts[1:] + [len(body)]
+    for start, end in zip(starts, ends):
+        while end > start and body[end - 1] in _SEPARATOR_BYTES:
+            end -= 1
+        _as_updates(loads_json(view[start:end]), updates)
+    return updates
+
+
+def _parse_stream(raw: bytes) -> List[dict]:
+    """Один проход по телу с несколькими JSON-документами подряд."""
+    text = raw.decode("utf-8", "ignore")
+    updates: List[dict] = []
+    idx, end = 0, len(text)
+    while True:
+        while idx < end and text[idx] in _SEPARATORS:
+            idx += 1
+        if idx >= end:
+            break
+        doc, idx = _decoder.raw_decode(text, idx)
+        _as_updates(doc, updates)
+    return updates
+
+
+def parse_updates(raw: bytes) -> List[dict]:
+    """Разбирает тело webhook-запроса и ВСЕГДА возвращает список обновлений.
+
+    Поддерживает одиночный объект, массив объектов и объекты, идущие подряд
+    (в том числе через запятую). При невалидном JSON поднимает
+    ``json.JSONDecodeError``.
+    """
+    body = raw
+    if body[:1] in _SEPARATOR_BYTES or body[-1:] in _SEPARATOR_BYTES:
+        body = body.strip(_SEPARATOR_BYTES)
+    if not body:
+        return []
+    if body[:1] != b"[":
+        count = body.count(_UPDATE_KEY)
+        if count > 1:
+            return _parse_documents(body, count)
+    # orjson.JSONDecodeError наследует json.JSONDecodeError
+    doc = loads_json(body)
+    updates: List[dict] = []
+    _as_updates(doc, updates)
+    return updates
@@ -0,0 +1,273 @@
+# updates/polling.py
+# Приём обновлений через long polling (getUpdates) как альтернатива вебхуку.
+#
+# Обновления забираются пачками до POLLING_LIMIT штук и передаются в ту же
+# очередь воркеров, что и у вебхука. Offset, который отправляется в Telegram
+# и сохраняется в Postgres или Redis, — это нижняя граница необработанных
+# обновлений: он сдвигается только после ``ack`` (обработка завершена), а не
+# после постановки в очередь. Поэтому Telegram не удаляет то, что лежит в
+# очереди, и после падения или перезапуска такие обновления приходят снова
+# (повторы уже обработанных отсекает дедупликация update_id).
+#
+# Адрес Bot API настраивается через TELEGRAM_API_URL, что позволяет гонять
+# поллер и самого бота против локального фейкового сервера.
+#
+# getUpdates допускает только одного потребителя: в режиме polling должен
+# работать один процесс, иначе Telegram отвечает 409 Conflict.
+
+import asyncio
+import logging
+import os
+from typing import Any, Awaitable, Callable, List, Optional, Set
+
+import httpx
+
+from updates.parser import loads_json
+from utils.cache import get_cache, set_cache
+from utils.runtime_metrics import register_metrics
+
+logger = logging.getLogger(__name__)
+
+TELEGRAM_API_URL = os.getenv("TELEGRAM_API_URL", "https://api.telegram.org")
+POLLING_TIMEOUT = int(os.getenv("POLLING_TIMEOUT", "50"))
+POLLING_LIMIT = int(os.getenv("POLLING_LIMIT", "100"))
+POLLING_OFFSET_STORE = os.getenv("POLLING_OFFSET_STORE", "db").lower()
+POLLING_MAX_BACKOFF = float(os.getenv("POLLING_MAX_BACKOFF", "30"))
+
+OFFSET_KEY = "polling_offset"
+
+Sink = Callable[[dict], Awaitable[bool]]
+
+
+class MemoryOffsetStore:
+    """Offset только в памяти процесса (для тестов и локального запуска)."""
+
+    def __init__(self, offset: Optional[int] = None) -> None:
+        self.offset = offset
+
+    async def load(self) -> Optional[int]:
+        return self.offset
+
+    async def save(self, offset: int) -> None:
+        self.offset = offset
+
+
+class RedisOffsetStore:
+    """Offset в Redis через utils.cache."""
+
+    # Ключ живёт долго: после длительного простоя Telegram всё равно хранит
+    # обновления не более суток
+    TTL = 30 * 24 * 3600
+
+    def __init__(self, key: str = f"tg:{OFFSET_KEY}") -> None:
+        self.key = key
+
+    async def load(self) -> Optional[int]:
+        value = await get_cache(self.key)
+        return int(value) if value else None
+
+    async def save(self, offset: int) -> None:
+        await set_cache(self.key, str(offset), ttl=self.TTL)
+
+
+class DbOffsetStore:
+    """Offset в таблице bot_state."""
+
+    def __init__(self, session_factory, key: str = OFFSET_KEY) -> None:
+        self._session_factory = session_factory
+        self.key = key
+
+    async def load(self) -> Optional[int]:
+        from database import operations as db_ops
+
+        async with self._session_factory() as session:
+            value = await db_ops.get_bot_state(session, self.key)
+        return int(value) if value else None
+
+    async def save(self, offset: int) -> None:
+        from database import operations as db_ops
+
+        async with self._session_factory() as session:
+            await db_ops.set_bot_state(session, self.key, str(offset))
+
+
+def make_offset_store(backend: str = POLLING_OFFSET_STORE, session_factory=None):
+    """Создаёт хранилище offset по имени бэкенда: db | redis | memory."""
+    if backend == "redis":
+        return RedisOffsetStore()
+    if backend == "db" and session_factory is not None:
+        return DbOffsetStore(session_factory)
+    if backend != "memory":
+        logger.warning(f"Хранилище offset '{backend}' недоступно, offset хранится в памяти.")
+    return MemoryOffsetStore()
+
+
+class UpdatePoller:
+    """Long-polling loop that feeds ``getUpdates`` batches into ``sink``.
+
+    ``sink`` returns ``True`` once the update is accepted; the owner must call
+    :meth:`ack` when the update has been processed (or deliberately skipped).
+    """
+
+    def __init__(
+        self,
+        token: str,
+        sink: Sink,
+        offset_store=None,
+        api_url: str = TELEGRAM_API_URL,
+        timeout: int = POLLING_TIMEOUT,
+        limit: int = POLLING_LIMIT,
+        allowed_updates: Optional[List[str]] = None,
+        client: Optional[Any] = None,
+        name: str = "update_poller",
+    ) -> None:
+        self._url = f"{api_url.rstrip('/')}/bot{token}/getUpdates"
+        self._sink = sink
+        self._store = offset_store or MemoryOffsetStore()
+        self.timeout = max(0, timeout)
+        self.limit = min(max(1, limit), 100)  # ограничение Bot API
+        self.allowed_updates = allowed_updates
+        self._client = client
+        self._owns_client = client is None
+        self._task: Optional[asyncio.Task] = None
+        # offset — первое необработанное обновление (его видит Telegram и хранилище);
+        # _next_id — следующее ещё не полученное; между ними — обновления в работе
+        self.offset: Optional[int] = None
+        self._next_id: Optional[int] = None
+        self._in_flight: Set[int] = set()
+        self._acked = asyncio.Event()
+        self._saved_offset: Optional[int] = None
+
+        self.requests = 0
+        self.batches = 0
+        self.received = 0
+        self.acked = 0
+        self.errors = 0
+        self.last_batch = 0
+
+        register_metrics(name, self.stats)
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    async def start(self) -> None:
+        if self.running:
+            return
+        if self._client is None:
+            self._client = httpx.AsyncClient(timeout=self.timeout + 10)
+        try:
+            self.offset = await self._store.load()
+        except Exception as e:
+            logger.error(f"Не удалось загрузить offset long polling: {e}")
+        self._next_id = self.offset
+        self._saved_offset = self.offset
+        self._task = asyncio.create_task(self._run(), name="update-poller")
+        logger.info(f"Long polling запущен, offset={self.offset}, limit={self.limit}")
+
+    async def stop(self) -> None:
+        """Прекращает забирать обновления; уже принятые продолжают подтверждаться."""
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        await self.save_offset()
+        if self._owns_client and self._client is not None:
+            await self._client.aclose()
+            self._client = None
+        logger.info(f"Long polling остановлен, offset={self.offset}, в работе={len(self._in_flight)}")
+
+    def ack(self, update_id: Optional[int]) -> None:
+        """Отмечает обновление обработанным и сдвигает нижнюю границу offset."""
+        if update_id is None or update_id not in self._in_flight:
+            return
+        self._in_flight.discard(update_id)
+        self.acked += 1
+        self.offset = min(self._in_flight) if self._in_flight else self._next_id
+        self._acked.set()
+
+    async def poll_once(self) -> int:
+        """Один запрос getUpdates; возвращает число новых принятых обновлений."""
+        params = {"timeout": self.timeout, "limit": self.limit}
+        if self.offset is not None:
+            params["offset"] = self.offset
+        if self.allowed_updates is not None:
+            params["allowed_updates"] = self.allowed_updates
+        self.requests += 1
+        response = await self._client.post(self._url, json=params)
+        data = loads_json(response.content)
+        if not data.get("ok"):
+            raise RuntimeError(f"getUpdates: {data.get('error_code')} {data.get('description')}")
+
+        accepted = 0
+        for upd in data.get("result") or []:
+            update_id = upd["update_id"]
+            if self._next_id is not None and update_id < self._next_id:
+                # Ещё в работе: offset не сдвинут, и Telegram прислал его снова
+                continue
+            self._in_flight.add(update_id)
+            # Ждём места в очереди: при перегрузке поллер просто читает медленнее
+            if not await self._sink(upd):
+                # Очередь остановлена — обновление придёт снова после перезапуска
+                self._in_flight.discard(update_id)
+                break
+            self._next_id = update_id + 1
+            if self.offset is None:
+                self.offset = update_id
+            accepted += 1
+        if not self._in_flight and self._next_id is not None:
+            self.offset = self._next_id
+        self.received += accepted
+        self.last_batch = accepted
+        if accepted:
+            self.batches += 1
+        await self.save_offset()
+        return accepted
+
+    async def save_offset(self) -> None:
+        """Сохраняет нижнюю границу offset, если она сдвинулась."""
+        if self.offset is None or self.offset == self._saved_offset:
+            return
+        try:
+            await self._store.save(self.offset)
+            self._saved_offset = self.offset
+        except Exception as e:
+            logger.error(f"Не удалось сохранить offset long polling: {e}")
+
+    async def _wait_for_ack(self) -> None:
+        self._acked.clear()
+        try:
+            await asyncio.wait_for(self._acked.wait(), timeout=max(1, self.timeout))
+        except asyncio.TimeoutError:
+            pass
+
+    async def _run(self) -> None:
+        backoff = 1.0
+        while True:
+            try:
+                accepted = await self.poll_once()
+                backoff = 1.0
+                if not accepted and self._in_flight:
+                    # Telegram вернул только обновления в работе — ждём подтверждений,
+                    # чтобы не крутить getUpdates вхолостую
+                    await self._wait_for_ack()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.errors += 1
+                logger.error(f"Ошибка long polling: {e!r}; повтор через {backoff:.0f} с")
+                await asyncio.sleep(backoff)
+                backoff = min(backoff * 2, POLLING_MAX_BACKOFF)
+
+    def stats(self) -> dict:
+        return {
+            "running": self.running,
+            "offset": self.offset,
+            "in_flight": len(self._in_flight),
+            "requests": self.requests,
+            "batches": self.batches,
+            "received": self.received,
+            "acked": self.acked,
+            "last_batch": self.last_batch,
+            "errors": self.errors,
+        }
@@ -0,0 +1,202 @@
+# updates/queue.py
+# Ограниченная очередь входящих обновлений Telegram с пулом воркеров.
+# Вебхук только кладёт обновление в очередь и сразу отвечает, а фиксированное
+# число воркеров разбирает очередь, поэтому всплеск трафика не превращается
+# в тысячи одновременных сессий БД и запросов к LLM.
+
+import asyncio
+import logging
+import os
+import time
+from typing import Any, Awaitable, Callable, Optional
+
+from utils.runtime_metrics import register_metrics
+
+logger = logging.getLogger(__name__)
+
+UPDATE_WORKERS = int(os.getenv("UPDATE_WORKERS", "8"))
+UPDATE_QUEUE_SIZE = int(os.getenv("UPDATE_QUEUE_SIZE", "1000"))
+UPDATE_QUEUE_DRAIN_TIMEOUT = float(os.getenv("UPDATE_QUEUE_DRAIN_TIMEOUT", "25"))
+
+# Политики при переполнении очереди:
+# reject      — новое обновление не принимается, вебхук отвечает 503,
+#               и Telegram доставит его повторно позже (без потерь);
+# drop_oldest — вытесняется самое старое ожидающее обновление;
+# drop_newest — новое обновление отбрасывается.
+OVERFLOW_REJECT = "reject"
+OVERFLOW_DROP_OLDEST = "drop_oldest"
+OVERFLOW_DROP_NEWEST = "drop_newest"
+OVERFLOW_POLICIES = (OVERFLOW_REJECT, OVERFLOW_DROP_OLDEST, OVERFLOW_DROP_NEWEST)
+UPDATE_QUEUE_OVERFLOW = os.getenv("UPDATE_QUEUE_OVERFLOW", OVERFLOW_REJECT).lower()
+
+Handler = Callable[[Any], Awaitable[None]]
+
+
+class UpdateQueue:
+    """Bounded in-process queue drained by a pool of worker coroutines."""
+
+    def __init__(
+        self,
+        handler: Handler,
+        workers: int = UPDATE_WORKERS,
+        maxsize: int = UPDATE_QUEUE_SIZE,
+        overflow: str = UPDATE_QUEUE_OVERFLOW,
+        name: str = "update_queue",
+    ) -> None:
+        if overflow not in OVERFLOW_POLICIES:
+            logger.warning(f"Неизвестная политика переполнения '{overflow}', используется '{OVERFLOW_REJECT}'.")
+            overflow = OVERFLOW_REJECT
+        self._handler = handler
+        self.workers = max(1, workers)
+        self.maxsize = max(1, maxsize)
+        self.overflow = overflow
+        self._queue: Optional[asyncio.Queue] = None
+        self._tasks: list[asyncio.Task] = []
+        self._accepting = False
+
+        # --- Счётчики ---
+        self.submitted = 0
+        self.processed = 0
+        self.failed = 0
+        self.rejected = 0
+        self.dropped = 0
+        self.in_flight = 0
+        self.max_depth = 0
+        self._wait_total = 0.0
+        self._wait_count = 0
+        self._wait_max = 0.0
+        self._wait_last = 0.0
+
+        register_metrics(name, self.stats)
+
+    @property
+    def running(self) -> bool:
+        return self._accepting
+
+    def depth(self) -> int:
+        return self._queue.qsize() if self._queue else 0
+
+    async def start(self) -> None:
+        """Создаёт очередь и запускает воркеры. Повторный вызов игнорируется."""
+        if self._tasks:
+            return
+        self._queue = asyncio.Queue(maxsize=self.maxsize)
+        self._tasks = [
+            asyncio.create_task(self._worker(i), name=f"update-worker-{i}")
+            for i in range(self.workers)
+        ]
+        self._accepting = True
+        logger.info(
+            f"Очередь обновлений запущена: воркеров={self.workers}, размер={self.maxsize}, "
+            f"переполнение={self.overflow}"
+        )
+
+    def submit(self, item: Any) -> bool:
+        """Неблокирующе ставит обновление в очередь.
+
+        Возвращает ``False``, если обновление не принято: очередь не запущена
+        или переполнена при политике ``drop_newest``/``reject``.
+        """
+        if not self._accepting or self._queue is None:
+            self.rejected += 1
+            return False
+        if self._queue.full():
+            if self.overflow == OVERFLOW_DROP_OLDEST:
+                try:
+                    self._queue.get_nowait()
+                    self._queue.task_done()
+                    self.dropped += 1
+                except asyncio.QueueEmpty:
+                    pass
+            elif self.overflow == OVERFLOW_DROP_NEWEST:
+                self.dropped += 1
+                logger.warning("Очередь обновлений переполнена, новое обновление отброшено.")
+                return False
+            else:
+                self.rejected += 1
+                logger.warning("Очередь обновлений переполнена, обновление отклонено.")
+                return False
+        self._queue.put_nowait((item, time.monotonic()))
+        self.submitted += 1
+        depth = self._queue.qsize()
+        if depth > self.max_depth:
+            self.max_depth = depth
+        return True
+
+    async def put(self, item: Any) -> bool:
+        """Ставит обновление в очередь, дожидаясь свободного места.
+
+        Используется источниками, которые могут подождать (long polling):
+        вместо потерь они получают естественное обратное давление.
+        """
+        if not self._accepting or self._queue is None:
+            self.rejected += 1
+            return False
+        await self._queue.put((item, time.monotonic()))
+        self.submitted += 1
+        depth = self._queue.qsize()
+        if depth > self.max_depth:
+            self.max_depth = depth
+        return True
+
+    async def stop(self, timeout: float = UPDATE_QUEUE_DRAIN_TIMEOUT) -> None:
+        """Перестаёт принимать обновления и дожидается обработки очереди."""
+        if not self._tasks:
+            return
+        self._accepting = False
+        try:
+            await asyncio.wait_for(self._queue.join(), timeout=timeout)
+        except asyncio.TimeoutError:
+            logger.warning(
+                f"Очередь не успела опустеть за {timeout} с: осталось {self.depth()}, "
+                f"в обработке {self.in_flight}."
+            )
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        logger.info("Очередь обновлений остановлена.")
+
+    async def _worker(self, idx: int) -> None:
+        while True:
+            item, enqueued_at = await self._queue.get()
+            self._record_wait(time.monotonic() - enqueued_at)
+            self.in_flight += 1
+            try:
+                await self._handler(item)
+                self.processed += 1
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.failed += 1
+                logger.error(f"Воркер {idx}: ошибка при обработке обновления: {e!r}", exc_info=True)
+            finally:
+                self.in_flight -= 1
+                self._queue.task_done()
+
+    def _record_wait(self, wait: float) -> None:
+        self._wait_total += wait
+        self._wait_count += 1
+        self._wait_last = wait
+        if wait > self._wait_max:
+            self._wait_max = wait
+
+    def stats(self) -> dict:
+        avg = self._wait_total / self._wait_count if self._wait_count else 0.0
+        return {
+            "running": self._accepting,
+            "workers": self.workers,
+            "maxsize": self.maxsize,
+            "overflow": self.overflow,
+            "depth": self.depth(),
+            "max_depth": self.max_depth,
+            "in_flight": self.in_flight,
+            "submitted": self.submitted,
+            "processed": self.processed,
+            "failed": self.failed,
+            "rejected": self.rejected,
+            "dropped": self.dropped,
+            "wait_ms_avg": round(avg * 1000, 2),
+            "wait_ms_max": round(self._wait_max * 1000, 2),
+            "wait_ms_last": round(self._wait_last * 1000, 2),
+        }
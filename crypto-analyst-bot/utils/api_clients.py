@@ -4,12 +4,11 @@
 
 import os
 import logging
-import httpx
 from typing import Optional, Dict, Any, List
 from urllib.parse import urlencode
-import json
 
-from utils.cache import get_cache, set_cache
+from utils import market_http
+from utils.cache import NOT_FOUND, get_or_fetch
 from dotenv import load_dotenv
 
 logger = logging.getLogger(__name__)
@@ -19,6 +18,9 @@ COINGECKO_API_KEY = os.getenv("COINGECKO_API_KEY")
 COINMARKETCAP_API_KEY = os.getenv("COINMARKETCAP_API_KEY")
 
 BINANCE_BASE_URL = "https://api.binance.com"
+
+# Ответы «нет такой монеты/пары»: запоминаются ненадолго, а не повторяются
+NOT_FOUND_STATUSES = (400, 404)
 
 class CoinGeckoClient:
     """
@@ -40,20 +42,19 @@ class CoinGeckoClient:
         """
         url = f"{self.base_url}{endpoint}"
         cache_key = f"cg:{endpoint}:{urlencode(sorted(params.items())) if params else ''}"
-        cached = await get_cache(cache_key)
-        if cached:
-            return json.loads(cached)
 
-        try:
-            async with httpx.AsyncClient(timeout=15.0) as client:
-                response = await client.get(url, headers=self.headers, params=params)
+        async def fetch() -> Optional[Any]:
+            try:
+                response = await market_http.get(url, headers=self.headers, params=params)
+                if response.status_code in NOT_FOUND_STATUSES:
+                    return NOT_FOUND
                 response.raise_for_status()
-                data = response.json()
-                await set_cache(cache_key, json.dumps(data), ttl=45)
-                return data
-        except Exception as e:
-            logger.exception(f"Ошибка при запросе к CoinGecko API ({url}): {e}")
-            return None
+                return response.json()
+            except Exception as e:
+                logger.exception(f"Ошибка при запросе к CoinGecko API ({url}): {e}")
+                return None
+
+        return await get_or_fetch(cache_key, fetch, ttl=45)
 
     async def get_simple_price(self, coin_ids: List[str], vs_currencies: List[str] = ['usd']) -> Optional[Dict]:
         """
@@ -110,20 +111,19 @@ class CoinMarketCapClient:
     async def _request(self, endpoint: str, params: Optional[Dict] = None) -> Optional[Any]:
         url = f"{self.base_url}{endpoint}"
         cache_key = f"cmc:{endpoint}:{urlencode(sorted(params.items())) if params else ''}"
-        cached = await get_cache(cache_key)
-        if cached:
-            return json.loads(cached)
 
-        try:
-            async with httpx.AsyncClient(timeout=15.0) as client:
-                response = await client.get(url, headers=self.headers, params=params)
+        async def fetch() -> Optional[Any]:
+            try:
+                response = await market_http.get(url, headers=self.headers, params=params)
+                if response.status_code in NOT_FOUND_STATUSES:
+                    return NOT_FOUND
                 response.raise_for_status()
-                data = response.json()
-                await set_cache(cache_key, json.dumps(data), ttl=45)
-                return data
-        except Exception as e:
-            logger.exception(f"Ошибка при запросе к CoinMarketCap API ({url}): {e}")
-            return None
+                return response.json()
+            except Exception as e:
+                logger.exception(f"Ошибка при запросе к CoinMarketCap API ({url}): {e}")
+                return None
+
+        return await get_or_fetch(cache_key, fetch, ttl=45)
 
     async def get_market_pairs(self, symbol: str, limit: int = 5) -> Optional[List[Dict]]:
         params = {"symbol": symbol.upper(), "limit": limit}
@@ -154,20 +154,19 @@ class BinanceClient:
     async def _request(self, endpoint: str, params: Optional[Dict] = None) -> Optional[Any]:
         url = f"{self.base_url}{endpoint}"
         cache_key = f"bin:{endpoint}:{urlencode(sorted(params.items())) if params else ''}"
-        cached = await get_cache(cache_key)
-        if cached:
-            return json.loads(cached)
 
-        try:
-            async with httpx.AsyncClient(timeout=10.0) as client:
-                response = await client.get(url, params=params)
+        async def fetch() -> Optional[Any]:
+            try:
+                response = await market_http.get(url, params=params)
+                if response.status_code in NOT_FOUND_STATUSES:
+                    return NOT_FOUND
                 response.raise_for_status()
-                data = response.json()
-                await set_cache(cache_key, json.dumps(data), ttl=45)
-                return data
-        except Exception as e:
-            logger.exception(f"Ошибка при запросе к Binance API ({url}): {e}")
-            return None
+                return response.json()
+            except Exception as e:
+                logger.exception(f"Ошибка при запросе к Binance API ({url}): {e}")
+                return None
+
+        return await get_or_fetch(cache_key, fetch, ttl=45)
 
     async def get_price(self, symbol: str) -> Optional[float]:
         data = await self._request("/api/v3/ticker/price", params={"symbol": symbol.upper()})
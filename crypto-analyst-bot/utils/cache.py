@@ -1,7 +1,32 @@
-import os
+# utils/cache.py
+# Кэш в Redis с локальным уровнем и защитой от недоступности Redis.
+#
+# Каждое попадание раньше стоило сетевого запроса к Redis, а при его
+# недоступности каждый вызов ждал ошибку соединения и писал её в лог.
+# Теперь:
+# * для префиксов из CACHE_LOCAL_PREFIXES (рыночные данные, которым не
+#   нужна согласованность между воркерами) перед Redis стоит LRU в памяти
+#   процесса;
+# * после CACHE_REDIS_FAILURES ошибок подряд Redis пропускается на
+#   CACHE_REDIS_RESET секунд (circuit breaker), затем проверяется одним
+#   запросом;
+# * get_or_fetch хранит значение вместе со сроком свежести: устаревшее
+#   значение ещё CACHE_STALE_TTL секунд отдаётся сразу, а обновляется в
+#   фоне (stale-while-revalidate); ответ «не найдено» (NOT_FOUND)
+#   запоминается на CACHE_NEGATIVE_TTL секунд.
+# Попадания, промахи и устаревшие ответы считаются по префиксу ключа.
+
+import asyncio
 import json
 import logging
-from typing import Optional
+import os
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+
+from utils.circuit_breaker import CircuitBreaker, OPEN
+from utils.runtime_metrics import register_metrics
+from utils.singleflight import singleflight
 
 try:
     import redis.asyncio as redis
@@ -11,25 +36,263 @@ except Exception:
 logger = logging.getLogger(__name__)
 REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379/0")
 
+CACHE_LOCAL_SIZE = int(os.getenv("CACHE_LOCAL_SIZE", "5000"))
+CACHE_LOCAL_TTL = int(os.getenv("CACHE_LOCAL_TTL", "30"))
+CACHE_LOCAL_PREFIXES = frozenset(
+    p.strip() for p in os.getenv("CACHE_LOCAL_PREFIXES", "cg,cmc,bin,hist,pred").split(",") if p.strip()
+)
+CACHE_STALE_TTL = int(os.getenv("CACHE_STALE_TTL", "60"))
+CACHE_NEGATIVE_TTL = int(os.getenv("CACHE_NEGATIVE_TTL", "120"))
+CACHE_REDIS_FAILURES = int(os.getenv("CACHE_REDIS_FAILURES", "3"))
+CACHE_REDIS_RESET = float(os.getenv("CACHE_REDIS_RESET", "15"))
+
 if redis:
     redis_client = redis.from_url(REDIS_URL, encoding="utf-8", decode_responses=True)
 else:
     redis_client = None
     logger.warning("redis-py not installed, caching disabled")
 
-async def get_cache(key: str) -> Optional[str]:
-    if not redis_client:
-        return None
-    try:
-        return await redis_client.get(key)
-    except Exception as e:
-        logger.error(f"Failed to get cache for {key}: {e}")
+
+class _NotFound:
+    def __repr__(self) -> str:
+        return "NOT_FOUND"
+
+
+# Возвращается из fetch в get_or_fetch, когда источник ответил «нет такого»
+NOT_FOUND = _NotFound()
+
+_FRESH = "__fresh"
+_VALUE = "__v"
+_NEGATIVE = "__nf"
+
+
+def key_prefix(key: str) -> str:
+    return key.split(":", 1)[0]
+
+
+class LayeredCache:
+    """Process LRU in front of Redis with a breaker, SWR and negative caching."""
+
+    def __init__(
+        self,
+        client=None,
+        local_size: int = CACHE_LOCAL_SIZE,
+        local_ttl: int = CACHE_LOCAL_TTL,
+        local_prefixes=CACHE_LOCAL_PREFIXES,
+        stale_ttl: int = CACHE_STALE_TTL,
+        negative_ttl: int = CACHE_NEGATIVE_TTL,
+        breaker: Optional[CircuitBreaker] = None,
+        clock: Callable[[], float] = time.time,
+        name: str = "cache",
+    ) -> None:
+        self.client = client
+        self.local_size = local_size
+        self.local_ttl = local_ttl
+        self.local_prefixes = frozenset(local_prefixes)
+        self.stale_ttl = stale_ttl
+        self.negative_ttl = negative_ttl
+        self.breaker = breaker or CircuitBreaker(CACHE_REDIS_FAILURES, CACHE_REDIS_RESET)
+        self._clock = clock
+        self._local: "OrderedDict[str, Tuple[float, str]]" = OrderedDict()
+        self._refreshes: Dict[str, asyncio.Task] = {}
+        self._stats: Dict[str, Dict[str, int]] = {}
+        self.redis_errors = 0
+        self.redis_bypassed = 0
+        register_metrics(name, self.stats)
+
+    def _count(self, key: str, event: str) -> None:
+        counts = self._stats.setdefault(
+            key_prefix(key),
+            {"local_hits": 0, "redis_hits": 0, "misses": 0, "stale": 0, "negative_hits": 0, "refreshes": 0},
+        )
+        counts[event] += 1
+
+    # --- локальный уровень ---
+
+    def _local_get(self, key: str) -> Optional[str]:
+        entry = self._local.get(key)
+        if entry is None:
+            return None
+        expires_at, value = entry
+        if expires_at <= self._clock():
+            del self._local[key]
+            return None
+        self._local.move_to_end(key)
+        return value
+
+    def _local_set(self, key: str, value: str, ttl: float) -> None:
+        if key_prefix(key) not in self.local_prefixes or ttl <= 0:
+            return
+        self._local[key] = (self._clock() + ttl, value)
+        self._local.move_to_end(key)
+        while len(self._local) > self.local_size:
+            self._local.popitem(last=False)
+
+    # --- Redis через выключатель ---
+
+    async def _redis(self, op: str, key: str, call: Callable[[], Awaitable[Any]]) -> Tuple[bool, Any]:
+        """``(ok, result)``; при разомкнутом выключателе Redis не вызывается."""
+        if self.client is None:
+            return False, None
+        if not self.breaker.allow():
+            self.redis_bypassed += 1
+            return False, None
+        try:
+            result = await call()
+        except asyncio.CancelledError:
+            self.breaker.release()
+            raise
+        except Exception as e:
+            self.redis_errors += 1
+            was_open = self.breaker.state == OPEN
+            self.breaker.record_failure()
+            if self.breaker.state == OPEN and not was_open:
+                logger.error(
+                    f"Redis недоступен ({op} {key}: {e}), кэш работает без него "
+                    f"{self.breaker.reset_timeout:.0f} с"
+                )
+            else:
+                logger.debug(f"Failed to {op} cache for {key}: {e}")
+            return False, None
+        self.breaker.record_success()
+        return True, result
+
+    # --- строковый API ---
+
+    async def get(self, key: str) -> Optional[str]:
+        value = self._local_get(key)
+        if value is not None:
+            self._count(key, "local_hits")
+            return value
+        ok, value = await self._redis("get", key, lambda: self.client.get(key))
+        if ok and value is not None:
+            self._count(key, "redis_hits")
+            # Остаток TTL в Redis неизвестен — локальная копия живёт недолго
+            self._local_set(key, value, self.local_ttl)
+            return value
+        self._count(key, "misses")
         return None
 
+    async def set(self, key: str, value: str, ttl: int = 60) -> None:
+        self._local_set(key, value, ttl)
+        await self._redis("set", key, lambda: self.client.set(key, value, ex=ttl))
+
+    async def set_nx(self, key: str, value: str = "1", ttl: int = 60) -> Optional[bool]:
+        ok, created = await self._redis("set (nx)", key, lambda: self.client.set(key, value, ex=ttl, nx=True))
+        return bool(created) if ok else None
+
+    async def delete(self, key: str) -> None:
+        self._local.pop(key, None)
+        await self._redis("delete", key, lambda: self.client.delete(key))
+
+    # --- значения с проверкой свежести ---
+
+    async def get_or_fetch(
+        self,
+        key: str,
+        fetch: Callable[[], Awaitable[Any]],
+        ttl: int,
+        stale_ttl: Optional[int] = None,
+        negative_ttl: Optional[int] = None,
+    ) -> Optional[Any]:
+        """Значение из кэша или от ``fetch``.
+
+        ``fetch`` возвращает JSON-совместимое значение, ``None`` при ошибке
+        (не кэшируется) или ``NOT_FOUND`` (кэшируется на ``negative_ttl``).
+        Устаревшее значение отдаётся сразу, пока не прошло ``stale_ttl``
+        секунд, и обновляется в фоне. Одновременные промахи по ключу
+        объединяются в один вызов ``fetch``.
+        """
+        stale_ttl = self.stale_ttl if stale_ttl is None else stale_ttl
+        negative_ttl = self.negative_ttl if negative_ttl is None else negative_ttl
+        raw = await self.get(key)
+        if raw is not None:
+            try:
+                data = json.loads(raw)
+            except ValueError:
+                data = None
+            else:
+                if isinstance(data, dict) and data.get(_NEGATIVE):
+                    self._count(key, "negative_hits")
+                    return None
+                if isinstance(data, dict) and _FRESH in data:
+                    if data[_FRESH] <= self._clock():
+                        self._count(key, "stale")
+                        self._refresh(key, fetch, ttl, stale_ttl, negative_ttl)
+                    return data.get(_VALUE)
+                # Значение, записанное до появления срока свежести
+                return data
+        return await singleflight.do(key, lambda: self._load(key, fetch, ttl, stale_ttl, negative_ttl))
+
+    async def _load(self, key, fetch, ttl, stale_ttl, negative_ttl) -> Optional[Any]:
+        value = await fetch()
+        if value is NOT_FOUND:
+            await self.set(key, json.dumps({_NEGATIVE: 1}), ttl=negative_ttl)
+            return None
+        if value is None:
+            return None
+        envelope = {_FRESH: self._clock() + ttl, _VALUE: value}
+        await self.set(key, json.dumps(envelope), ttl=ttl + stale_ttl)
+        return value
+
+    def _refresh(self, key, fetch, ttl, stale_ttl, negative_ttl) -> None:
+        if key in self._refreshes:
+            return
+        self._count(key, "refreshes")
+        task = asyncio.create_task(singleflight.do(key, lambda: self._load(key, fetch, ttl, stale_ttl, negative_ttl)))
+        self._refreshes[key] = task
+        task.add_done_callback(lambda done, key=key: self._refresh_done(key, done))
+
+    def _refresh_done(self, key: str, task: asyncio.Task) -> None:
+        self._refreshes.pop(key, None)
+        if not task.cancelled() and task.exception() is not None:
+            logger.warning(f"Фоновое обновление {key} не удалось: {task.exception()}")
+
+    def clear_local(self) -> None:
+        self._local.clear()
+
+    def stats(self) -> dict:
+        prefixes = {}
+        for prefix, counts in self._stats.items():
+            lookups = counts["local_hits"] + counts["redis_hits"] + counts["misses"]
+            hits = counts["local_hits"] + counts["redis_hits"]
+            prefixes[prefix] = {**counts, "hit_rate": round(hits / lookups, 3) if lookups else 0.0}
+        return {
+            "redis": self.client is not None,
+            "breaker": self.breaker.stats(),
+            "redis_errors": self.redis_errors,
+            "redis_bypassed": self.redis_bypassed,
+            "local_size": len(self._local),
+            "refreshing": len(self._refreshes),
+            "prefixes": prefixes,
+        }
+
+
+cache = LayeredCache(redis_client)
+
+
+async def get_cache(key: str) -> Optional[str]:
+    return await cache.get(key)
+
 async def set_cache(key: str, value: str, ttl: int = 60) -> None:
-    if not redis_client:
-        return
-    try:
-        await redis_client.set(key, value, ex=ttl)
-    except Exception as e:
-        logger.error(f"Failed to set cache for {key}: {e}")
+    await cache.set(key, value, ttl=ttl)
+
+async def set_cache_nx(key: str, value: str = "1", ttl: int = 60) -> Optional[bool]:
+    """Atomically set ``key`` only if it does not exist.
+
+    Returns ``True`` when the key was created, ``False`` when it already
+    existed and ``None`` when Redis is unavailable.
+    """
+    return await cache.set_nx(key, value, ttl=ttl)
+
+async def delete_cache(key: str) -> None:
+    await cache.delete(key)
+
+async def get_or_fetch(
+    key: str,
+    fetch: Callable[[], Awaitable[Any]],
+    ttl: int,
+    stale_ttl: Optional[int] = None,
+    negative_ttl: Optional[int] = None,
+) -> Optional[Any]:
+    return await cache.get_or_fetch(key, fetch, ttl, stale_ttl=stale_ttl, negative_ttl=negative_ttl)
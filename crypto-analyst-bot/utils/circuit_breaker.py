@@ -0,0 +1,68 @@
+# utils/circuit_breaker.py
+# Автоматический выключатель для внешних сервисов.
+#
+# После ``failure_threshold`` ошибок подряд выключатель размыкается, и
+# обращения к сервису не выполняются ``reset_timeout`` секунд. Затем
+# пропускается один пробный вызов (half-open): успех замыкает цепь, ошибка
+# снова размыкает её на тот же срок.
+
+import time
+from typing import Callable
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class CircuitBreaker:
+    """Consecutive-failure breaker with a single half-open probe."""
+
+    def __init__(
+        self,
+        failure_threshold: int = 5,
+        reset_timeout: float = 30.0,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        self.failure_threshold = max(1, failure_threshold)
+        self.reset_timeout = reset_timeout
+        self._clock = clock
+        self.state = CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self.trips = 0
+        self._probe_in_flight = False
+
+    def allow(self) -> bool:
+        """Можно ли сейчас обращаться к сервису."""
+        if self.state == CLOSED:
+            return True
+        if self.state == OPEN:
+            if self._clock() - self.opened_at < self.reset_timeout:
+                return False
+            self.state = HALF_OPEN
+            self._probe_in_flight = False
+        if self._probe_in_flight:
+            return False
+        self._probe_in_flight = True
+        return True
+
+    def record_success(self) -> None:
+        self.state = CLOSED
+        self.failures = 0
+        self._probe_in_flight = False
+
+    def record_failure(self) -> None:
+        self.failures += 1
+        self._probe_in_flight = False
+        if self.state == HALF_OPEN or self.failures >= self.failure_threshold:
+            if self.state != OPEN:
+                self.trips += 1
+            self.state = OPEN
+            self.opened_at = self._clock()
+
+    def release(self) -> None:
+        """Вызов отменён, не дойдя до результата: пробу можно повторить."""
+        self._probe_in_flight = False
+
+    def stats(self) -> dict:
+        return {"state": self.state, "failures": self.failures, "trips": self.trips}
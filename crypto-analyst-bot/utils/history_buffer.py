@@ -0,0 +1,203 @@
+# utils/history_buffer.py
+# Последние реплики диалога каждого пользователя в памяти процесса.
+#
+# Общий диалог, поиск символа в контексте и новости читали последние
+# сообщения из chat_history запросом с сортировкой по времени на каждое
+# сообщение. Теперь у пользователя кольцевой буфер из HISTORY_BUFFER_TURNS
+# реплик, а число пользователей ограничено LRU (HISTORY_BUFFER_USERS).
+# add_chat_message дописывает реплику в уже загруженный буфер; при промахе
+# буфер загружается из БД один раз.
+#
+# При нескольких воркерах uvicorn сообщения пользователя попадают в разные
+# процессы, и буфер одного воркера не видит реплик, обработанных другим.
+# Поэтому add_chat_message публикует в Redis время последней реплики
+# пользователя (ключ histv:<user_id>), а чтение сравнивает его с самой новой
+# репликой в буфере: если в Redis время новее, буфер перечитывается из БД.
+# Это один GET в Redis вместо запроса к chat_history. Пока другой воркер ещё
+# не записал свою реплику (отложенная запись chat_log), буфер перечитывается
+# при каждом чтении, пока она не появится в БД. Без Redis буфер перечитывается
+# через HISTORY_BUFFER_TTL секунд, и столько же живёт отметка в Redis.
+
+import os
+import time
+from collections import OrderedDict, deque
+from datetime import datetime
+from typing import Awaitable, Callable, Dict, Iterable, List, Optional, Tuple
+
+from utils.cache import get_cache, set_cache
+from utils.runtime_metrics import register_metrics
+
+HISTORY_BUFFER_TURNS = int(os.getenv("HISTORY_BUFFER_TURNS", "20"))
+HISTORY_BUFFER_USERS = int(os.getenv("HISTORY_BUFFER_USERS", "10000"))
+HISTORY_BUFFER_TTL = float(os.getenv("HISTORY_BUFFER_TTL", "120"))
+
+# Префикс не входит в CACHE_LOCAL_PREFIXES: отметка не должна кэшироваться
+# в памяти процесса
+STAMP_PREFIX = "histv:"
+
+
+class Turn:
+    """One chat message as used for AI context."""
+
+    __slots__ = ("role", "message_text", "timestamp")
+
+    def __init__(self, role: str, message_text: str, timestamp: Optional[datetime]) -> None:
+        self.role = role
+        self.message_text = message_text
+        self.timestamp = timestamp
+
+    def key(self) -> Tuple[str, str, Optional[datetime]]:
+        return self.role, self.message_text, self.timestamp
+
+    def __repr__(self) -> str:
+        return f"Turn({self.role!r}, {self.message_text[:30]!r})"
+
+    def stamp(self) -> float:
+        return self.timestamp.timestamp() if self.timestamp is not None else 0.0
+
+
+class _UserTurns:
+    __slots__ = ("turns", "loaded_at", "newest")
+
+    def __init__(self, turns: deque, loaded_at: float) -> None:
+        self.turns = turns
+        self.loaded_at = loaded_at
+        # Время самой новой реплики в буфере, секунды epoch
+        self.newest = max((turn.stamp() for turn in turns), default=0.0)
+
+
+# Загружает последние N сообщений пользователя, старые первыми
+Loader = Callable[[int, int], Awaitable[Iterable]]
+# Чтение и запись отметки последней реплики пользователя, общей для воркеров
+StampReader = Callable[[int], Awaitable[Optional[float]]]
+StampWriter = Callable[[int, float, float], Awaitable[None]]
+
+
+async def read_stamp(user_id: int) -> Optional[float]:
+    raw = await get_cache(f"{STAMP_PREFIX}{user_id}")
+    try:
+        return float(raw) if raw is not None else None
+    except ValueError:
+        return None
+
+
+async def write_stamp(user_id: int, stamp: float, ttl: float) -> None:
+    await set_cache(f"{STAMP_PREFIX}{user_id}", repr(stamp), ttl=max(1, int(ttl)))
+
+
+class HistoryBuffer:
+    """Per-user ring buffer of recent chat turns with an LRU cap on users."""
+
+    def __init__(
+        self,
+        turns: int = HISTORY_BUFFER_TURNS,
+        max_users: int = HISTORY_BUFFER_USERS,
+        ttl: float = HISTORY_BUFFER_TTL,
+        clock: Callable[[], float] = time.monotonic,
+        stamp_reader: StampReader = read_stamp,
+        stamp_writer: StampWriter = write_stamp,
+        name: str = "history_buffer",
+    ) -> None:
+        self.turns = max(1, turns)
+        self.max_users = max_users
+        self.ttl = ttl
+        self._clock = clock
+        self._read_stamp = stamp_reader
+        self._write_stamp = stamp_writer
+        self._users: "OrderedDict[int, _UserTurns]" = OrderedDict()
+        # Реплики, добавленные, пока буфер пользователя загружается из БД
+        self._loading: Dict[int, List[Turn]] = {}
+
+        self.hits = 0
+        self.loads = 0
+        self.stale = 0
+        self.bypassed = 0
+        self.appends = 0
+        self.evictions = 0
+        register_metrics(name, self.stats)
+
+    def append(self, user_id: int, role: str, text: str, timestamp: Optional[datetime] = None) -> None:
+        """Дописывает реплику, если буфер пользователя уже загружен."""
+        turn = Turn(role, text, timestamp)
+        loading = self._loading.get(user_id)
+        if loading is not None:
+            loading.append(turn)
+        entry = self._users.get(user_id)
+        if entry is None:
+            # Незагруженный буфер не заполняется частично: при чтении он
+            # загрузится из БД целиком, вместе с этой репликой
+            return
+        entry.turns.append(turn)
+        entry.newest = max(entry.newest, turn.stamp())
+        self.appends += 1
+
+    async def publish(self, user_id: int, timestamp: datetime) -> None:
+        """Сообщает другим воркерам время новой реплики пользователя."""
+        await self._write_stamp(user_id, timestamp.timestamp(), self.ttl)
+
+    async def _fresh(self, user_id: int, entry: _UserTurns) -> bool:
+        if self._clock() - entry.loaded_at >= self.ttl:
+            return False
+        stamp = await self._read_stamp(user_id)
+        if stamp is not None and stamp > entry.newest:
+            # Реплику обработал другой воркер
+            self.stale += 1
+            return False
+        return True
+
+    async def recent(self, user_id: int, limit: int, loader: Loader) -> List[Turn]:
+        """Последние ``limit`` реплик, старые первыми."""
+        if limit > self.turns:
+            self.bypassed += 1
+            return [_as_turn(row) for row in await loader(user_id, limit)]
+        entry = self._users.get(user_id)
+        if entry is not None and await self._fresh(user_id, entry) and self._users.get(user_id) is entry:
+            self._users.move_to_end(user_id)
+            self.hits += 1
+            return list(entry.turns)[-limit:] if limit > 0 else []
+
+        self.loads += 1
+        self._loading.setdefault(user_id, [])
+        try:
+            rows = await loader(user_id, self.turns)
+        finally:
+            arrived = self._loading.pop(user_id, [])
+        turns = deque((_as_turn(row) for row in rows), maxlen=self.turns)
+        loaded = {turn.key() for turn in turns}
+        turns.extend(turn for turn in arrived if turn.key() not in loaded)
+        self._users[user_id] = _UserTurns(turns, self._clock())
+        self._users.move_to_end(user_id)
+        while len(self._users) > self.max_users:
+            self._users.popitem(last=False)
+            self.evictions += 1
+        return list(turns)[-limit:] if limit > 0 else []
+
+    def invalidate(self, user_id: int) -> None:
+        self._users.pop(user_id, None)
+
+    def clear(self) -> None:
+        self._users.clear()
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.loads
+        return {
+            "users": len(self._users),
+            "max_users": self.max_users,
+            "turns": self.turns,
+            "hits": self.hits,
+            "loads": self.loads,
+            "stale": self.stale,
+            "bypassed": self.bypassed,
+            "appends": self.appends,
+            "evictions": self.evictions,
+            "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+        }
+
+
+def _as_turn(row) -> Turn:
+    if isinstance(row, Turn):
+        return row
+    return Turn(row.role, row.message_text, getattr(row, "timestamp", None))
+
+
+history_buffer = HistoryBuffer()
@@ -0,0 +1,185 @@
+# utils/http_clients.py
+# Долгоживущие HTTP-клиенты для внешних API.
+#
+# Раньше каждый запрос создавал свой httpx.AsyncClient в ``async with`` и
+# закрывал его после ответа: на каждый вызов приходились новые DNS, TCP и TLS
+# рукопожатия. Здесь у каждого внешнего сервиса один клиент на процесс с
+# пулом keep-alive соединений, ограничениями пула и таймаутами. Клиенты
+# открываются при старте FastAPI и закрываются при остановке; если запрос
+# пришёл раньше старта, клиент создаётся при первом обращении. HTTP/2
+# включается, только если установлен пакет h2.
+
+import contextlib
+import logging
+import time
+from typing import AsyncIterator, Dict, Optional
+
+import httpx
+
+from utils.runtime_metrics import register_metrics
+
+logger = logging.getLogger(__name__)
+
+try:
+    import h2  # noqa: F401
+
+    HTTP2_AVAILABLE = True
+except ImportError:
+    HTTP2_AVAILABLE = False
+
+
+class PooledClient:
+    """Long-lived ``httpx.AsyncClient`` for one upstream with request metrics."""
+
+    def __init__(
+        self,
+        name: str,
+        base_url: str = "",
+        timeout: float = 30.0,
+        connect_timeout: float = 5.0,
+        max_connections: int = 20,
+        max_keepalive: int = 10,
+        keepalive_expiry: float = 60.0,
+        http2: bool = False,
+        headers: Optional[Dict[str, str]] = None,
+    ) -> None:
+        self.name = name
+        self.base_url = base_url
+        self.timeout = timeout
+        self.connect_timeout = connect_timeout
+        self.max_connections = max_connections
+        self.max_keepalive = max_keepalive
+        self.keepalive_expiry = keepalive_expiry
+        if http2 and not HTTP2_AVAILABLE:
+            logger.warning(f"{name}: HTTP/2 недоступен без пакета h2, используется HTTP/1.1")
+        self.http2 = http2 and HTTP2_AVAILABLE
+        self.headers = headers or {}
+        self._client: Optional["httpx.AsyncClient"] = None
+
+        self.opened = 0
+        self.requests = 0
+        self.errors = 0
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.total_ms = 0.0
+
+    @property
+    def client(self) -> "httpx.AsyncClient":
+        if self._client is None or self._client.is_closed:
+            self._client = httpx.AsyncClient(
+                base_url=self.base_url,
+                headers=self.headers,
+                http2=self.http2,
+                timeout=httpx.Timeout(self.timeout, connect=self.connect_timeout),
+                limits=httpx.Limits(
+                    max_connections=self.max_connections,
+                    max_keepalive_connections=self.max_keepalive,
+                    keepalive_expiry=self.keepalive_expiry,
+                ),
+            )
+            self.opened += 1
+        return self._client
+
+    async def request(self, method: str, url: str, **kwargs) -> "httpx.Response":
+        """Запрос через общий пул; ``timeout`` можно передать на один вызов."""
+        client = self.client
+        self.requests += 1
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        started = time.perf_counter()
+        try:
+            return await client.request(method, url, **kwargs)
+        except Exception:
+            self.errors += 1
+            raise
+        finally:
+            self.in_flight -= 1
+            self.total_ms += (time.perf_counter() - started) * 1000
+
+    @contextlib.asynccontextmanager
+    async def stream(self, method: str, url: str, **kwargs) -> AsyncIterator["httpx.Response"]:
+        """Потоковый запрос: тело читается внутри ``async with``."""
+        client = self.client
+        self.requests += 1
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        started = time.perf_counter()
+        try:
+            async with client.stream(method, url, **kwargs) as response:
+                yield response
+        except Exception:
+            self.errors += 1
+            raise
+        finally:
+            self.in_flight -= 1
+            self.total_ms += (time.perf_counter() - started) * 1000
+
+    async def get(self, url: str, **kwargs) -> "httpx.Response":
+        return await self.request("GET", url, **kwargs)
+
+    async def post(self, url: str, **kwargs) -> "httpx.Response":
+        return await self.request("POST", url, **kwargs)
+
+    async def aclose(self) -> None:
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    def _connections(self) -> Optional[Dict[str, int]]:
+        """Соединения в пуле httpcore; ``None``, если пул недоступен."""
+        pool = getattr(getattr(self._client, "_transport", None), "_pool", None)
+        connections = getattr(pool, "connections", None)
+        if connections is None:
+            return None
+        idle = sum(1 for conn in connections if conn.is_idle())
+        return {"open": len(connections), "idle": idle, "active": len(connections) - idle}
+
+    def stats(self) -> dict:
+        return {
+            "open": self._client is not None and not self._client.is_closed,
+            "http2": self.http2,
+            "opened": self.opened,
+            "requests": self.requests,
+            "errors": self.errors,
+            "in_flight": self.in_flight,
+            "max_in_flight": self.max_in_flight,
+            "avg_ms": round(self.total_ms / self.requests, 1) if self.requests else 0.0,
+            "max_connections": self.max_connections,
+            "connections": self._connections() if self._client is not None else None,
+        }
+
+
+class HttpClientRegistry:
+    """Named pooled clients opened on startup and closed on shutdown."""
+
+    def __init__(self, name: str = "http_pools") -> None:
+        self._clients: Dict[str, PooledClient] = {}
+        register_metrics(name, self.stats)
+
+    def register(self, name: str, **config) -> PooledClient:
+        """Регистрирует клиент; повторная регистрация возвращает существующий."""
+        client = self._clients.get(name)
+        if client is None:
+            client = self._clients[name] = PooledClient(name, **config)
+        return client
+
+    def get(self, name: str) -> PooledClient:
+        return self._clients[name]
+
+    async def start(self) -> None:
+        for client in self._clients.values():
+            client.client
+        logger.info(f"HTTP-клиенты открыты: {', '.join(self._clients) or '-'}")
+
+    async def stop(self) -> None:
+        for name, client in self._clients.items():
+            try:
+                await client.aclose()
+            except Exception as e:
+                logger.warning(f"Не удалось закрыть HTTP-клиент {name}: {e}")
+
+    def stats(self) -> dict:
+        return {name: client.stats() for name, client in self._clients.items()}
+
+
+http_clients = HttpClientRegistry()
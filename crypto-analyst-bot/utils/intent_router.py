@@ -1,15 +1,43 @@
 from __future__ import annotations
 
-from typing import Callable, Awaitable, Dict, Optional, Any
+from typing import Callable, Awaitable, Dict, Optional, Any, Tuple
 import asyncio
 
 Handler = Callable[[Any, Any, str, Any], Awaitable[Any]]
 
+# Ключ узла префиксного дерева, под которым хранится маршрут команды
+_END = ""
+
+
+class Route:
+    """Handler resolved without the LLM, with a fixed payload for phrases."""
+
+    __slots__ = ("handler", "payload", "name", "intent")
+
+    def __init__(self, handler: Handler, payload: str = "", name: str = "", intent: Optional[str] = None) -> None:
+        self.handler = handler
+        self.payload = payload
+        self.name = name
+        self.intent = intent
+
+
+def normalize_phrase(text: str) -> str:
+    """Приводит фразу к виду ключа: регистр и пробелы не важны."""
+    return " ".join(text.casefold().split())
+
+
 class IntentRouter:
-    """Simple mapping from intent names to async handlers."""
+    """Simple mapping from intent names to async handlers.
+
+    Besides intents it keeps a precompiled fast path: slash commands in a
+    prefix trie (the longest registered command wins, the rest of the text is
+    the payload) and exact phrases such as menu button labels in a hash map.
+    """
 
     def __init__(self) -> None:
         self._handlers: Dict[str, Handler] = {}
+        self._commands: Dict[str, Any] = {}
+        self._phrases: Dict[str, Route] = {}
 
     def register(self, intent: str, handler: Handler) -> None:
         self._handlers[intent.upper()] = handler
@@ -17,6 +45,47 @@ class IntentRouter:
     def get(self, intent: str) -> Optional[Handler]:
         return self._handlers.get(intent.upper())
 
+    def register_command(self, command: str, handler: Handler) -> None:
+        node = self._commands
+        for ch in command.lower():
+            node = node.setdefault(ch, {})
+        node[_END] = Route(handler, name=command)
+
+    def register_phrase(self, phrase: str, handler: Handler, payload: str = "", intent: Optional[str] = None) -> None:
+        key = normalize_phrase(phrase)
+        if key:
+            self._phrases[key] = Route(handler, payload, name=phrase, intent=intent)
+
+    def match_command(self, text: str) -> Optional[Tuple[Route, str]]:
+        """Самая длинная зарегистрированная команда в начале текста."""
+        node = self._commands
+        found: Optional[Route] = None
+        length = 0
+        for i, ch in enumerate(text):
+            node = node.get(ch.lower())
+            if node is None:
+                break
+            route = node.get(_END)
+            if route is not None:
+                found, length = route, i + 1
+        if found is None:
+            return None
+        rest = text[length:]
+        if rest.startswith("@"):
+            # /command@BotName в группах
+            parts = rest.split(None, 1)
+            rest = parts[1] if len(parts) > 1 else ""
+        return found, rest.strip()
+
+    def match(self, text: str) -> Optional[Tuple[Route, str]]:
+        """Маршрут для текста без обращения к LLM или ``None``."""
+        if text.startswith("/"):
+            return self.match_command(text)
+        route = self._phrases.get(normalize_phrase(text))
+        if route is None:
+            return None
+        return route, route.payload
+
     async def dispatch(self, intent: str, update, context, payload: str, db_session):
         handler = self.get(intent)
         if not handler:
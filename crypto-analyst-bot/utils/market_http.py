@@ -0,0 +1,66 @@
+# utils/market_http.py
+# Общие HTTP-клиенты для источников рыночных данных.
+#
+# Клиенты CoinGecko, CoinMarketCap и Binance, новости, события pre-market,
+# DeFi, NFT и DePIN раньше открывали новый httpx.AsyncClient на каждый
+# запрос, и при промахе кэша большую часть задержки занимали TCP- и
+# TLS-рукопожатия. Теперь на каждый хост приходится один долгоживущий клиент
+# из utils/http_clients.py с keep-alive пулом. Таймаут ответа задаётся для
+# хоста (HOST_TIMEOUTS), лимиты пула и таймаут подключения — переменными
+# окружения. Известные хосты регистрируются при импорте и открываются вместе
+# с остальными клиентами при старте FastAPI.
+
+import os
+from typing import Dict
+from urllib.parse import urlsplit
+
+import httpx
+
+from utils.http_clients import PooledClient, http_clients
+
+MARKET_HTTP_MAX_CONNECTIONS = int(os.getenv("MARKET_HTTP_MAX_CONNECTIONS", "20"))
+MARKET_HTTP_MAX_KEEPALIVE = int(os.getenv("MARKET_HTTP_MAX_KEEPALIVE", "10"))
+MARKET_HTTP_KEEPALIVE_EXPIRY = float(os.getenv("MARKET_HTTP_KEEPALIVE_EXPIRY", "60"))
+MARKET_HTTP_CONNECT_TIMEOUT = float(os.getenv("MARKET_HTTP_CONNECT_TIMEOUT", "5"))
+
+DEFAULT_TIMEOUT = 15.0
+
+# Таймаут ответа по хосту, секунды
+HOST_TIMEOUTS: Dict[str, float] = {
+    "api.coingecko.com": 15.0,
+    "pro-api.coinmarketcap.com": 15.0,
+    "api.binance.com": 10.0,
+    "developers.coinmarketcal.com": 15.0,
+    "icodrops.com": 15.0,
+    "api.cryptorank.io": 15.0,
+    "cryptopanic.com": 15.0,
+    "www.coindesk.com": 15.0,
+    "yields.llama.fi": 15.0,
+    "api.opensea.io": 15.0,
+}
+
+
+def host_of(url: str) -> str:
+    return urlsplit(url).netloc.lower()
+
+
+def client_for(url: str) -> PooledClient:
+    """Общий клиент хоста из ``url``; новый хост регистрируется при первом запросе."""
+    host = host_of(url)
+    return http_clients.register(
+        f"market:{host}",
+        timeout=HOST_TIMEOUTS.get(host, DEFAULT_TIMEOUT),
+        connect_timeout=MARKET_HTTP_CONNECT_TIMEOUT,
+        max_connections=MARKET_HTTP_MAX_CONNECTIONS,
+        max_keepalive=MARKET_HTTP_MAX_KEEPALIVE,
+        keepalive_expiry=MARKET_HTTP_KEEPALIVE_EXPIRY,
+    )
+
+
+async def get(url: str, **kwargs) -> "httpx.Response":
+    """GET через общий клиент хоста; статус не проверяется."""
+    return await client_for(url).get(url, **kwargs)
+
+
+for _host in HOST_TIMEOUTS:
+    client_for(f"https://{_host}/")
@@ -6,10 +6,11 @@ import asyncio
 from datetime import datetime
 from email.utils import parsedate_to_datetime
 
-import httpx
 from bs4 import BeautifulSoup
 
+from . import market_http
 from .cache import get_cache, set_cache
+from .singleflight import singleflight
 
 logger = logging.getLogger(__name__)
 
@@ -30,24 +31,27 @@ async def _fetch_cryptopanic(symbol: str, limit: int = 5) -> List[Dict]:
     if cached:
         return json.loads(cached)
     url = "https://cryptopanic.com/api/developer/v2/posts/"
-    try:
-        async with httpx.AsyncClient(timeout=15.0) as client:
-            resp = await client.get(url, params=params, follow_redirects=True)
+
+    async def fetch() -> List[Dict]:
+        try:
+            resp = await market_http.get(url, params=params, follow_redirects=True)
             resp.raise_for_status()
             data = resp.json()
-    except Exception as e:
-        logger.error(f"CryptoPanic API error: {e}")
-        return []
-    results = []
-    for item in data.get("results", [])[:limit]:
-        results.append({
-            "title": item.get("title"),
-            "url": item.get("url"),
-            "source": item.get("source", {}).get("title"),
-            "published_at": item.get("published_at"),
-        })
-    await set_cache(cache_key, json.dumps(results), ttl=300)
-    return results
+        except Exception as e:
+            logger.error(f"CryptoPanic API error: {e}")
+            return []
+        results = []
+        for item in data.get("results", [])[:limit]:
+            results.append({
+                "title": item.get("title"),
+                "url": item.get("url"),
+                "source": item.get("source", {}).get("title"),
+                "published_at": item.get("published_at"),
+            })
+        await set_cache(cache_key, json.dumps(results), ttl=300)
+        return results
+
+    return await singleflight.do(cache_key, fetch)
 
 
 async def _fetch_coindesk(symbol: str, limit: int = 5) -> List[Dict]:
@@ -56,39 +60,42 @@ async def _fetch_coindesk(symbol: str, limit: int = 5) -> List[Dict]:
     cached = await get_cache(cache_key)
     if cached:
         return json.loads(cached)
-    try:
-        async with httpx.AsyncClient(timeout=15.0) as client:
-            resp = await client.get(url, follow_redirects=True)
+
+    async def fetch() -> List[Dict]:
+        try:
+            resp = await market_http.get(url, follow_redirects=True)
             resp.raise_for_status()
             text = resp.text
-    except Exception as e:
-        logger.error(f"CoinDesk RSS error: {e}")
-        return []
-    soup = BeautifulSoup(text, "xml")
-    items = soup.find_all("item")
-    results = []
-    for itm in items:
-        title = itm.title.text if itm.title else ""
-        if symbol.lower() not in title.lower():
-            continue
-        link = itm.link.text if itm.link else ""
-        pub_date = itm.pubDate.text if itm.pubDate else ""
-        dt = None
-        if pub_date:
-            try:
-                dt = parsedate_to_datetime(pub_date)
-            except Exception:
-                dt = None
-        results.append({
-            "title": title,
-            "url": link,
-            "source": "CoinDesk",
-            "published_at": dt.isoformat() if dt else None,
-        })
-        if len(results) >= limit:
-            break
-    await set_cache(cache_key, json.dumps(results), ttl=300)
-    return results
+        except Exception as e:
+            logger.error(f"CoinDesk RSS error: {e}")
+            return []
+        soup = BeautifulSoup(text, "xml")
+        items = soup.find_all("item")
+        results = []
+        for itm in items:
+            title = itm.title.text if itm.title else ""
+            if symbol.lower() not in title.lower():
+                continue
+            link = itm.link.text if itm.link else ""
+            pub_date = itm.pubDate.text if itm.pubDate else ""
+            dt = None
+            if pub_date:
+                try:
+                    dt = parsedate_to_datetime(pub_date)
+                except Exception:
+                    dt = None
+            results.append({
+                "title": title,
+                "url": link,
+                "source": "CoinDesk",
+                "published_at": dt.isoformat() if dt else None,
+            })
+            if len(results) >= limit:
+                break
+        await set_cache(cache_key, json.dumps(results), ttl=300)
+        return results
+
+    return await singleflight.do(cache_key, fetch)
 
 
 async def get_news(symbol: str, limit: int = 5) -> List[Dict]:
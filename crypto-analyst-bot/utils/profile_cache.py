@@ -0,0 +1,254 @@
+# utils/profile_cache.py
+# Кэш профиля пользователя: язык, рекомендации, баланс звёзд и подписка.
+#
+# Два уровня: LRU в памяти процесса и Redis, общий для всех воркеров.
+# Изменения профиля (update_user_settings, create_or_update_subscription,
+# add_stars, deduct_stars) вызывают ``invalidate``: запись удаляется из обоих
+# уровней, а остальные воркеры получают id пользователя через Redis pub/sub
+# и вычищают свою локальную копию. TTL ограничивает устаревание на случай
+# потерянного сообщения или гонки чтения с инвалидацией в другом процессе.
+
+import asyncio
+import json
+import logging
+import os
+import time
+import uuid
+from collections import OrderedDict
+from datetime import datetime
+from typing import Optional
+
+from utils.cache import delete_cache, get_cache, redis_client, set_cache
+from utils.runtime_metrics import register_metrics
+
+logger = logging.getLogger(__name__)
+
+PROFILE_CACHE_SIZE = int(os.getenv("PROFILE_CACHE_SIZE", "10000"))
+PROFILE_CACHE_LOCAL_TTL = float(os.getenv("PROFILE_CACHE_LOCAL_TTL", "300"))
+PROFILE_CACHE_TTL = int(os.getenv("PROFILE_CACHE_TTL", "3600"))
+PROFILE_CACHE_CHANNEL = os.getenv("PROFILE_CACHE_CHANNEL", "profile:invalidate")
+
+KEY_PREFIX = "profile:"
+
+
+class UserProfile:
+    """Immutable snapshot of the profile fields handlers read on every call."""
+
+    __slots__ = (
+        "user_id",
+        "language",
+        "show_recommendations",
+        "stars_balance",
+        "subscription_active",
+        "subscription_level",
+        "next_payment",
+    )
+
+    def __init__(
+        self,
+        user_id: int,
+        language: str = "ru",
+        show_recommendations: bool = True,
+        stars_balance: int = 0,
+        subscription_active: bool = False,
+        subscription_level: Optional[str] = None,
+        next_payment: Optional[datetime] = None,
+    ) -> None:
+        self.user_id = user_id
+        self.language = language
+        self.show_recommendations = show_recommendations
+        self.stars_balance = stars_balance
+        self.subscription_active = subscription_active
+        self.subscription_level = subscription_level
+        self.next_payment = next_payment
+
+    @classmethod
+    def from_models(cls, user, subscription=None) -> "UserProfile":
+        return cls(
+            user_id=user.id,
+            language=user.language or "ru",
+            show_recommendations=bool(getattr(user, "show_recommendations", True)),
+            stars_balance=user.stars_balance or 0,
+            subscription_active=bool(subscription and subscription.is_active),
+            subscription_level=subscription.level if subscription else None,
+            next_payment=subscription.next_payment if subscription else None,
+        )
+
+    @property
+    def is_premium(self) -> bool:
+        return self.subscription_active and self.subscription_level == "premium"
+
+    def to_json(self) -> str:
+        data = {name: getattr(self, name) for name in self.__slots__}
+        if self.next_payment is not None:
+            data["next_payment"] = self.next_payment.isoformat()
+        return json.dumps(data)
+
+    @classmethod
+    def from_json(cls, raw: str) -> "UserProfile":
+        data = json.loads(raw)
+        if data.get("next_payment"):
+            data["next_payment"] = datetime.fromisoformat(data["next_payment"])
+        return cls(**data)
+
+
+class ProfileCache:
+    """Process-local LRU in front of Redis with pub/sub invalidation."""
+
+    def __init__(
+        self,
+        max_size: int = PROFILE_CACHE_SIZE,
+        local_ttl: float = PROFILE_CACHE_LOCAL_TTL,
+        ttl: int = PROFILE_CACHE_TTL,
+        channel: str = PROFILE_CACHE_CHANNEL,
+        client=None,
+        name: str = "profile_cache",
+    ) -> None:
+        self.max_size = max_size
+        self.local_ttl = local_ttl
+        self.ttl = ttl
+        self.channel = channel
+        self._client = client
+        self._local: "OrderedDict[int, tuple]" = OrderedDict()
+        # Поколение на пользователя: чтение из БД, начатое до инвалидации,
+        # не должно положить в кэш устаревший снимок
+        self._generations: dict = {}
+        self._origin = uuid.uuid4().hex
+        self._listener: Optional[asyncio.Task] = None
+
+        self.local_hits = 0
+        self.redis_hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        self.remote_invalidations = 0
+
+        register_metrics(name, self.stats)
+
+    @property
+    def client(self):
+        return self._client if self._client is not None else redis_client
+
+    def generation(self, user_id: int) -> int:
+        return self._generations.get(user_id, 0)
+
+    def _get_local(self, user_id: int) -> Optional[UserProfile]:
+        entry = self._local.get(user_id)
+        if entry is None:
+            return None
+        profile, expires_at = entry
+        if expires_at < time.monotonic():
+            del self._local[user_id]
+            return None
+        self._local.move_to_end(user_id)
+        return profile
+
+    def _put_local(self, profile: UserProfile) -> None:
+        self._local[profile.user_id] = (profile, time.monotonic() + self.local_ttl)
+        self._local.move_to_end(profile.user_id)
+        while len(self._local) > self.max_size:
+            self._local.popitem(last=False)
+
+    def _evict_local(self, user_id: int) -> None:
+        self._local.pop(user_id, None)
+        self._generations[user_id] = self._generations.get(user_id, 0) + 1
+
+    async def get(self, user_id: int) -> Optional[UserProfile]:
+        profile = self._get_local(user_id)
+        if profile is not None:
+            self.local_hits += 1
+            return profile
+        raw = await get_cache(f"{KEY_PREFIX}{user_id}")
+        if raw:
+            try:
+                profile = UserProfile.from_json(raw)
+            except Exception as e:
+                logger.warning(f"Повреждённый профиль в кэше для {user_id}: {e}")
+            else:
+                self.redis_hits += 1
+                self._put_local(profile)
+                return profile
+        self.misses += 1
+        return None
+
+    async def set(self, profile: UserProfile, generation: Optional[int] = None) -> None:
+        """Кладёт снимок в оба уровня, если с момента чтения не было инвалидации."""
+        if generation is not None and generation != self.generation(profile.user_id):
+            return
+        self._put_local(profile)
+        await set_cache(f"{KEY_PREFIX}{profile.user_id}", profile.to_json(), ttl=self.ttl)
+
+    def prime(self, profile: UserProfile) -> None:
+        """Обновляет только локальный уровень (снимок только что прочитан из БД)."""
+        self._put_local(profile)
+
+    async def invalidate(self, user_id: int) -> None:
+        self.invalidations += 1
+        self._evict_local(user_id)
+        await delete_cache(f"{KEY_PREFIX}{user_id}")
+        client = self.client
+        if client is None:
+            return
+        try:
+            await client.publish(self.channel, f"{self._origin}:{user_id}")
+        except Exception as e:
+            logger.error(f"Не удалось разослать инвалидацию профиля {user_id}: {e}")
+
+    def _on_message(self, data: str) -> None:
+        origin, _, user_id = str(data).rpartition(":")
+        if origin == self._origin:
+            return
+        try:
+            self._evict_local(int(user_id))
+        except ValueError:
+            return
+        self.remote_invalidations += 1
+
+    async def start(self) -> None:
+        """Запускает подписку на инвалидации от других воркеров."""
+        if self._listener is not None or self.client is None:
+            return
+        self._listener = asyncio.create_task(self._listen(), name="profile-cache-listener")
+
+    async def stop(self) -> None:
+        if self._listener is not None:
+            self._listener.cancel()
+            await asyncio.gather(self._listener, return_exceptions=True)
+            self._listener = None
+
+    async def _listen(self) -> None:
+        backoff = 1.0
+        while True:
+            pubsub = self.client.pubsub()
+            try:
+                await pubsub.subscribe(self.channel)
+                # Пока подписки не было, сообщения могли потеряться
+                self._local.clear()
+                backoff = 1.0
+                async for message in pubsub.listen():
+                    if message.get("type") == "message":
+                        self._on_message(message.get("data"))
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Подписка на инвалидации профилей прервана: {e!r}; повтор через {backoff:.0f} с")
+                await asyncio.sleep(backoff)
+                backoff = min(backoff * 2, 30.0)
+            finally:
+                try:
+                    await pubsub.close()
+                except Exception:
+                    pass
+
+    def stats(self) -> dict:
+        return {
+            "local_size": len(self._local),
+            "local_hits": self.local_hits,
+            "redis_hits": self.redis_hits,
+            "misses": self.misses,
+            "invalidations": self.invalidations,
+            "remote_invalidations": self.remote_invalidations,
+            "listening": self._listener is not None and not self._listener.done(),
+        }
+
+
+profile_cache = ProfileCache()
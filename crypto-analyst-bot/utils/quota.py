@@ -0,0 +1,118 @@
+# utils/quota.py
+# Счётчик сообщений пользователя за текущие сутки UTC в Redis.
+#
+# Ключ quota:<user_id>:<YYYYMMDD> истекает в полночь UTC. Проверка
+# бесплатного лимита — один GET; запись сообщения — атомарный INCR, который
+# выполняется только для уже существующего ключа. Если ключа нет (новые
+# сутки, перезапуск или потеря данных Redis), счётчик один раз
+# восстанавливается из chat_history через переданный ``loader``. Без Redis
+# каждый запрос считается по БД, как раньше.
+
+import logging
+import os
+from datetime import datetime, timedelta, timezone
+from typing import Awaitable, Callable, Optional
+
+from utils.cache import redis_client
+from utils.runtime_metrics import register_metrics
+
+logger = logging.getLogger(__name__)
+
+QUOTA_KEY_PREFIX = os.getenv("QUOTA_KEY_PREFIX", "quota:")
+
+Loader = Callable[[], Awaitable[int]]
+
+
+def _day_bounds(now: Optional[datetime] = None):
+    now = now or datetime.now(timezone.utc)
+    start = now.replace(hour=0, minute=0, second=0, microsecond=0)
+    return start, start + timedelta(days=1)
+
+
+class DailyQuota:
+    """Per-user, per-UTC-day message counter with DB rebuild on a miss."""
+
+    # INCR только для существующего ключа: иначе счётчик начался бы с 1
+    # вместо числа уже отправленных сегодня сообщений
+    INCR_SCRIPT = """
+if redis.call('exists', KEYS[1]) == 1 then
+    return redis.call('incr', KEYS[1])
+end
+return nil
+"""
+
+    def __init__(self, prefix: str = QUOTA_KEY_PREFIX, client=None, name: str = "daily_quota") -> None:
+        self.prefix = prefix
+        self._client = client
+
+        self.hits = 0
+        self.rebuilds = 0
+        self.fallbacks = 0
+        self.errors = 0
+
+        register_metrics(name, self.stats)
+
+    @property
+    def client(self):
+        return self._client if self._client is not None else redis_client
+
+    def key(self, user_id: int, now: Optional[datetime] = None) -> str:
+        start, _ = _day_bounds(now)
+        return f"{self.prefix}{user_id}:{start:%Y%m%d}"
+
+    async def count(self, user_id: int, loader: Loader) -> int:
+        """Число сообщений пользователя за сегодня."""
+        client = self.client
+        if client is None:
+            self.fallbacks += 1
+            return await loader()
+        now = datetime.now(timezone.utc)
+        key = self.key(user_id, now)
+        try:
+            value = await client.get(key)
+        except Exception as e:
+            self.errors += 1
+            logger.error(f"Не удалось прочитать квоту {key}: {e}")
+            return await loader()
+        if value is not None:
+            self.hits += 1
+            return int(value)
+
+        count = await loader()
+        self.rebuilds += 1
+        _, midnight = _day_bounds(now)
+        try:
+            # NX: если параллельно ключ уже создал другой воркер, не затираем его
+            if not await client.set(key, count, exat=int(midnight.timestamp()), nx=True):
+                value = await client.get(key)
+                if value is not None:
+                    count = int(value)
+        except Exception as e:
+            self.errors += 1
+            logger.error(f"Не удалось восстановить квоту {key}: {e}")
+        return count
+
+    async def incr(self, user_id: int) -> Optional[int]:
+        """Учитывает новое сообщение; ``None``, если счётчика в Redis нет."""
+        client = self.client
+        if client is None:
+            return None
+        key = self.key(user_id)
+        try:
+            value = await client.eval(self.INCR_SCRIPT, 1, key)
+        except Exception as e:
+            self.errors += 1
+            logger.error(f"Не удалось увеличить квоту {key}: {e}")
+            return None
+        return int(value) if value is not None else None
+
+    def stats(self) -> dict:
+        return {
+            "hits": self.hits,
+            "rebuilds": self.rebuilds,
+            "fallbacks": self.fallbacks,
+            "errors": self.errors,
+        }
+
+
+daily_quota = DailyQuota()
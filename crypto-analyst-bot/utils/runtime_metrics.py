@@ -0,0 +1,28 @@
+# utils/runtime_metrics.py
+# Реестр runtime-метрик процесса (очереди, кэши, пулы соединений).
+# Компоненты регистрируют функцию, возвращающую dict со своими счётчиками,
+# а эндпоинт /metrics/runtime собирает их без обращения к БД.
+
+import logging
+from typing import Callable, Dict
+
+logger = logging.getLogger(__name__)
+
+_providers: Dict[str, Callable[[], dict]] = {}
+
+
+def register_metrics(name: str, provider: Callable[[], dict]) -> None:
+    """Регистрирует источник метрик под именем ``name``."""
+    _providers[name] = provider
+
+
+def collect_runtime_metrics() -> Dict[str, dict]:
+    """Возвращает снимок всех зарегистрированных метрик."""
+    snapshot: Dict[str, dict] = {}
+    for name, provider in _providers.items():
+        try:
+            snapshot[name] = provider()
+        except Exception as e:
+            logger.error(f"Не удалось собрать метрики {name}: {e}")
+            snapshot[name] = {"error": str(e)}
+    return snapshot
@@ -0,0 +1,61 @@
+# utils/singleflight.py
+# Объединение одновременных запросов с одинаковым ключом (single-flight).
+#
+# Когда монета в тренде, десятки пользователей спрашивают её в одну секунду,
+# и каждый промах кэша уходил во внешний API до того, как первый ответ
+# попадал в Redis. Теперь первый вызов с ключом выполняет запрос, а
+# остальные, пришедшие до его завершения, ждут тот же результат. Ошибка тоже
+# достаётся всем ожидающим, но не запоминается: следующий вызов после
+# завершения снова идёт в API. Ключ — ключ кэша запроса, поэтому счётчики
+# в метриках группируются по его префиксу (cg, cmc, bin, cp...).
+
+import asyncio
+import logging
+from typing import Any, Awaitable, Callable, Dict
+
+from utils.runtime_metrics import register_metrics
+
+logger = logging.getLogger(__name__)
+
+
+class SingleFlight:
+    """Coalesces concurrent calls with the same key into one in-flight call."""
+
+    def __init__(self, name: str = "singleflight") -> None:
+        self._inflight: Dict[str, asyncio.Future] = {}
+        self._stats: Dict[str, Dict[str, int]] = {}
+        register_metrics(name, self.stats)
+
+    def _count(self, key: str, event: str) -> None:
+        prefix = key.split(":", 1)[0]
+        counts = self._stats.setdefault(prefix, {"calls": 0, "coalesced": 0, "errors": 0})
+        counts[event] += 1
+
+    async def do(self, key: str, fn: Callable[[], Awaitable[Any]]) -> Any:
+        """Результат ``fn()``; одновременные вызовы с ``key`` ждут один запрос."""
+        task = self._inflight.get(key)
+        if task is None:
+            self._count(key, "calls")
+            task = asyncio.ensure_future(fn())
+            self._inflight[key] = task
+            task.add_done_callback(lambda done, key=key: self._finish(key, done))
+        else:
+            self._count(key, "coalesced")
+        # Отмена одного ожидающего не должна отменять запрос для остальных
+        return await asyncio.shield(task)
+
+    def _finish(self, key: str, task: asyncio.Future) -> None:
+        if self._inflight.get(key) is task:
+            del self._inflight[key]
+        if not task.cancelled() and task.exception() is not None:
+            self._count(key, "errors")
+            logger.debug(f"Общий запрос {key} завершился ошибкой: {task.exception()}")
+
+    def in_flight(self) -> int:
+        return len(self._inflight)
+
+    def stats(self) -> dict:
+        return {"in_flight": len(self._inflight), "keys": {prefix: dict(counts) for prefix, counts in self._stats.items()}}
+
+
+singleflight = SingleFlight()